@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+
+
+def _cache_key(key):
+    # Raw tokens never end up in a shared cache backend
+    return 'auth-token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class TokenCache:
+    """
+    Authenticated tokens, with their users, cached for AUTH_TOKEN_CACHE_TTL
+    seconds. Lookups go to an in-process TTL/LRU first and then to the Django
+    cache named by AUTH_TOKEN_CACHE_ALIAS, if any.
+
+    Deleting a token or saving a user invalidates both layers in this process
+    and the shared layer; other processes may serve their local copy until it
+    expires, so keep the TTL short.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared(self):
+        alias = settings.AUTH_TOKEN_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    return token
+                del self._entries[key]
+
+        shared = self._shared()
+        token = shared.get(_cache_key(key)) if shared is not None else None
+        if token is not None:
+            self._remember(key, token)
+        return token
+
+    def set(self, key, token):
+        shared = self._shared()
+        if shared is not None:
+            shared.set(_cache_key(key), token, settings.AUTH_TOKEN_CACHE_TTL)
+        self._remember(key, token)
+
+    def _remember(self, key, token):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self._shared()
+        if shared is not None and keys:
+            shared.delete_many([_cache_key(key) for key in keys])
+
+    def invalidate_user(self, user_id, keys=()):
+        """
+        Drops every cached token of a user. `keys` lists tokens known from the
+        database, which also clears them from the shared layer.
+        """
+        with self._lock:
+            local = [key for key, (token, _) in self._entries.items() if token.user_id == user_id]
+        self.invalidate(*set(local) | set(keys))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that skips the Token/User query when the token was
+    seen recently. Tokens are revalidated against the database once their
+    cache entry expires.
+    """
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        # Copies, so one request cannot modify the user another request sees
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return (token.user, token)
@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+
+
+# --- Token cache invalidation ---
+# Logout and token rotation delete the Token row; user edits (deactivation,
+# password changes) must not be masked by a cached copy of the user either.
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_saved_user_tokens(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    token_cache.invalidate_user(instance.pk, keys)
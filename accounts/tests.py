@@ -5,10 +5,11 @@ from rest_framework.test import force_authenticate
 from rest_framework import status
 from django.urls import reverse
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from unittest.mock import patch, MagicMock
 from rest_framework.test import APIRequestFactory
 
+from accounts.authentication import token_cache
 from accounts.views import RegisterAPIView, LoginAPIView, LogoutAPIView, UserProfileAPIView
 
 # ------------ Integration testing ------------
@@ -200,3 +201,67 @@ class UserProfileAPIViewUnitTests(TestCase):
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['username'], 'mockeduser')
+
+
+# ------------ Token cache ------------
+class CachedTokenAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='cached', password='cachedpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.profile_url = reverse('profile')
+
+    def test_cache_hit_costs_no_queries(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.profile_url)
+        self.assertEqual(response.data['username'], 'cached')
+
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(self.profile_url)
+
+        self.assertEqual(self.client.post(reverse('logout')).status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_rotated_token_stops_working(self):
+        self.client.get(self.profile_url)
+
+        self.token.delete()
+        new_token = Token.objects.create(user=self.user)
+
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + new_token.key)
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_200_OK)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.profile_url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_expired_entry_is_revalidated(self):
+        self.client.get(self.profile_url)
+
+        with self.assertNumQueries(1):
+            self.client.get(self.profile_url)
+
+    @override_settings(
+        CACHES={'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tokens'}},
+        AUTH_TOKEN_CACHE_ALIAS='tokens',
+    )
+    def test_shared_cache_serves_other_processes(self):
+        self.client.get(self.profile_url)
+        # A fresh process has an empty local layer
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_200_OK)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.profile_url).status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Device, ChatMessage
+from .models import Device, ChatMessage, AnalysisCacheEntry, AnalysisJob, Component, ConversationSummary
 
 admin.site.register(Device)
 @admin.register(ChatMessage)
@@ -7,3 +7,26 @@ class ChatMessageAdmin(admin.ModelAdmin):
     list_display = ('id', 'device', 'role', 'created_at')  # Add 'id' here
     list_filter = ('role', 'created_at')  # Optional: add filters
     search_fields = ('content', 'device__name', 'device__user__username')  # Optional: search bar
+
+
+@admin.register(AnalysisCacheEntry)
+class AnalysisCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('content_hash', 'model_name', 'prompt_version', 'hit_count', 'last_used_at')
+    list_filter = ('model_name', 'prompt_version')
+
+
+@admin.register(AnalysisJob)
+class AnalysisJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'name', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+
+
+@admin.register(ConversationSummary)
+class ConversationSummaryAdmin(admin.ModelAdmin):
+    list_display = ('device', 'summarized_messages', 'updated_at')
+
+
+@admin.register(Component)
+class ComponentAdmin(admin.ModelAdmin):
+    list_display = ('name', 'key')
+    search_fields = ('name', 'key')
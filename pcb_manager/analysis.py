@@ -0,0 +1,239 @@
+import re
+import json
+import base64
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import llm
+from .models import PCBAnalysisResult
+from .serializers import AnalysisResultSerializer
+from .analysis_cache import analysis_cache, hash_image_bytes
+from .components import canonicalize_components
+from .llm_router import answered_by
+from .metrics import Counters
+
+
+ANALYSIS_PROMPT_TEMPLATE = """
+        Analyze the provided image of a Printed Circuit Board (PCB). Based on your analysis, provide a detailed and structured JSON output.
+
+        Identify the key characteristics of the board and follow these instructions:
+        - complexity: Classify the board's complexity as 'Low', 'Medium', or 'High' based on component density, number of layers, and trace routing.
+        - components: List the names of the most prominent and identifiable components on the board.
+        - operating_voltage: Estimate the primary operating voltage (e.g., "3.3V", "5V", "12V", "3.3V - 5V"). If unsure, state "Not determinable".
+        - description: Write a concise, one-paragraph technical description of the board's likely function and features.
+
+        {format_instructions}
+
+        The user has provided the image. Analyze it now.
+        """
+
+REPAIR_PROMPT_TEMPLATE = """
+Your previous reply could not be used: {error}
+Reply again with only a JSON object that matches this JSON schema, and no other text:
+{schema}
+
+Previous reply:
+{reply}
+"""
+
+CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+# Per-process counters for the analysis output pipeline
+analysis_metrics = Counters("llm_calls", "parse_failures", "repaired", "wasted_calls")
+
+# Part of the analysis cache key: editing the template invalidates cached analyses.
+ANALYSIS_PROMPT_VERSION = hashlib.sha256(ANALYSIS_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+
+class AIAnalysisException(APIException):
+    status_code = 500
+    default_detail = 'Error during AI analysis.'
+    default_code = 'ai_error'
+
+
+def build_analysis_message(image_bytes, content_type):
+    """
+    Builds the multimodal prompt message for one PCB image.
+    """
+    # LangChain is imported on first use to keep process startup fast
+    from langchain_core.messages import HumanMessage
+    from langchain_core.output_parsers import JsonOutputParser
+    from langchain_core.prompts import PromptTemplate
+
+    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
+
+    # Create prompt
+    parser = JsonOutputParser(pydantic_object=PCBAnalysisResult)
+    prompt = PromptTemplate(
+        template=ANALYSIS_PROMPT_TEMPLATE,
+        input_variables=[],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+
+    # The {"url": ...} form is understood by both the OpenAI and Gemini clients,
+    # so the message works with whichever backend the router picks
+    message_content = [
+        {"type": "text", "text": prompt.format()},
+        {"type": "image_url", "image_url": {"url": f"data:{content_type};base64,{image_base64}"}},
+    ]
+
+    return HumanMessage(content=message_content)
+
+
+def _output_text(output):
+    # Some providers return a list of content blocks instead of a string
+    content = output.content
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def extract_json(text):
+    """
+    Parses the JSON object in an LLM reply, tolerating code fences and text
+    around the object. Raises json.JSONDecodeError.
+    """
+    text = text.strip()
+    fenced = CODE_FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1).strip()
+    if not text.startswith("{"):
+        start, end = text.find("{"), text.rfind("}")
+        if start != -1 and end > start:
+            text = text[start:end + 1]
+    return json.loads(text)
+
+
+def parse_analysis_output(output):
+    """
+    Turns the LLM reply into a validated analysis dict.
+    """
+    content = _output_text(output)
+    if not content:
+        raise AIAnalysisException(detail="LLM returned empty response")
+
+    try:
+        analysis = extract_json(content)
+    except json.JSONDecodeError:
+        raise AIAnalysisException(detail="LLM output is not valid JSON.")
+
+    # Only analyses that match the expected schema are worth caching
+    serializer = AnalysisResultSerializer(data=analysis)
+    serializer.is_valid(raise_exception=True)
+    analysis = dict(serializer.validated_data)
+    analysis["components"] = canonicalize_components(analysis["components"])
+    return analysis
+
+
+def build_repair_message(output, error):
+    """
+    Text-only follow-up asking the model to fix an unusable reply. Much cheaper
+    than re-sending the image.
+    """
+    from langchain_core.messages import HumanMessage
+
+    detail = error.detail if isinstance(error, APIException) else str(error)
+    return HumanMessage(content=REPAIR_PROMPT_TEMPLATE.format(
+        error=json.dumps(detail),
+        schema=json.dumps(PCBAnalysisResult.model_json_schema()),
+        reply=_output_text(output)[:4000],
+    ))
+
+
+def _parse_attempt(output):
+    analysis_metrics.inc("llm_calls")
+    try:
+        return parse_analysis_output(output), None
+    except (AIAnalysisException, ValidationError) as e:
+        analysis_metrics.inc("parse_failures")
+        return None, e
+
+
+def _finish(analysis, error, calls):
+    if analysis is None:
+        # Nothing came out of any of the calls for this image
+        analysis_metrics.inc("wasted_calls", calls)
+        raise error
+    if calls > 1:
+        analysis_metrics.inc("repaired")
+    return analysis
+
+
+def analysis_metrics_stats():
+    counts = analysis_metrics.snapshot()
+    calls = counts["llm_calls"]
+    return {
+        **counts,
+        "parse_failure_rate": round(counts["parse_failures"] / calls, 4) if calls else None,
+    }
+
+
+def cached_analysis(content_hash):
+    # Any configured backend may have answered for this content; prefer them in the router's order
+    model_names = [config["model"] for config in llm.backend_configs()]
+    return analysis_cache.get_any(content_hash, model_names, ANALYSIS_PROMPT_VERSION)
+
+
+def cache_analysis(content_hash, output, analysis):
+    # Filed under the model that produced the final reply, which failover may have changed
+    analysis_cache.set((content_hash, answered_by(output, llm.model_name), ANALYSIS_PROMPT_VERSION), analysis)
+
+
+def analyze_image(image_bytes, content_type, content_hash=None):
+    """
+    Runs the PCB analysis prompt against an image and returns (analysis, cache_hit).
+
+    Uploads with the same `content_hash` (sha256 of the uploaded file, by
+    default of `image_bytes`) reuse the cached analysis instead of calling
+    the LLM again. The model is asked for schema-constrained JSON; an
+    unusable reply gets up to ANALYSIS_REPAIR_ATTEMPTS text-only re-asks.
+    Raises AIAnalysisException if the LLM fails and a ValidationError if its
+    output still does not match AnalysisResultSerializer.
+    """
+    content_hash = content_hash or hash_image_bytes(image_bytes)
+    analysis = cached_analysis(content_hash)
+    if analysis is not None:
+        return analysis, True
+
+    output = llm.primary_llm.invoke(
+        [build_analysis_message(image_bytes, content_type)], structured_output=PCBAnalysisResult
+    )
+    analysis, error = _parse_attempt(output)
+    calls = 1
+    while analysis is None and calls <= settings.ANALYSIS_REPAIR_ATTEMPTS:
+        output = llm.primary_llm.invoke([build_repair_message(output, error)], structured_output=PCBAnalysisResult)
+        analysis, error = _parse_attempt(output)
+        calls += 1
+    analysis = _finish(analysis, error, calls)
+
+    cache_analysis(content_hash, output, analysis)
+    return analysis, False
+
+
+async def aanalyze_image(image_bytes, content_type, content_hash=None):
+    """
+    Async variant of analyze_image for the ASGI views.
+    """
+    content_hash = content_hash or hash_image_bytes(image_bytes)
+    analysis = await sync_to_async(cached_analysis)(content_hash)
+    if analysis is not None:
+        return analysis, True
+
+    output = await llm.primary_llm.ainvoke(
+        [build_analysis_message(image_bytes, content_type)], structured_output=PCBAnalysisResult
+    )
+    analysis, error = _parse_attempt(output)
+    calls = 1
+    while analysis is None and calls <= settings.ANALYSIS_REPAIR_ATTEMPTS:
+        output = await llm.primary_llm.ainvoke(
+            [build_repair_message(output, error)], structured_output=PCBAnalysisResult
+        )
+        analysis, error = _parse_attempt(output)
+        calls += 1
+    analysis = _finish(analysis, error, calls)
+
+    await sync_to_async(cache_analysis)(content_hash, output, analysis)
+    return analysis, False
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AnalysisCacheEntry
+
+
+def hash_image_bytes(image_bytes):
+    """
+    Returns the hex sha256 of the exact uploaded bytes.
+    """
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of PCB analysis results.
+
+    Entries are keyed on (content hash of the upload, name of the model that
+    produced the analysis, prompt version), so a change of model or prompt
+    template never serves a stale analysis. Lookups go to an
+    in-process LRU first and fall back to the AnalysisCacheEntry table.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        content_hash, model_name, prompt_version = key
+        return self.get_any(content_hash, [model_name], prompt_version)
+
+    def get_any(self, content_hash, model_names, prompt_version):
+        """
+        The result cached for the content by the first of `model_names` that
+        has one, or None.
+        """
+        with self._lock:
+            for model_name in model_names:
+                key = (content_hash, model_name, prompt_version)
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    self.hits += 1
+                    return self._lru[key]
+
+        entries = {
+            entry.model_name: entry
+            for entry in AnalysisCacheEntry.objects.filter(
+                content_hash=content_hash, model_name__in=model_names, prompt_version=prompt_version
+            )
+        }
+        entry = next((entries[model_name] for model_name in model_names if model_name in entries), None)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        AnalysisCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1, last_used_at=timezone.now()
+        )
+        self._remember((content_hash, entry.model_name, prompt_version), entry.result)
+        with self._lock:
+            self.hits += 1
+            self.db_hits += 1
+        return entry.result
+
+    def set(self, key, result):
+        content_hash, model_name, prompt_version = key
+        AnalysisCacheEntry.objects.update_or_create(
+            content_hash=content_hash, model_name=model_name, prompt_version=prompt_version,
+            defaults={'result': result},
+        )
+        self._remember(key, result)
+
+    def invalidate(self, model_names=None, prompt_version=None):
+        """
+        Drops entries that were not produced by one of `model_names` or that
+        have another prompt version. With no arguments every entry is
+        dropped. Returns the number of rows deleted.
+        """
+        stale = Q()
+        if model_names is not None:
+            stale |= ~Q(model_name__in=model_names)
+        if prompt_version is not None:
+            stale |= ~Q(prompt_version=prompt_version)
+        queryset = AnalysisCacheEntry.objects.all()
+        if stale:
+            queryset = queryset.filter(stale)
+        deleted, _ = queryset.delete()
+
+        with self._lock:
+            if model_names is None and prompt_version is None:
+                self._lru.clear()
+            else:
+                for key in list(self._lru):
+                    if (model_names is not None and key[1] not in model_names) or \
+                            (prompt_version is not None and key[2] != prompt_version):
+                        del self._lru[key]
+        return deleted
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "lru_size": len(self._lru),
+                "lru_max_entries": self.max_entries,
+            }
+
+    def _remember(self, key, result):
+        with self._lock:
+            self._lru[key] = result
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+
+analysis_cache = AnalysisCache(max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES)
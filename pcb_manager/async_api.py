@@ -0,0 +1,78 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
+from rest_framework import exceptions, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+# DRF function views are always sync, so under ASGI each one occupies a thread
+# for the whole LLM round trip. `async_api_view` gives plain `async def` Django
+# views the parts of DRF we rely on: token authentication, permission classes,
+# parsed `request.data` and DRF-shaped error responses.
+
+def _check_permissions(request, permission_classes):
+    # Runs in a thread: resolving request.user hits the database
+    for permission in permission_classes:
+        if not permission().has_permission(request, None):
+            if request.authenticators and not request.successful_authenticator:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied()
+
+
+def api_exception_response(exc, request):
+    """
+    Mirrors rest_framework.views.exception_handler for async views.
+    """
+    if isinstance(exc, Http404):
+        exc = exceptions.NotFound(*(exc.args))
+    elif isinstance(exc, PermissionDenied):
+        exc = exceptions.PermissionDenied(*(exc.args))
+
+    headers = {}
+    status_code = exc.status_code
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        authenticator = request.authenticators[0] if request.authenticators else None
+        auth_header = authenticator.authenticate_header(request) if authenticator else None
+        if auth_header:
+            headers['WWW-Authenticate'] = auth_header
+        else:
+            status_code = status.HTTP_403_FORBIDDEN
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = '%d' % exc.wait
+
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return JsonResponse(data, status=status_code, headers=headers, safe=False)
+
+
+def async_api_view(http_method_names, permission_classes=(IsAuthenticated,)):
+    """
+    Decorator for async views that should behave like @api_view ones.
+    The wrapped view receives a DRF Request and returns any HttpResponse.
+    """
+    allowed = [method.upper() for method in http_method_names]
+
+    def decorator(func):
+        @wraps(func)
+        async def view(request, *args, **kwargs):
+            drf_request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+            )
+            try:
+                if request.method not in allowed:
+                    raise exceptions.MethodNotAllowed(request.method)
+                await sync_to_async(_check_permissions)(drf_request, permission_classes)
+                return await func(drf_request, *args, **kwargs)
+            except (exceptions.APIException, Http404, PermissionDenied) as exc:
+                return api_exception_response(exc, drf_request)
+
+        # Token-authenticated like the DRF views, which are CSRF exempt too
+        view.csrf_exempt = True
+        return view
+
+    return decorator
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import os
+import threading
+import traceback
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from rest_framework.exceptions import APIException, ParseError, ValidationError
+
+from .analysis import aanalyze_image
+from .components import link_components
+from .embeddings import save_embeddings
+from .images import prepare_image
+from .models import Device, UserStats
+from .near_duplicates import describe_near_duplicate, reuse_near_duplicate, to_db_hash
+from .response_cache import DEVICES, bump_user_cache_version
+from .retrieval import index_descriptions
+from .serializers import DeviceResponseSerializer
+from .stats import rebuild_user_stats
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif', '.tif', '.tiff', '.heic'}
+
+
+class BatchItem:
+    """
+    One image of a batch upload, read lazily so that only the images being
+    analyzed are held in memory.
+    """
+
+    def __init__(self, index, filename, read):
+        self.index = index
+        self.filename = filename
+        self.read = read
+
+
+def _archive_items(archive, first_index):
+    try:
+        zip_file = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ParseError("The archive is not a valid zip file.")
+
+    lock = threading.Lock()  # members are read from worker threads
+    items = []
+    for info in zip_file.infolist():
+        filename = os.path.basename(info.filename)
+        if info.is_dir() or filename.startswith('.') or os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        if info.file_size > settings.ANALYSIS_BATCH_MAX_IMAGE_BYTES:
+            raise ParseError(f"{info.filename} is larger than {settings.ANALYSIS_BATCH_MAX_IMAGE_BYTES} bytes.")
+
+        def read(info=info):
+            with lock:
+                return zip_file.read(info)
+
+        items.append(BatchItem(first_index + len(items), filename, read))
+    return items
+
+
+def collect_batch_items(files):
+    """
+    Turns the `images` uploads and any `archive` zip into BatchItems.
+    Raises ParseError for an empty or oversized batch.
+    """
+    items = [
+        BatchItem(index, upload.name, upload.read)
+        for index, upload in enumerate(files.getlist('images'))
+    ]
+    for archive in files.getlist('archive'):
+        items += _archive_items(archive, len(items))
+
+    if not items:
+        raise ParseError("Upload images as 'images' or a zip file as 'archive'.")
+    if len(items) > settings.ANALYSIS_BATCH_MAX_ITEMS:
+        raise ParseError(f"A batch may contain at most {settings.ANALYSIS_BATCH_MAX_ITEMS} images.")
+    return items
+
+
+def _prepare(item):
+    return prepare_image(item.read(), item.filename)
+
+
+def _device_name(filename):
+    name = os.path.splitext(filename)[0] or "AI-Analyzed Device"
+    return name[:Device._meta.get_field('name').max_length]
+
+
+async def _analyze_item(item, user, semaphore, reanalyze):
+    async with semaphore:
+        try:
+            prepared = await sync_to_async(_prepare, thread_sensitive=False)(item)
+            near_duplicate, analysis = await sync_to_async(reuse_near_duplicate)(
+                user, prepared.perceptual_hash, reanalyze
+            )
+            reused = analysis is not None
+            cache_hit = False
+            if not reused:
+                analysis, cache_hit = await aanalyze_image(
+                    prepared.llm_bytes, prepared.llm_content_type, prepared.content_hash
+                )
+        except (APIException, ValidationError) as e:
+            return item, None, None, None, e.detail
+        except Exception as e:
+            logger.error(f"Batch item {item.filename} failed: {str(e)}")
+            logger.debug(traceback.format_exc())
+            return item, None, None, None, f"Unexpected error: {str(e)}"
+
+    device = Device(
+        user=user,
+        name=_device_name(item.filename),
+        image=prepared.image,
+        thumbnail=prepared.thumbnail,
+        perceptual_hash=to_db_hash(prepared.perceptual_hash),
+        components=analysis.get("components", []),
+        operating_voltage=analysis.get("operating_voltage"),
+        complexity=analysis.get("complexity"),
+        description=analysis.get("description"),
+    )
+    if near_duplicate is not None:
+        near_duplicate = describe_near_duplicate(near_duplicate, reused)
+    return item, device, cache_hit, near_duplicate, None
+
+
+def _save_batch(user, devices):
+    # bulk_create skips the model signals, so do their bookkeeping here
+    with transaction.atomic():
+        Device.objects.bulk_create(devices)
+        link_components(devices)
+        save_embeddings(devices)
+        if settings.CHAT_RETRIEVAL_ENABLED:
+            index_descriptions(devices)
+        if settings.USER_STATS_DENORMALIZED and UserStats.objects.filter(user=user).exists():
+            rebuild_user_stats(user.pk)
+        bump_user_cache_version(user.pk, DEVICES)
+    return DeviceResponseSerializer(devices, many=True).data
+
+
+async def analyze_batch(user, items, reanalyze=False):
+    """
+    Analyzes every item with at most ANALYSIS_BATCH_CONCURRENCY images in
+    flight, saves the successful ones in one bulk_create and returns the
+    per-item results in upload order. Near-duplicates of the user's existing
+    devices reuse their analysis unless `reanalyze` is set.
+    """
+    semaphore = asyncio.Semaphore(settings.ANALYSIS_BATCH_CONCURRENCY)
+    outcomes = await asyncio.gather(*(_analyze_item(item, user, semaphore, reanalyze) for item in items))
+
+    devices = [device for _, device, _, _, _ in outcomes if device is not None]
+    saved = iter(await sync_to_async(_save_batch)(user, devices) if devices else [])
+
+    results = []
+    for item, device, cache_hit, near_duplicate, error in outcomes:
+        result = {"index": item.index, "filename": item.filename}
+        if device is None:
+            result.update(status="failed", error=error)
+        else:
+            result.update(status="created", cache_hit=cache_hit, device=next(saved))
+            if near_duplicate is not None:
+                result["near_duplicate"] = near_duplicate
+        results.append(result)
+    return results
@@ -0,0 +1,3 @@
+# Benchmarks are regular Django test modules that are not picked up by the
+# default discovery pattern. Run one explicitly, e.g.
+#   python manage.py test pcb_manager.benchmarks.bench_async_views
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.test import TransactionTestCase, override_settings
+from django.urls import include, path
+from rest_framework.authtoken.models import Token
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from unittest.mock import patch
+
+from pcb_manager import llm
+from pcb_manager.benchmarks.utils import SlowFakeLLM, ThreadSampler, asgi_request, print_table
+
+from langchain_core.messages import HumanMessage
+
+LLM_DELAY = 0.5
+CONCURRENCY = (1, 25, 100)
+
+
+@api_view(['GET'])
+def legacy_test_llm_connection(request):
+    # The pre-async implementation: a sync DRF view around the blocking invoke()
+    response = llm.primary_llm.invoke([HumanMessage(content="ping")])
+    return Response({"response_content": response.content})
+
+
+urlpatterns = [
+    path('legacy/test-llm/', legacy_test_llm_connection),
+    path('api/', include('pcb_manager.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewConcurrencyBenchmark(TransactionTestCase):
+    """
+    Fires N simultaneous requests through the ASGI handler against an LLM stub
+    that takes LLM_DELAY seconds, once for the old sync view and once for the
+    async one, and reports wall time and the peak number of OS threads.
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(username='bench', password='benchpass123')
+        self.token = Token.objects.create(user=user).key
+        self.app = get_asgi_application()
+
+    async def _burst(self, path, concurrency):
+        async with ThreadSampler() as sampler:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                asgi_request(self.app, "GET", path, token=self.token) for _ in range(concurrency)
+            ))
+            elapsed = time.perf_counter() - start
+        assert all(status == 200 for status, _, _ in results), [r[0] for r in results]
+        return elapsed, sampler.peak
+
+    def test_concurrency(self):
+        rows = []
+        with patch.object(llm, 'primary_llm', SlowFakeLLM(delay=LLM_DELAY)):
+            for concurrency in CONCURRENCY:
+                for label, url in (("sync", "/legacy/test-llm/"), ("async", "/api/test-llm/")):
+                    elapsed, peak_threads = asyncio.run(self._burst(url, concurrency))
+                    rows.append((
+                        label, concurrency, f"{elapsed:.2f}s",
+                        f"{concurrency / elapsed:.1f}", peak_threads,
+                    ))
+        print_table(
+            f"test-llm under ASGI, stub LLM latency {LLM_DELAY}s",
+            ("view", "concurrent", "wall time", "req/s", "peak threads"),
+            rows,
+        )
@@ -0,0 +1,79 @@
+import io
+import json
+import shutil
+import tempfile
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from pcb_manager.analysis_cache import analysis_cache
+from pcb_manager.benchmarks.utils import SlowFakeLLM, print_table
+
+BOARDS = 24
+LLM_DELAY = 0.5
+MEDIA_ROOT = tempfile.mkdtemp()
+ANALYSIS = json.dumps({
+    "complexity": "Medium",
+    "components": ["ESP32", "AMS1117"],
+    "operating_voltage": "3.3V",
+    "description": "A small microcontroller board.",
+})
+
+
+def make_boards():
+    uploads = []
+    for index in range(BOARDS):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 900), (index * 10, 128, 0)).save(buffer, format='JPEG')
+        uploads.append(SimpleUploadedFile(f'board_{index}.jpg', buffer.getvalue(), content_type='image/jpeg'))
+    return uploads
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BatchAnalysisBenchmark(TestCase):
+    """
+    Boards per minute for BOARDS uploads against an LLM stub with a fixed
+    LLM_DELAY: one request per board versus one batch request.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create_user(username='bench', password='benchpass123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+    def run_serial(self):
+        for upload in make_boards():
+            response = self.client.post(reverse('device-analyze-save'), {'image': upload}, format='multipart')
+            assert response.status_code == 201
+
+    def run_batch(self):
+        response = self.client.post(reverse('device-analyze-batch'), {'images': make_boards()}, format='multipart')
+        assert response.status_code == 201, response.content
+
+    @patch('pcb_manager.llm.primary_llm', SlowFakeLLM(delay=LLM_DELAY, content=ANALYSIS))
+    def test_batch_analysis(self):
+        rows = []
+        for label, run, concurrency in (
+            ("serial requests", self.run_serial, 1),
+            ("batch, concurrency 4", self.run_batch, 4),
+            ("batch, concurrency 8", self.run_batch, 8),
+        ):
+            analysis_cache.invalidate()
+            with override_settings(ANALYSIS_BATCH_CONCURRENCY=concurrency):
+                start = time.perf_counter()
+                run()
+                elapsed = time.perf_counter() - start
+            rows.append((label, f"{elapsed:.1f} s", f"{BOARDS / elapsed * 60:.0f}"))
+        print_table(f"{BOARDS} boards, LLM stub latency {LLM_DELAY}s", ("mode", "wall time", "boards/min"), rows)
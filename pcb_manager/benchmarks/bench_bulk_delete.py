@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.models import ChatMessage, Device
+from pcb_manager.purge import purge_deleted_devices
+
+MEDIA_ROOT = tempfile.mkdtemp()
+DEVICE_COUNT = 10_000
+MESSAGES_PER_DEVICE = 3
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT, MEDIA_VARIANT_ROOT=os.path.join(MEDIA_ROOT, 'variants'),
+    DEVICE_PURGE_INPROCESS=False, USER_STATS_DENORMALIZED=True,
+)
+class BulkDeleteBenchmark(TestCase):
+    """
+    Removing all DEVICE_COUNT devices of a user, each with an image, a
+    thumbnail and MESSAGES_PER_DEVICE chat messages: the old one-at-a-time
+    Device.delete() (what each DELETE request did, without the HTTP round
+    trip) against one bulk delete request plus the background purge.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bench', password='benchpass123')
+        os.makedirs(os.path.join(MEDIA_ROOT, 'images', 'thumbs'), exist_ok=True)
+        devices = []
+        for index in range(DEVICE_COUNT):
+            image, thumbnail = f'images/board_{index}.jpg', f'images/thumbs/board_{index}.webp'
+            for name in (image, thumbnail):
+                with open(os.path.join(MEDIA_ROOT, name), 'wb') as f:
+                    f.write(b'\0' * 2048)
+            devices.append(Device(
+                user=self.user, name=f'board {index}', image=image, thumbnail=thumbnail, complexity='Low',
+                components=['LM7805'], operating_voltage='5V', description='A regulator board.',
+            ))
+        devices = Device.objects.bulk_create(devices, batch_size=2000)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(device=device, role='user', content='hello') for device in devices
+            for _ in range(MESSAGES_PER_DEVICE)
+        ], batch_size=5000)
+
+    def files_left(self):
+        return sum(len(files) for _, _, files in os.walk(os.path.join(MEDIA_ROOT, 'images')))
+
+    def test_one_at_a_time(self):
+        start = time.perf_counter()
+        for device in Device.objects.all():
+            device.delete()
+        elapsed = time.perf_counter() - start
+        print_table(f"Deleting {DEVICE_COUNT} devices one at a time", ("step", "time", "devices left", "files left"), [
+            ("Device.delete() x N", f"{elapsed:.2f} s", Device.all_objects.count(), self.files_left()),
+        ])
+
+    def test_bulk_delete_and_purge(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.user).key)
+        client.get(reverse('user-stats'))
+
+        start = time.perf_counter()
+        response = client.post(reverse('device-bulk-delete'), {'all': True}, format='json')
+        request_time = time.perf_counter() - start
+        self.assertEqual(response.data['deleted'], DEVICE_COUNT)
+        visible = Device.objects.count()
+
+        start = time.perf_counter()
+        purge_deleted_devices()
+        purge_time = time.perf_counter() - start
+        print_table(f"Deleting {DEVICE_COUNT} devices in bulk", ("step", "time", "devices left", "files left"), [
+            ("bulk delete request", f"{request_time * 1000:.1f} ms", visible, "-"),
+            ("background purge", f"{purge_time:.2f} s", Device.all_objects.count(), self.files_left()),
+        ])
@@ -0,0 +1,114 @@
+import random
+import statistics
+import time
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from pcb_manager import llm
+from pcb_manager.benchmarks.utils import SlowFakeLLM, print_table
+from pcb_manager.models import ChatMessage, Device
+from pcb_manager.retrieval import chunk_index, rebuild_chunks
+
+HISTORY_SIZES = (20, 200, 1000)
+OTHER_DEVICES = 50
+TURNS = 20
+
+WORDS = ['regulator', 'heatsink', 'ESP32', 'relay', 'transistor', 'capacitor', 'ripple', 'ground', 'trace',
+         'USB', 'serial', 'firmware', 'flash', 'brownout', 'reset', 'crystal', 'antenna', 'sensor', 'I2C',
+         'pull-up', 'voltage', 'current', 'LED', 'diode', 'fuse', 'connector', 'the', 'is', 'on', 'and', 'a']
+REPLY = ("Check the 5V rail with a multimeter first, then measure the ripple on the regulator output. "
+         "If the ESP32 browns out during WiFi transmit, add a 470uF capacitor close to the module. ") * 2
+
+
+class CountingFakeLLM(SlowFakeLLM):
+
+    calls = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        return await super().ainvoke(messages, **kwargs)
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize() + '.'
+
+
+class ChatRetrievalBenchmark(TestCase):
+    """
+    Prompt size and server-side time per chat turn for a device with a long
+    history: today's prompt (full description, rolling summary and the recent
+    window) against retrieval (basic facts, rolling summary, last few messages
+    and the top-k snippets), optionally with snippets from the user's other
+    devices.
+
+    The LLM answers instantly, so latency is the work around the call
+    (queries, summary folding, retrieval); the real model's time grows with
+    the prompt tokens reported alongside.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='benchpass123')
+        cls.token = Token.objects.create(user=cls.user)
+        rng = random.Random(11)
+
+        def make_device(name):
+            return Device(
+                user=cls.user, name=name, image='images/board.jpg', complexity='High',
+                components=['ESP32-WROOM-32', 'LM7805', 'CH340G', 'Relay'], operating_voltage='12V',
+                description=' '.join(sentence(rng, 14) for _ in range(12)),
+            )
+
+        others = Device.objects.bulk_create([make_device(f'other {index}') for index in range(OTHER_DEVICES)])
+        # One device per (history size, mode), each with the same kind of history
+        cls.devices = {}
+        for size in HISTORY_SIZES:
+            for mode in ('full', 'retrieval', 'retrieval + other devices'):
+                cls.devices[size, mode] = Device.objects.create(**{
+                    field: getattr(make_device(f'{mode} {size}'), field)
+                    for field in ('user', 'name', 'image', 'complexity', 'components', 'operating_voltage', 'description')
+                })
+                ChatMessage.objects.bulk_create([
+                    ChatMessage(device=cls.devices[size, mode], role='user' if index % 2 == 0 else 'ai',
+                                content=' '.join(sentence(rng, 12) for _ in range(1 if index % 2 == 0 else 4)))
+                    for index in range(size)
+                ])
+        rebuild_chunks(others + list(cls.devices.values()))
+
+    def run_turns(self, device, **data):
+        self.fake.calls = 0
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        url = reverse('device-chat', args=[device.id])
+        rng = random.Random(device.id)
+        timings, tokens = [], []
+        for _ in range(TURNS):
+            start = time.perf_counter()
+            response = client.post(url, {'message': sentence(rng, 10), **data}, format='json')
+            timings.append(time.perf_counter() - start)
+            self.assertEqual(response.status_code, 200)
+            tokens.append(response.json()['prompt_tokens'])
+        timings.sort()
+        return (f"{self.fake.calls / TURNS:.2f}", round(statistics.mean(tokens)), max(tokens),
+                f"{statistics.median(timings) * 1000:.1f} ms", f"{timings[-1] * 1000:.1f} ms")
+
+    def test_prompt_size_and_latency(self):
+        rows = []
+        self.fake = CountingFakeLLM(delay=0, content=REPLY)
+        with patch.object(llm, 'primary_llm', self.fake):
+            for size in HISTORY_SIZES:
+                with override_settings(CHAT_RETRIEVAL_ENABLED=False):
+                    rows.append((size, 'full context', *self.run_turns(self.devices[size, 'full'])))
+                chunk_index.clear()
+                rows.append((size, 'retrieval', *self.run_turns(self.devices[size, 'retrieval'])))
+                rows.append((size, 'retrieval + other devices', *self.run_turns(
+                    self.devices[size, 'retrieval + other devices'], other_devices=True)))
+        print_table(
+            f"Chat prompt per turn ({TURNS} turns, {OTHER_DEVICES} other devices, instant LLM)",
+            ("history", "mode", "LLM calls/turn", "mean tokens", "max tokens", "p50", "max"), rows,
+        )
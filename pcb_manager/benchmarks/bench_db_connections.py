@@ -0,0 +1,63 @@
+import statistics
+import time
+import unittest
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.utils import ConnectionHandler
+from django.test import TransactionTestCase
+
+from pcb_manager.benchmarks.utils import print_table
+
+REQUESTS = 500
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "connection pooling is PostgreSQL-specific")
+class ConnectionSetupBenchmark(TransactionTestCase):
+    """
+    Database cost per request for the request lifecycle Django runs around
+    each view: get a connection, run one small query, then release it the way
+    the request_finished handler does. Compares a new connection per request
+    (the old settings), persistent connections, and the psycopg pool as
+    configured in settings.DATABASES.
+    """
+
+    def wrapper(self, alias, **overrides):
+        # The shipped settings, pointed at the test database
+        settings_dict = {**settings.DATABASES[DEFAULT_DB_ALIAS], 'NAME': connection.settings_dict['NAME'], **overrides}
+        return ConnectionHandler({alias: settings_dict})[alias]
+
+    def measure(self, db):
+        timings = []
+        try:
+            for _ in range(REQUESTS):
+                start = time.perf_counter()
+                db.close_if_unusable_or_obsolete()  # request_started
+                with db.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+                db.close_if_unusable_or_obsolete()  # request_finished
+                timings.append(time.perf_counter() - start)
+        finally:
+            db.close()
+            if hasattr(db, 'close_pool'):
+                db.close_pool()
+        timings.sort()
+        return (f"{statistics.median(timings) * 1000:.2f} ms",
+                f"{timings[int(len(timings) * 0.99)] * 1000:.2f} ms")
+
+    def test_connection_setup(self):
+        shipped = settings.DATABASES[DEFAULT_DB_ALIAS]
+        base_options = {key: value for key, value in shipped['OPTIONS'].items() if key != 'pool'}
+        rows = [
+            ("new connection per request", *self.measure(
+                self.wrapper('fresh', CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False, OPTIONS=base_options))),
+            ("persistent, health checked", *self.measure(
+                self.wrapper('persistent', CONN_MAX_AGE=60, CONN_HEALTH_CHECKS=True, OPTIONS=base_options))),
+        ]
+        if is_psycopg3 and shipped['OPTIONS'].get('pool'):
+            # Exactly what production runs, health checks included
+            rows.append(("psycopg pool (settings)", *self.measure(self.wrapper('pooled'))))
+        print_table(f"Connection handling per request ({REQUESTS} requests)",
+                    ("mode", "p50", "p99"), rows)
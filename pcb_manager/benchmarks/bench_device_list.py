@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.models import Device
+
+DEVICE_COUNT = 10_000
+RUNS = 5
+
+
+class DeviceListBenchmark(TestCase):
+    """
+    Response size and latency of /api/devices/ for a user with DEVICE_COUNT
+    devices: the full list, one cursor page, and one projected cursor page.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='benchpass123')
+        cls.token = Token.objects.create(user=cls.user)
+        Device.objects.bulk_create([
+            Device(
+                user=cls.user, name=f'board {index}', image=f'images/board_{index}.jpg', complexity='Medium',
+                components=['ESP32-WROOM-32', 'AMS1117-3.3', 'CH340G', 'USB-C receptacle', 'Tactile switch'],
+                operating_voltage='3.3V - 5V',
+                description='A development board built around a dual-core microcontroller. ' * 8,
+            )
+            for index in range(DEVICE_COUNT)
+        ], batch_size=1000)
+
+    def measure(self, query):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            response = client.get(reverse('device-list'), query)
+            timings.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        return len(response.content), statistics.median(timings)
+
+    def test_device_list(self):
+        rows = []
+        for label, query in (
+            ("full list", {}),
+            ("cursor page (50)", {'page_size': 50}),
+            ("cursor page, id/name/image", {'page_size': 50, 'fields': 'id,name,image'}),
+            ("full list, id/name/image", {'fields': 'id,name,image'}),
+        ):
+            size, latency = self.measure(query)
+            rows.append((label, f"{size / 1024:.1f} KiB", f"{latency * 1000:.1f} ms"))
+        print_table(f"/api/devices/ with {DEVICE_COUNT} devices (median of {RUNS})",
+                    ("request", "body", "latency"), rows)
@@ -0,0 +1,52 @@
+import base64
+import io
+import statistics
+import time
+
+from django.test import SimpleTestCase
+from PIL import Image, ImageFilter
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.images import prepare_image
+
+PHOTO_SIZE = (4000, 3000)
+RUNS = 3
+
+
+def make_photo():
+    """
+    A ~12 MP phone-style JPEG. Blurred noise compresses roughly like a real
+    board photo, unlike a flat colour.
+    """
+    channels = [Image.effect_noise(PHOTO_SIZE, 60).filter(ImageFilter.GaussianBlur(1)) for _ in range(3)]
+    buffer = io.BytesIO()
+    Image.merge('RGB', channels).save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+class ImagePipelineBenchmark(SimpleTestCase):
+    """
+    Bytes stored and sent to the LLM for one phone photo, before and after
+    prepare_image, plus the CPU time preprocessing costs.
+    """
+
+    def test_image_pipeline(self):
+        photo = make_photo()
+
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            prepared = prepare_image(photo, 'board.jpg')
+            timings.append(time.perf_counter() - start)
+
+        rows = [
+            ("stored image", photo, prepared.image.read()),
+            ("LLM payload (base64)", base64.b64encode(photo), base64.b64encode(prepared.llm_bytes)),
+            ("thumbnail vs full image in a device card", photo, prepared.thumbnail.read()),
+        ]
+        print_table(
+            f"{PHOTO_SIZE[0]}x{PHOTO_SIZE[1]} JPEG upload",
+            ("", "before", "after"),
+            [(label, f"{len(before) / 1024:.0f} KiB", f"{len(after) / 1024:.0f} KiB") for label, before, after in rows],
+        )
+        print(f"prepare_image: {statistics.median(timings) * 1000:.0f} ms (median of {RUNS})")
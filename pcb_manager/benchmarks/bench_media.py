@@ -0,0 +1,53 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from pcb_manager.benchmarks.bench_image_pipeline import make_photo
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.images import prepare_image
+
+MEDIA_ROOT = tempfile.mkdtemp()
+RUNS = 20
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_VARIANT_ROOT=os.path.join(MEDIA_ROOT, 'variants'))
+class MediaServingBenchmark(TestCase):
+    """
+    What a gallery reload costs per image: a full download, a 304
+    revalidation, and a ?w=256 variant.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def measure(self, headers=None, query=None):
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            response = self.client.get(reverse('serve_image', args=['board.webp']), query, headers=headers or {})
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            timings.append(time.perf_counter() - start)
+        return response, len(body), statistics.median(timings)
+
+    def test_media_serving(self):
+        os.makedirs(os.path.join(MEDIA_ROOT, 'images'), exist_ok=True)
+        with open(os.path.join(MEDIA_ROOT, 'images', 'board.webp'), 'wb') as f:
+            f.write(prepare_image(make_photo(), 'board.jpg').image.read())
+
+        rows = []
+        full, size, latency = self.measure()
+        rows.append(("first load", full.status_code, f"{size / 1024:.0f} KiB", f"{latency * 1000:.2f} ms"))
+        for label, headers, query in (
+            ("reload (If-None-Match)", {'If-None-Match': full['ETag']}, None),
+            ("gallery card (?w=256)", None, {'w': 256}),
+        ):
+            response, size, latency = self.measure(headers, query)
+            rows.append((label, response.status_code, f"{size / 1024:.1f} KiB", f"{latency * 1000:.2f} ms"))
+        print_table(f"/media/images/board.webp (median of {RUNS})", ("request", "status", "body", "latency"), rows)
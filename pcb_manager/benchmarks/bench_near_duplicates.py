@@ -0,0 +1,81 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.models import Device
+from pcb_manager.near_duplicates import NearDuplicateIndex, to_db_hash
+
+DEVICE_COUNT = 100_000
+LOOKUPS = 1_000
+
+
+class NearDuplicateBenchmark(TestCase):
+    """
+    Near-duplicate lookup latency for a user with DEVICE_COUNT hashed devices:
+    the in-memory index search alone, the index lookup including its top-up
+    query, and a linear Hamming scan over the same hashes for comparison.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='benchpass123')
+        rng = random.Random(42)
+        cls.hashes = [rng.getrandbits(64) for _ in range(DEVICE_COUNT)]
+        Device.objects.bulk_create([
+            Device(
+                user=cls.user, name=f'board {index}', image=f'images/board_{index}.jpg', complexity='Low',
+                components=[], operating_voltage='5V', description='', perceptual_hash=to_db_hash(value),
+            )
+            for index, value in enumerate(cls.hashes)
+        ], batch_size=5000)
+
+    def queries(self, flipped_bits):
+        # Existing hashes with a few bits flipped, like a re-shot photo
+        rng = random.Random(7)
+        queries = []
+        for _ in range(LOOKUPS):
+            value = rng.choice(self.hashes)
+            for bit in rng.sample(range(64), flipped_bits):
+                value ^= 1 << bit
+            queries.append(value)
+        return queries
+
+    def time_each(self, function, queries):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            function(query)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return (f"{statistics.median(timings) * 1000:.3f} ms",
+                f"{timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+
+    def test_lookup_latency(self):
+        index = NearDuplicateIndex()
+        start = time.perf_counter()
+        index.find(self.user.pk, 0, 0)
+        load = time.perf_counter() - start
+        hamming_index = index._indexes[self.user.pk][0]
+
+        rows = []
+        for max_distance in (4, 6, 8, 10):
+            queries = self.queries(min(max_distance, 3))
+            rows.append((
+                max_distance,
+                *self.time_each(lambda query: hamming_index.search(query, max_distance), queries),
+                *self.time_each(lambda query: index.find(self.user.pk, query, max_distance), queries),
+                *self.time_each(
+                    lambda query: [value for value in self.hashes if (value ^ query).bit_count() <= max_distance],
+                    queries[:50],
+                ),
+            ))
+        print_table(
+            f"Near-duplicate lookups over {DEVICE_COUNT} hashes (index built in {load:.2f} s)",
+            ("max distance", "index p50", "index p99", "with top-up p50", "with top-up p99",
+             "linear scan p50", "linear scan p99"),
+            rows,
+        )
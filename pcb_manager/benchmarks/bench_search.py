@@ -0,0 +1,91 @@
+import statistics
+import time
+import unittest
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.components import link_components
+from pcb_manager.models import ChatMessage, Device
+from pcb_manager.search import search_devices, search_messages
+
+DEVICE_COUNT = 10_000
+MESSAGE_COUNT = 1_000_000
+RUNS = 5
+LIMIT = 20
+
+PHRASES = [
+    'How much current does the voltage regulator supply?',
+    'The USB-C receptacle handles power and data.',
+    'Which pins of the microcontroller are broken out?',
+    'Add a decoupling capacitor close to the supply pin.',
+    'The crystal runs the chip at 16 MHz.',
+]
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "full-text search needs PostgreSQL")
+class SearchBenchmark(TestCase):
+    """
+    Latency of the search queries over MESSAGE_COUNT chat messages, using the
+    tsvector/GIN indexes, and of the component filter through the component
+    catalog, versus the icontains scans they replace. Run against PostgreSQL;
+    creating the data takes a few minutes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='benchpass123')
+        components = [['ESP32-WROOM-32', 'AMS1117-3.3'], ['ATmega328P', 'LM7805'], ['STM32F103C8T6', 'CH340G']]
+        Device.objects.bulk_create([
+            Device(
+                user=cls.user, name=f'board {index}', image=f'images/board_{index}.jpg', complexity='Medium',
+                components=components[index % len(components)], operating_voltage='5V',
+                description='A development board built around a microcontroller. ' * 4,
+            )
+            for index in range(DEVICE_COUNT)
+        ], batch_size=5000)
+        # bulk_create skips the post_save signal that links the catalog
+        devices = list(Device.objects.filter(user=cls.user).only('id', 'components'))
+        for start in range(0, len(devices), 1000):
+            link_components(devices[start:start + 1000])
+        device_ids = [device.id for device in devices]
+        # A handful of messages with a rare word, so the needle is not in every page
+        for start in range(0, MESSAGE_COUNT, 50_000):
+            ChatMessage.objects.bulk_create([
+                ChatMessage(
+                    device_id=device_ids[index % len(device_ids)], role='user' if index % 2 else 'ai',
+                    content='Is the thermistor calibrated?' if index % 100_000 == 0 else PHRASES[index % len(PHRASES)],
+                )
+                for index in range(start, min(start + 50_000, MESSAGE_COUNT))
+            ], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE pcb_manager_device")
+            cursor.execute("ANALYZE pcb_manager_chatmessage")
+            cursor.execute("ANALYZE pcb_manager_component")
+            cursor.execute("ANALYZE pcb_manager_device_catalog_components")
+
+    def measure(self, queryset):
+        timings = []
+        for _ in range(RUNS):
+            start = time.perf_counter()
+            list(queryset[:LIMIT])
+            timings.append(time.perf_counter() - start)
+        return f"{statistics.median(timings) * 1000:.1f} ms"
+
+    def test_search(self):
+        messages = ChatMessage.objects.filter(device__user=self.user).order_by('-created_at', '-id')
+        devices = Device.objects.filter(user=self.user).order_by('-created_at', '-id')
+        rows = [
+            ("messages, common word", self.measure(messages.filter(content__icontains='regulator')),
+             self.measure(search_messages(self.user, 'regulator'))),
+            ("messages, rare word", self.measure(messages.filter(content__icontains='thermistor')),
+             self.measure(search_messages(self.user, 'thermistor'))),
+            ("messages, no match", self.measure(messages.filter(content__icontains='oscilloscope')),
+             self.measure(search_messages(self.user, 'oscilloscope'))),
+            ("devices, component (catalog join)", self.measure(devices.filter(components__icontains='"LM7805"')),
+             self.measure(search_devices(self.user, component='LM7805'))),
+        ]
+        print_table(f"Search over {MESSAGE_COUNT} messages and {DEVICE_COUNT} devices (median of {RUNS}, "
+                    f"first {LIMIT} results)", ("query", "icontains", "indexed"), rows)
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from pcb_manager.benchmarks.utils import print_table
+from pcb_manager.embeddings import build_embedding, embedding_index, embedding_model_name, similar_devices
+from pcb_manager.models import Device, DeviceEmbedding
+
+DEVICE_COUNT = 100_000
+QUERIES = 200
+K = 10
+
+PARTS = ['ESP32-WROOM-32', 'ATmega328P', 'STM32F103C8T6', 'LM7805', 'AMS1117-3.3', 'CH340G', 'BME280',
+         'NE555', 'LM358', 'TP4056', 'MPU6050', 'USB-C receptacle', 'Relay', 'Crystal', 'LED']
+WORDS = ['sensor', 'logger', 'wifi', 'bluetooth', 'motor', 'driver', 'charger', 'battery', 'regulator',
+         'timer', 'amplifier', 'display', 'controller', 'audio', 'weather', 'robot', 'supply', 'board']
+
+
+class SimilarDevicesBenchmark(TestCase):
+    """
+    Top-k cosine search over DEVICE_COUNT device embeddings of one user: the
+    in-memory matrix search alone, the full lookup with its device query, and
+    loading every vector from the database per query instead of keeping an index.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='bench', password='benchpass123')
+        rng = random.Random(3)
+        devices = Device.objects.bulk_create([
+            Device(
+                user=cls.user, name=f'board {index}', image=f'images/board_{index}.jpg', complexity='Low',
+                components=rng.sample(PARTS, 4), operating_voltage='5V',
+                description=' '.join(rng.choices(WORDS, k=12)),
+            )
+            for index in range(DEVICE_COUNT)
+        ], batch_size=5000)
+        DeviceEmbedding.objects.bulk_create([build_embedding(device) for device in devices], batch_size=5000)
+        cls.device_ids = [device.id for device in devices]
+
+    def time_each(self, function, items):
+        timings = []
+        for item in items:
+            start = time.perf_counter()
+            function(item)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        return (f"{statistics.median(timings) * 1000:.2f} ms",
+                f"{timings[int(len(timings) * 0.99)] * 1000:.2f} ms")
+
+    def test_similar_devices(self):
+        rng = random.Random(5)
+        devices = list(Device.objects.filter(id__in=rng.sample(self.device_ids, QUERIES)))
+        vectors = [
+            np.frombuffer(vector, dtype=np.float32)
+            for vector in DeviceEmbedding.objects.filter(device__in=devices).values_list('vector', flat=True)
+        ]
+
+        embedding_index.clear()
+        start = time.perf_counter()
+        embedding_index.search(self.user.pk, vectors[0], K)
+        load = time.perf_counter() - start
+
+        def without_index(vector):
+            rows = DeviceEmbedding.objects.filter(
+                device__user=self.user, model_name=embedding_model_name()).values_list('device_id', 'vector')
+            ids, blobs = zip(*rows)
+            scores = np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(ids), -1) @ vector
+            return np.argpartition(-scores, K)[:K]
+
+        rows = [
+            ("index search only",
+             *self.time_each(lambda vector: embedding_index.search(self.user.pk, vector, K), vectors)),
+            ("similar_devices()", *self.time_each(lambda device: similar_devices(device, K), devices)),
+            ("no index (load all vectors)", *self.time_each(without_index, vectors[:10])),
+        ]
+        embedding_index.clear()
+        print_table(f"Top-{K} similar devices among {DEVICE_COUNT} (index loaded in {load:.2f} s)",
+                    ("lookup", "p50", "p99"), rows)
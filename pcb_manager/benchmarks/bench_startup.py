@@ -0,0 +1,57 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from pcb_manager.benchmarks.utils import print_table
+
+RUNS = 3
+
+# What each process type pays before it can serve or do anything
+SCENARIOS = (
+    ("django.setup() (worker boot)", "import django; django.setup()"),
+    ("URLconf loaded (first request)",
+     "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns"),
+    ("first LLM use",
+     "import django; django.setup(); from pcb_manager import llm; llm.primary_llm"),
+)
+
+
+def _run(args):
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "pcb_server.settings")}
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr[-2000:]
+    return elapsed, result.stderr
+
+
+def _cumulative_import_us(importtime_output, module):
+    match = re.search(rf"^import time:\s+\d+ \|\s+(\d+) \| +{re.escape(module)}$", importtime_output, re.MULTILINE)
+    return int(match.group(1)) if match else 0
+
+
+class StartupBenchmark(SimpleTestCase):
+    """
+    Wall time of fresh interpreters reaching common startup points, plus how
+    much of it `python -X importtime` attributes to the LangChain clients.
+    """
+
+    def test_startup(self):
+        rows = []
+        for label, code in SCENARIOS:
+            timings = [_run(["-c", code])[0] for _ in range(RUNS)]
+            _, importtime = _run(["-X", "importtime", "-c", code])
+            langchain_ms = sum(
+                _cumulative_import_us(importtime, module) for module in ("langchain_openai", "langchain_google_genai")
+            ) / 1000
+            rows.append((label, f"{statistics.median(timings) * 1000:.0f} ms", f"{langchain_ms:.0f} ms"))
+
+        timings = [_run(["manage.py", "check"])[0] for _ in range(RUNS)]
+        rows.append(("manage.py check", f"{statistics.median(timings) * 1000:.0f} ms", ""))
+        print_table(f"Fresh process startup (median of {RUNS})", ("reached", "wall time", "LangChain client imports"), rows)
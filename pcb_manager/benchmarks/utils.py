@@ -0,0 +1,97 @@
+import asyncio
+import json
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+
+class SlowFakeLLM:
+    """
+    Stand-in chat model with a fixed latency for load testing.
+    """
+
+    def __init__(self, delay=0.5, content='{"status": "working"}'):
+        self.delay = delay
+        self.content = content
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self.delay)
+        return AIMessage(content=self.content)
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self.delay)
+        return AIMessage(content=self.content)
+
+
+async def asgi_request(app, method, path, token=None, body=None, query_string=b""):
+    """
+    Sends one request straight into an ASGI application, the way uvicorn would,
+    and returns (status, headers, body).
+    """
+    headers = [(b"host", b"testserver")]
+    if token:
+        headers.append((b"authorization", f"Token {token}".encode()))
+    payload = b""
+    if body is not None:
+        payload = json.dumps(body).encode()
+        headers.append((b"content-type", b"application/json"))
+        headers.append((b"content-length", str(len(payload)).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": query_string, "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    pending = [{"type": "http.request", "body": payload, "more_body": False}]
+    disconnected = asyncio.Event()
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    response = {"status": None, "headers": [], "body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = message.get("headers", [])
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    disconnected.set()
+    return response["status"], response["headers"], response["body"]
+
+
+class ThreadSampler:
+    """
+    Records the peak number of live threads while a block of async code runs.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._task = None
+
+    async def _sample(self):
+        while True:
+            self.peak = max(self.peak, threading.active_count())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.ensure_future(self._sample())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._task.cancel()
+
+
+def print_table(title, headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    print(f"\n{title}")
+    print("  ".join(str(value).ljust(width) for value, width in zip(headers, widths)))
+    for row in rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
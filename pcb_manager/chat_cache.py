@@ -0,0 +1,168 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .embeddings import embed_text
+from .metrics import Counters
+
+NON_WORD_RE = re.compile(r'[^\w.+\-/]+|(?<!\w)[.+\-/]+|[.+\-/]+(?!\w)')
+# Words that make a question lean on the preceding turns ("why?", "tell me more")
+FOLLOW_UP_WORDS = frozenset(
+    'why continue more else further that those these they them above previous earlier second third last '
+    'again same instead another'.split()
+)
+
+chat_cache_metrics = Counters("hits", "similar_hits", "misses")
+
+
+def normalize_question(text):
+    """
+    Lowercases and drops punctuation and extra whitespace, keeping the
+    punctuation inside part numbers and values (LM7805, 3.3V, USB-C).
+    """
+    return ' '.join(NON_WORD_RE.sub(' ', text.lower()).split())
+
+
+def is_follow_up(question):
+    """
+    True for short questions and ones referring back to the conversation,
+    whose answers depend on more than the device and what the user has said.
+    """
+    words = normalize_question(question).split()
+    return len(words) < 3 or not FOLLOW_UP_WORDS.isdisjoint(words)
+
+
+def conversation_version(user_messages, exclude=()):
+    """
+    Hash of what the user has told the device chat so far: their earlier
+    messages, normalized, in order and without repeats, leaving out those in
+    `exclude` (the question being answered, so that asking it again matches).
+    """
+    said = dict.fromkeys(normalize_question(text) for text in user_messages)
+    said = [text for text in said if text and text not in exclude]
+    return hashlib.sha256(json.dumps(said).encode('utf-8')).hexdigest()
+
+
+def device_fingerprint(device):
+    """
+    Hash of the device fields a chat answer can depend on. Any edit to them
+    gives a new fingerprint, so answers cached for the old state no longer match.
+    """
+    state = [device.name, str(device.image), device.complexity, device.components,
+             device.operating_voltage, device.description]
+    return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ChatResponseCache:
+    """
+    Per-process TTL/LRU of chat answers, keyed on (device id, conversation
+    version, normalized question) and valid only while the device keeps the
+    fingerprint it had when the answer was stored. The conversation version
+    covers what the user said earlier in the chat, so facts they stated
+    change the key; follow-up questions are never cached. With
+    CHAT_RESPONSE_CACHE_SIMILARITY set, a question without an exact entry may
+    reuse the answer to a differently worded question about the same device
+    and conversation whose embedding is at least that similar.
+    """
+
+    def __init__(self):
+        # (device_id, conversation, question) -> (answer, fingerprint, vector, expires_at)
+        self._entries = OrderedDict()
+        self._by_device = {}  # device_id -> set of (conversation, question)
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        device_id, conversation, question = key
+        questions = self._by_device.get(device_id)
+        if questions is not None:
+            questions.discard((conversation, question))
+            if not questions:
+                del self._by_device[device_id]
+
+    def get(self, device, question, user_messages=()):
+        """
+        (answer, similarity) for the question, or None. `user_messages` are
+        the user's messages in the device chat so far. Similarity is 1.0 for
+        an exact match of the normalized question.
+        """
+        question = normalize_question(question)
+        if not settings.CHAT_RESPONSE_CACHE_TTL or not question or is_follow_up(question):
+            return None
+        user_messages = [normalize_question(text) for text in user_messages]
+        fingerprint = device_fingerprint(device)
+        now = time.monotonic()
+        with self._lock:
+            key = (device.pk, conversation_version(user_messages, {question}), question)
+            entry = self._entries.get(key)
+            if entry is not None:
+                answer, entry_fingerprint, _, expires_at = entry
+                if entry_fingerprint == fingerprint and expires_at > now:
+                    self._entries.move_to_end(key)
+                    chat_cache_metrics.inc("hits")
+                    return answer, 1.0
+                self._drop(key)
+            candidates = list(self._by_device.get(device.pk, ()))
+
+        threshold = settings.CHAT_RESPONSE_CACHE_SIMILARITY
+        if threshold and candidates:
+            vector = embed_text(question)
+            best_key, best_score = None, threshold
+            with self._lock:
+                for conversation, other in candidates:
+                    # The other wording may itself have been asked since its answer was stored
+                    if conversation != conversation_version(user_messages, {question, other}):
+                        continue
+                    entry = self._entries.get((device.pk, conversation, other))
+                    if entry is None:
+                        continue
+                    answer, entry_fingerprint, entry_vector, expires_at = entry
+                    if entry_fingerprint != fingerprint or expires_at <= now:
+                        self._drop((device.pk, conversation, other))
+                        continue
+                    if entry_vector is None or entry_vector.shape != vector.shape:
+                        continue  # stored while similarity matching was off, or by another embedding
+                    score = float(entry_vector @ vector)
+                    if score >= best_score:
+                        best_key, best_score = (device.pk, conversation, other), score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    chat_cache_metrics.inc("similar_hits")
+                    return self._entries[best_key][0], best_score
+
+        chat_cache_metrics.inc("misses")
+        return None
+
+    def set(self, device, question, answer, user_messages=()):
+        question = normalize_question(question)
+        if not settings.CHAT_RESPONSE_CACHE_TTL or not question or is_follow_up(question):
+            return
+        conversation = conversation_version(user_messages, {question})
+        vector = embed_text(question) if settings.CHAT_RESPONSE_CACHE_SIMILARITY else None
+        expires_at = time.monotonic() + settings.CHAT_RESPONSE_CACHE_TTL
+        with self._lock:
+            key = (device.pk, conversation, question)
+            self._entries[key] = (answer, device_fingerprint(device), vector, expires_at)
+            self._entries.move_to_end(key)
+            self._by_device.setdefault(device.pk, set()).add((conversation, question))
+            while len(self._entries) > settings.CHAT_RESPONSE_CACHE_MAX_ENTRIES:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_device(self, device_id):
+        # Frees a changed or deleted device's answers now rather than when they age out
+        with self._lock:
+            for conversation, question in list(self._by_device.get(device_id, ())):
+                self._drop((device_id, conversation, question))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+
+
+chat_response_cache = ChatResponseCache()
@@ -0,0 +1,97 @@
+import logging
+import traceback
+
+from django.conf import settings
+
+from . import llm
+from .models import ConversationSummary
+
+logger = logging.getLogger(__name__)
+
+
+SUMMARY_PROMPT_TEMPLATE = """
+You maintain a running summary of a conversation between a user and an electronics engineer about one PCB.
+Update the summary with the new messages below. Keep facts, measurements, decisions and open questions;
+drop pleasantries. Reply with the updated summary only, in at most two short paragraphs.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+"""
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (about 4 characters per token) used for budgeting.
+    """
+    return len(text) // 4 + 1
+
+
+def estimate_prompt_tokens(messages):
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+def split_history(messages, max_messages, token_budget):
+    """
+    Splits chronologically ordered messages into (older, recent), where recent is
+    the longest suffix within both limits. The newest message is always kept.
+    """
+    kept = 0
+    tokens = 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message.content)
+        if kept and (kept >= max_messages or tokens + cost > token_budget):
+            break
+        kept += 1
+        tokens += cost
+    split_at = len(messages) - kept
+    return messages[:split_at], messages[split_at:]
+
+
+async def _afold_into_summary(device, summary, messages):
+    from langchain_core.messages import HumanMessage
+
+    transcript = "\n".join(f"{message.role}: {message.content}" for message in messages)
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(summary=summary.summary or "(none yet)", messages=transcript)
+    response = await llm.primary_llm.ainvoke([HumanMessage(content=prompt)])
+    if not response.content:
+        raise ValueError("LLM returned an empty summary")
+
+    summary.summary = response.content.strip()
+    summary.last_summarized_message_id = max(message.id for message in messages)
+    summary.summarized_messages += len(messages)
+    await summary.asave()
+    return summary
+
+
+async def aload_chat_context(device):
+    """
+    Returns (summary_text, recent_messages) for the next chat turn.
+
+    Only messages newer than the stored summary are loaded. When they overflow
+    CHAT_CONTEXT_MAX_MESSAGES or CHAT_CONTEXT_TOKEN_BUDGET, the oldest are folded
+    into the summary, down to half the window so that the summary is refreshed
+    every few turns rather than on every turn.
+    """
+    summary, _ = await ConversationSummary.objects.aget_or_create(device=device)
+    recent = [
+        message async for message in
+        device.chat_messages.filter(id__gt=summary.last_summarized_message_id).order_by('created_at')
+    ]
+
+    max_messages = settings.CHAT_CONTEXT_MAX_MESSAGES
+    token_budget = settings.CHAT_CONTEXT_TOKEN_BUDGET
+    older, recent = split_history(recent, max_messages, token_budget)
+    if older:
+        extra, recent = split_history(recent, max(1, max_messages // 2), token_budget // 2)
+        older += extra
+        try:
+            summary = await _afold_into_summary(device, summary, older)
+        except Exception as e:
+            # The turn still goes ahead with the bounded window; folding is retried next turn
+            logger.error(f"Could not update conversation summary for device {device.id}: {str(e)}")
+            logger.debug(traceback.format_exc())
+
+    return summary.summary, recent
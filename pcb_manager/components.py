@@ -0,0 +1,112 @@
+import re
+
+from django.conf import settings
+
+from .models import Component, Device
+
+# Folded key -> canonical name for parts the LLM names inconsistently.
+# COMPONENT_ALIASES in the settings adds to (or overrides) these.
+DEFAULT_COMPONENT_ALIASES = {
+    "resistors": "Resistor",
+    "capacitors": "Capacitor",
+    "electrolyticcapacitors": "Electrolytic capacitor",
+    "ceramiccapacitors": "Ceramic capacitor",
+    "diodes": "Diode",
+    "leds": "LED",
+    "lightemittingdiode": "LED",
+    "transistors": "Transistor",
+    "inductors": "Inductor",
+    "crystaloscillator": "Crystal",
+    "quartzcrystal": "Crystal",
+    "pushbutton": "Tactile switch",
+    "tactilebutton": "Tactile switch",
+}
+
+WHITESPACE_RE = re.compile(r'\s+')
+# Spacing and separators that don't change which part is meant: "ESP32 WROOM-32" == "esp32-wroom-32"
+KEY_STRIP_RE = re.compile(r'[\s\-_./]+')
+
+
+def _fold(name):
+    return KEY_STRIP_RE.sub('', name).casefold()
+
+
+def _aliases():
+    return {
+        _fold(alias): name
+        for alias, name in {**DEFAULT_COMPONENT_ALIASES, **settings.COMPONENT_ALIASES}.items()
+    }
+
+
+def canonical_component_name(name):
+    """
+    The display name a component is stored under: its alias target, or the
+    name with surrounding and repeated whitespace removed.
+    """
+    name = WHITESPACE_RE.sub(' ', name).strip()
+    return _aliases().get(_fold(name), name)
+
+
+def component_key(name):
+    """
+    The folded form every spelling and alias of the same part has in common.
+    """
+    return _fold(canonical_component_name(name))[:Component._meta.get_field('key').max_length]
+
+
+def canonicalize_components(names):
+    """
+    Canonical names for a component list, without empty entries or repeats
+    of the same part.
+    """
+    seen = set()
+    result = []
+    for name in names:
+        name = canonical_component_name(name)
+        key = _fold(name)
+        if key and key not in seen:
+            seen.add(key)
+            result.append(name)
+    return result
+
+
+def _get_or_create_components(names_by_key):
+    components = dict(Component.objects.filter(key__in=names_by_key).values_list('key', 'id'))
+    missing = [Component(key=key, name=name) for key, name in names_by_key.items() if key not in components]
+    if missing:
+        # Another process may be creating the same parts; keep whichever row won
+        Component.objects.bulk_create(missing, ignore_conflicts=True)
+        components.update(Component.objects.filter(key__in=[c.key for c in missing]).values_list('key', 'id'))
+    return components
+
+
+def link_components(devices):
+    """
+    Replaces the catalog links of `devices` with the parts in their
+    `components` lists, creating Component rows as needed. Uses a fixed
+    number of queries however many devices are passed.
+    """
+    keys_by_device = {}
+    names_by_key = {}
+    for device in devices:
+        keys = []
+        for name in device.components or []:
+            if not isinstance(name, str):
+                continue
+            name = canonical_component_name(name)
+            key = component_key(name)
+            if key:
+                keys.append(key)
+                names_by_key.setdefault(key, name[:Component._meta.get_field('name').max_length])
+        keys_by_device[device.pk] = set(keys)
+    if not keys_by_device:
+        return
+
+    component_ids = _get_or_create_components(names_by_key) if names_by_key else {}
+    links = Device.catalog_components.through
+    links.objects.filter(device_id__in=keys_by_device).delete()
+    links.objects.bulk_create([
+        links(device_id=device_id, component_id=component_ids[key])
+        for device_id, keys in keys_by_device.items()
+        for key in keys
+    ], ignore_conflicts=True)
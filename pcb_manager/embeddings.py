@@ -0,0 +1,213 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .components import component_key
+from .models import Device, DeviceEmbedding
+
+TOKEN_RE = re.compile(r'[a-z0-9]+(?:[.\-][a-z0-9]+)*')
+
+
+# --- Embedding functions ---
+# EMBEDDING_FUNCTION names a callable taking a device's text and returning
+# EMBEDDING_DIMENSIONS floats. The default needs no model or network: it
+# hashes words and part numbers into a fixed-size vector.
+
+def hashing_embedding(text):
+    """
+    Feature-hashed bag of words and word pairs. Deterministic across
+    processes, so stored vectors stay comparable.
+    """
+    dimensions = settings.EMBEDDING_DIMENSIONS
+    vector = np.zeros(dimensions, dtype=np.float32)
+    tokens = TOKEN_RE.findall(text.lower())
+    features = tokens + [f'{first} {second}' for first, second in zip(tokens, tokens[1:])]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], 'little') % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    return vector
+
+
+def embedding_model_name():
+    # Stored with each vector; vectors from another function or size are ignored
+    return f"{settings.EMBEDDING_FUNCTION}/{settings.EMBEDDING_DIMENSIONS}"
+
+
+def device_text(device):
+    # Components twice: once as words, once as whole part numbers
+    components = [name for name in device.components or [] if isinstance(name, str)]
+    return '\n'.join([
+        ' '.join(components),
+        ' '.join(component_key(name) for name in components),
+        device.description or '',
+    ])
+
+
+def embed_text(text):
+    """
+    Unit-length float32 vector of `text` from EMBEDDING_FUNCTION.
+    """
+    vector = np.asarray(import_string(settings.EMBEDDING_FUNCTION)(text), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def embed_device(device):
+    return embed_text(device_text(device))
+
+
+def build_embedding(device):
+    return DeviceEmbedding(device=device, model_name=embedding_model_name(), vector=embed_device(device).tobytes())
+
+
+def save_embeddings(devices):
+    """
+    Stores (replacing) the embeddings of `devices` and updates the loaded indexes.
+    """
+    embeddings = [build_embedding(device) for device in devices]
+    DeviceEmbedding.objects.bulk_create(
+        embeddings, update_conflicts=True, unique_fields=['device'], update_fields=['model_name', 'vector'],
+    )
+    for device, embedding in zip(devices, embeddings):
+        embedding_index.update(device.user_id, device.pk, np.frombuffer(embedding.vector, dtype=np.float32))
+
+
+# --- In-memory index ---
+
+class UserVectors:
+    """
+    One user's vectors (keyed by device or other row id) as rows of a matrix,
+    for vectorized cosine search. Rows are appended into spare capacity and removed by moving the
+    last row into the gap, so updates don't copy the matrix.
+    """
+
+    def __init__(self, dimensions):
+        self._matrix = np.zeros((16, dimensions), dtype=np.float32)
+        self._ids = np.zeros(16, dtype=np.int64)
+        self._positions = {}
+        self.size = 0
+
+    def add(self, device_id, vector):
+        position = self._positions.get(device_id)
+        if position is None:
+            if self.size == len(self._ids):
+                self._matrix = np.concatenate([self._matrix, np.zeros_like(self._matrix)])
+                self._ids = np.concatenate([self._ids, np.zeros_like(self._ids)])
+            position = self.size
+            self._positions[device_id] = position
+            self._ids[position] = device_id
+            self.size += 1
+        self._matrix[position] = vector
+
+    def remove(self, device_id):
+        position = self._positions.pop(device_id, None)
+        if position is None:
+            return
+        last = self.size - 1
+        if position != last:
+            self._matrix[position] = self._matrix[last]
+            self._ids[position] = self._ids[last]
+            self._positions[int(self._ids[position])] = position
+        self.size = last
+
+    def search(self, vector, k, exclude=()):
+        """
+        [(id, cosine similarity)] of the k nearest rows, best first.
+        """
+        if not self.size or k <= 0:
+            return []
+        scores = self._matrix[:self.size] @ vector
+        for device_id in exclude:
+            position = self._positions.get(device_id)
+            if position is not None:
+                scores[position] = -np.inf
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top if scores[i] != -np.inf]
+
+
+def _device_vector_rows(user_id, after_id, model_name):
+    return (
+        DeviceEmbedding.objects.filter(device__user_id=user_id, device_id__gt=after_id, model_name=model_name)
+        .order_by('device_id').values_list('device_id', 'vector')
+    )
+
+
+class EmbeddingIndex:
+    """
+    Per-process UserVectors for the EMBEDDING_INDEX_MAX_USERS most recently
+    searched users. Loaded on a user's first search and topped up with newer
+    rows on later ones; this process's own creates, edits and deletes are
+    applied directly.
+
+    `rows(user_id, after_id, model_name)` returns a user's (id, vector bytes)
+    pairs with ids above `after_id`, in id order.
+    """
+
+    def __init__(self, rows=_device_vector_rows):
+        self._rows = rows
+        self._users = OrderedDict()  # user_id -> (UserVectors, model name, highest loaded id)
+        self._lock = threading.Lock()
+
+    def _vectors(self, user_id):
+        model_name = embedding_model_name()
+        vectors, loaded_model, last_id = self._users.get(user_id, (None, None, 0))
+        if vectors is None or loaded_model != model_name:
+            vectors, last_id = UserVectors(settings.EMBEDDING_DIMENSIONS), 0
+        for row_id, vector in self._rows(user_id, last_id, model_name):
+            vectors.add(row_id, np.frombuffer(vector, dtype=np.float32))
+            last_id = row_id
+        self._users[user_id] = (vectors, model_name, last_id)
+        self._users.move_to_end(user_id)
+        while len(self._users) > settings.EMBEDDING_INDEX_MAX_USERS:
+            self._users.popitem(last=False)
+        return vectors
+
+    def search(self, user_id, vector, k, exclude=()):
+        with self._lock:
+            return self._vectors(user_id).search(vector, k, exclude)
+
+    def update(self, user_id, row_id, vector):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry[0].add(row_id, vector)
+
+    def remove(self, user_id, row_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry[0].remove(row_id)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+embedding_index = EmbeddingIndex()
+
+
+def similar_devices(device, k):
+    """
+    The k devices of the same user closest to `device`, as (device, score).
+    """
+    embedding = DeviceEmbedding.objects.filter(device=device, model_name=embedding_model_name()).first()
+    vector = np.frombuffer(embedding.vector, dtype=np.float32) if embedding else embed_device(device)
+
+    # A few spares for devices another process has deleted since the index was loaded
+    matches = embedding_index.search(device.user_id, vector, k + 5, exclude=[device.pk])
+    devices = Device.objects.filter(user_id=device.user_id).in_bulk([device_id for device_id, _ in matches])
+    results = []
+    for device_id, score in matches:
+        if device_id in devices:
+            results.append((devices[device_id], score))
+        else:
+            embedding_index.remove(device.user_id, device_id)
+    return results[:k]
@@ -0,0 +1,99 @@
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from rest_framework.exceptions import ParseError
+
+# Pillow format name -> (file extension, MIME type)
+IMAGE_FORMATS = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+
+class PreparedImage:
+    """
+    An upload normalized for the rest of the pipeline:
+
+    - llm_bytes / llm_content_type: small JPEG sent to the model
+    - image: re-encoded full-size file for Device.image
+    - thumbnail: small file for Device.thumbnail
+    - perceptual_hash: 64-bit dHash for near-duplicate lookups
+    - content_hash: sha256 of the upload as received, for the analysis cache
+    """
+
+    def __init__(self, llm_bytes, llm_content_type, image, thumbnail, original_size, perceptual_hash=None,
+                 content_hash=None):
+        self.llm_bytes = llm_bytes
+        self.llm_content_type = llm_content_type
+        self.image = image
+        self.thumbnail = thumbnail
+        self.original_size = original_size
+        self.perceptual_hash = perceptual_hash
+        self.content_hash = content_hash
+
+
+def _encode(image, max_edge, image_format):
+    resized = image.copy()
+    resized.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    resized.save(buffer, format=image_format, quality=settings.IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _load_rgb(image_bytes):
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (UnidentifiedImageError, OSError):
+        raise ParseError("Upload a valid image. The file you uploaded was either not an image or a corrupted image.")
+
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a tiny
+    grayscale copy. Re-shot photos of the same board differ in few bits, so
+    the Hamming distance between hashes measures visual similarity.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def prepare_image(image_bytes, filename):
+    """
+    Orients, downsizes and re-encodes an uploaded image. CPU-bound: call it
+    from a worker thread in async code.
+    """
+    image = _load_rgb(image_bytes)
+    stem = os.path.splitext(os.path.basename(filename))[0] or 'board'
+    extension, _ = IMAGE_FORMATS[settings.STORED_IMAGE_FORMAT]
+
+    stored_bytes = _encode(image, settings.STORED_IMAGE_MAX_EDGE, settings.STORED_IMAGE_FORMAT)
+    thumbnail_bytes = _encode(image, settings.THUMBNAIL_MAX_EDGE, settings.STORED_IMAGE_FORMAT)
+    return PreparedImage(
+        llm_bytes=_encode(image, settings.ANALYSIS_IMAGE_MAX_EDGE, 'JPEG'),
+        llm_content_type='image/jpeg',
+        image=ContentFile(stored_bytes, name=f"{stem}.{extension}"),
+        thumbnail=ContentFile(thumbnail_bytes, name=f"{stem}_thumb.{extension}"),
+        original_size=len(image_bytes),
+        perceptual_hash=dhash(image),
+        content_hash=hashlib.sha256(image_bytes).hexdigest(),
+    )
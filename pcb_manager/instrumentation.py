@@ -0,0 +1,251 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import Histogram
+
+# --- Per-request measurements ---
+# The middleware puts a RequestSample in this context variable for the
+# duration of a request; the hooks below add to it and do nothing otherwise,
+# so with the middleware off the only cost is one ContextVar lookup per hook.
+# sync_to_async copies the context, so work done in threads is counted too.
+_current_sample = ContextVar('pcb_request_sample', default=None)
+
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class RequestSample:
+
+    __slots__ = ('queries', 'query_seconds', 'llm_calls', 'llm_seconds', 'prompt_chars', 'response_chars',
+                 'serialize_seconds', 'serializing')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.serialize_seconds = 0.0
+        self.serializing = False
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the current request's queries.
+    Installed on every connection (see apps.py).
+    """
+    sample = _current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.query_seconds += time.perf_counter() - start
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def content_chars(content):
+    # Text length of a message's content; image parts are not counted
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        return sum(content_chars(part if isinstance(part, str) else part.get('text', '')) for part in content)
+    return 0
+
+
+def record_llm_call(seconds, messages, response_chars):
+    sample = _current_sample.get()
+    if sample is None:
+        return
+    sample.llm_calls += 1
+    sample.llm_seconds += seconds
+    sample.prompt_chars += sum(content_chars(getattr(message, 'content', None)) for message in messages)
+    sample.response_chars += response_chars
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent building `serializer.data` to the current request.
+    Nested serializers are counted once, as part of their parent.
+    """
+
+    @property
+    def data(self):
+        sample = _current_sample.get()
+        if sample is None or sample.serializing:
+            return super().data
+        sample.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().data
+        finally:
+            sample.serialize_seconds += time.perf_counter() - start
+            sample.serializing = False
+
+
+# --- Aggregation and export ---
+
+class EndpointMetrics:
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency = Histogram()
+        self.queries = Histogram(COUNT_BUCKETS)
+        self.query_seconds = Histogram()
+        self.llm_seconds = Histogram()
+        self.prompt_chars = Histogram(SIZE_BUCKETS)
+        self.response_chars = Histogram(SIZE_BUCKETS)
+        self.serialize_seconds = Histogram()
+
+
+# (Prometheus name, help, EndpointMetrics attribute)
+HISTOGRAMS = [
+    ('pcb_http_request_duration_seconds', 'Time to produce the response headers.', 'latency'),
+    ('pcb_http_request_db_queries', 'Database queries per request.', 'queries'),
+    ('pcb_http_request_db_seconds', 'Time spent executing database queries per request.', 'query_seconds'),
+    ('pcb_http_request_llm_seconds', 'Time spent in LLM calls, for requests that made any.', 'llm_seconds'),
+    ('pcb_http_request_llm_prompt_chars', 'Text characters sent to the LLM per request.', 'prompt_chars'),
+    ('pcb_http_request_llm_response_chars', 'Characters received from the LLM per request.', 'response_chars'),
+    ('pcb_http_request_serialize_seconds', 'Time spent in DRF serializers per request.', 'serialize_seconds'),
+]
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label_value(value)}"' for name, value in labels.items()) + '}'
+
+
+class RequestMetrics:
+    """
+    Per-endpoint histograms, keyed by HTTP method and URL route pattern.
+    """
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, method, route):
+        key = (method, route)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            with self._lock:
+                endpoint = self._endpoints.setdefault(key, EndpointMetrics())
+        return endpoint
+
+    def observe(self, method, route, status_code, seconds, sample):
+        endpoint = self._endpoint(method, route)
+        with self._lock:
+            endpoint.statuses[status_code] = endpoint.statuses.get(status_code, 0) + 1
+        endpoint.latency.observe(seconds)
+        endpoint.queries.observe(sample.queries)
+        endpoint.query_seconds.observe(sample.query_seconds)
+        endpoint.serialize_seconds.observe(sample.serialize_seconds)
+        if sample.llm_calls:
+            endpoint.llm_seconds.observe(sample.llm_seconds)
+            endpoint.prompt_chars.observe(sample.prompt_chars)
+            endpoint.response_chars.observe(sample.response_chars)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+    def prometheus_lines(self):
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            statuses = [(key, dict(endpoint.statuses)) for key, endpoint in endpoints]
+
+        lines = [
+            '# HELP pcb_http_requests_total Requests handled, by endpoint and status code.',
+            '# TYPE pcb_http_requests_total counter',
+        ]
+        for (method, route), counts in statuses:
+            for status_code, count in sorted(counts.items()):
+                lines.append(f'pcb_http_requests_total{_labels(method=method, route=route, status=status_code)} {count}')
+
+        for name, help_text, attribute in HISTOGRAMS:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+            for (method, route), endpoint in endpoints:
+                snapshot = getattr(endpoint, attribute).snapshot()
+                if not snapshot['count']:
+                    continue
+                for bound, count in snapshot['buckets'].items():
+                    lines.append(f'{name}_bucket{_labels(method=method, route=route, le=bound)} {count}')
+                labels = _labels(method=method, route=route)
+                lines.append(f'{name}_sum{labels} {snapshot["sum"]}')
+                lines.append(f'{name}_count{labels} {snapshot["count"]}')
+        return lines
+
+
+request_metrics = RequestMetrics()
+
+
+def counters_prometheus_lines(prefix, counters, help_text):
+    """
+    Exposes a metrics.Counters instance as one Prometheus counter per name.
+    """
+    lines = []
+    for name, value in counters.snapshot().items():
+        lines += [
+            f'# HELP {prefix}_{name}_total {help_text}',
+            f'# TYPE {prefix}_{name}_total counter',
+            f'{prefix}_{name}_total {value}',
+        ]
+    return lines
+
+
+class RequestMetricsMiddleware:
+    """
+    Records per-endpoint latency, query, LLM and serializer histograms.
+    Enabled with REQUEST_METRICS_ENABLED. For streaming responses the latency
+    is the time to the first byte; work done while streaming isn't counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _observe(self, request, response, start, sample):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        request_metrics.observe(request.method, route, response.status_code, time.perf_counter() - start, sample)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        self._observe(request, response, start, sample)
+        return response
+
+    async def __acall__(self, request):
+        sample = RequestSample()
+        token = _current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_sample.reset(token)
+        self._observe(request, response, start, sample)
+        return response
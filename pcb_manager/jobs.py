@@ -0,0 +1,275 @@
+import logging
+import threading
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import Avg, Count, F, Max, Sum
+from django.utils import timezone
+from rest_framework.exceptions import APIException, ParseError, Throttled
+
+from .analysis import analyze_image
+from .images import prepare_image
+from .models import AnalysisJob, Device
+from .near_duplicates import reuse_near_duplicate, to_db_hash
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis_job(user, image_file, name, reanalyze=False):
+    """
+    Stores the upload and queues it for analysis by the worker pool.
+    Raises Throttled if the user already has too many unfinished jobs.
+    """
+    unfinished = AnalysisJob.objects.filter(
+        user=user, status__in=[AnalysisJob.QUEUED, AnalysisJob.RUNNING]
+    ).count()
+    if unfinished >= settings.ANALYSIS_JOB_MAX_PENDING_PER_USER:
+        raise Throttled(detail="Too many analysis jobs in progress. Wait for some to finish.")
+
+    job = AnalysisJob.objects.create(
+        user=user, name=name, image=image_file, content_type=image_file.content_type, reanalyze=reanalyze
+    )
+    ensure_workers_started()
+    return job
+
+
+def _lock_user(user_id):
+    # Serializes claims of one user's jobs until the claiming transaction ends
+    User.objects.select_for_update().only('id').get(pk=user_id)
+
+
+def claim_next_job():
+    """
+    Atomically marks the oldest runnable job as running and returns it, or None.
+    Users already at ANALYSIS_JOB_MAX_RUNNING_PER_USER are skipped so one busy
+    user cannot occupy the whole pool. Claims of one user's jobs take turns on
+    a lock of the user row, so concurrent workers cannot overshoot the cap.
+    """
+    busy_users = (
+        AnalysisJob.objects.filter(status=AnalysisJob.RUNNING)
+        .values('user')
+        .annotate(running=Count('id'))
+        .filter(running__gte=settings.ANALYSIS_JOB_MAX_RUNNING_PER_USER)
+        .values('user')
+    )
+    skipped_users = set()
+    with transaction.atomic():
+        while True:
+            job = (
+                AnalysisJob.objects.select_for_update(skip_locked=True)
+                .filter(status=AnalysisJob.QUEUED, available_at__lte=timezone.now())
+                .exclude(user__in=busy_users)
+                .exclude(user__in=skipped_users)
+                .order_by('available_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            # busy_users misses jobs other workers are claiming right now, so
+            # recount once no other claim for this user is in flight
+            _lock_user(job.user_id)
+            running = AnalysisJob.objects.filter(user_id=job.user_id, status=AnalysisJob.RUNNING).count()
+            if running < settings.ANALYSIS_JOB_MAX_RUNNING_PER_USER:
+                break
+            skipped_users.add(job.user_id)
+        job.status = AnalysisJob.RUNNING
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+    return job
+
+
+def _still_claimed(job):
+    # Locks the job row and checks requeue_stale_jobs hasn't handed it to
+    # another worker since this one claimed it
+    return AnalysisJob.objects.select_for_update().filter(
+        pk=job.pk, status=AnalysisJob.RUNNING, attempts=job.attempts
+    ).exists()
+
+
+def run_job(job):
+    """
+    Analyzes a claimed job and creates its device. A near-duplicate of one of
+    the user's devices reuses its analysis, as in the synchronous endpoint.
+    Failures are retried with exponential backoff until
+    ANALYSIS_JOB_MAX_ATTEMPTS is reached. A worker that took so long that the
+    job was requeued meanwhile drops its result.
+    """
+    try:
+        with job.image.open('rb') as image:
+            prepared = prepare_image(image.read(), job.image.name)
+        near_duplicate, analysis = reuse_near_duplicate(job.user, prepared.perceptual_hash, job.reanalyze)
+        reused = analysis is not None
+        cache_hit = False
+        if not reused:
+            analysis, cache_hit = analyze_image(
+                prepared.llm_bytes, prepared.llm_content_type, prepared.content_hash
+            )
+
+        with transaction.atomic():
+            if not _still_claimed(job):
+                logger.warning(f"Analysis job {job.pk} was requeued during attempt {job.attempts}; dropping its result")
+                return job
+            device = Device.objects.create(
+                user=job.user,
+                name=job.name,
+                image=prepared.image,
+                thumbnail=prepared.thumbnail,
+                perceptual_hash=to_db_hash(prepared.perceptual_hash),
+                components=analysis.get("components", []),
+                operating_voltage=analysis.get("operating_voltage"),
+                complexity=analysis.get("complexity"),
+                description=analysis.get("description"),
+            )
+            job.device = device
+            job.cache_hit = cache_hit
+            if near_duplicate is not None:
+                job.near_duplicate, job.near_duplicate_distance = near_duplicate
+                job.near_duplicate_reused = reused
+            job.status = AnalysisJob.SUCCEEDED
+            job.error = ''
+            job.finished_at = timezone.now()
+            # The device keeps the re-encoded copy; the raw upload is no longer
+            # needed once the device is committed
+            transaction.on_commit(partial(job.image.storage.delete, job.image.name))
+            job.image = ''
+            job.save(update_fields=[
+                'device', 'cache_hit', 'near_duplicate', 'near_duplicate_distance', 'near_duplicate_reused',
+                'status', 'error', 'finished_at', 'image',
+            ])
+
+    except Exception as e:
+        detail = e.detail if isinstance(e, APIException) else str(e)
+        logger.error(f"Analysis job {job.pk} failed on attempt {job.attempts}: {detail}")
+        logger.debug(traceback.format_exc())
+
+        with transaction.atomic():
+            if not _still_claimed(job):
+                return job
+            job.error = str(detail)
+            job.finished_at = timezone.now()
+            # A file that is not an image will not get better on retry
+            if job.attempts < settings.ANALYSIS_JOB_MAX_ATTEMPTS and not isinstance(e, ParseError):
+                backoff = settings.ANALYSIS_JOB_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+                job.status = AnalysisJob.QUEUED
+                job.available_at = timezone.now() + timedelta(seconds=backoff)
+            else:
+                job.status = AnalysisJob.FAILED
+            job.save(update_fields=['error', 'finished_at', 'status', 'available_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Puts back jobs whose worker died mid-analysis, i.e. jobs that have been
+    running for longer than ANALYSIS_JOB_TIMEOUT seconds.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_TIMEOUT)
+    stale = AnalysisJob.objects.filter(status=AnalysisJob.RUNNING, started_at__lt=cutoff)
+    failed = stale.filter(attempts__gte=settings.ANALYSIS_JOB_MAX_ATTEMPTS).update(
+        status=AnalysisJob.FAILED, error="Timed out.", finished_at=timezone.now()
+    )
+    requeued = stale.update(status=AnalysisJob.QUEUED, error="Timed out.", available_at=timezone.now())
+    return requeued + failed
+
+
+def run_pending_jobs(max_jobs=None):
+    """
+    Processes runnable jobs in the calling thread until the queue is empty.
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        processed += 1
+    return processed
+
+
+def job_metrics():
+    """
+    Queue depth and timing aggregates across all workers, read from the job table.
+    """
+    counts = dict(
+        AnalysisJob.objects.values_list('status').annotate(total=Count('id')).order_by()
+    )
+    timings = AnalysisJob.objects.filter(status=AnalysisJob.SUCCEEDED).aggregate(
+        avg_queue_wait=Avg(F('started_at') - F('created_at')),
+        avg_run_time=Avg(F('finished_at') - F('started_at')),
+        max_run_time=Max(F('finished_at') - F('started_at')),
+        total_attempts=Sum('attempts'),
+    )
+    return {
+        "jobs_by_status": {key: counts.get(key, 0) for key, _ in AnalysisJob.STATUS_CHOICES},
+        "succeeded_attempts": timings['total_attempts'] or 0,
+        **{
+            f"{key}_seconds": round(value.total_seconds(), 3) if value is not None else None
+            for key, value in timings.items() if key != 'total_attempts'
+        },
+    }
+
+
+class AnalysisWorkerPool:
+    """
+    A pool of daemon threads that poll the AnalysisJob table for work.
+    """
+
+    def __init__(self, workers, poll_interval=1.0):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"analysis-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = None
+            try:
+                job = claim_next_job()
+                if job is not None:
+                    run_job(job)
+                else:
+                    requeue_stale_jobs()
+            except Exception:
+                logger.error(traceback.format_exc())
+            finally:
+                close_old_connections()
+            if job is None:
+                self._stop.wait(self.poll_interval)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ensure_workers_started():
+    """
+    Starts the in-process worker pool on first use when
+    ANALYSIS_JOB_INPROCESS_WORKERS is non-zero. Deployments that run
+    `manage.py run_analysis_workers` separately should set it to 0.
+    """
+    global _pool
+    if settings.ANALYSIS_JOB_INPROCESS_WORKERS <= 0 or _pool is not None:
+        return
+    with _pool_lock:
+        if _pool is None:
+            _pool = AnalysisWorkerPool(settings.ANALYSIS_JOB_INPROCESS_WORKERS)
+            _pool.start()
@@ -0,0 +1,93 @@
+import logging
+import threading
+
+from django.conf import settings
+
+import environ
+
+env = environ.Env()
+environ.Env.read_env()
+
+logger = logging.getLogger(__name__)
+
+# --- LLM Setup ---
+# The LangChain clients take seconds to import, so nothing here is imported or
+# built until a request actually needs the LLM. `primary_llm` and `model_name`
+# are resolved on first attribute access (see __getattr__ below).
+api_key = env("GOOGLE_API_KEY")
+
+
+def _default_backends():
+    # Without LLM_BACKENDS: Gemini when GOOGLE_API_KEY is set, else LM Studio
+    if api_key:
+        return [{"name": "gemini", "provider": "google", "model": "gemini-1.5-flash", "api_key": api_key}]
+    return [{"name": "lm-studio", "provider": "openai", "model": "lm-studio",
+             "base_url": "http://localhost:1234/v1", "api_key": "lm-studio"}]
+
+
+def backend_configs():
+    return settings.LLM_BACKENDS or _default_backends()
+
+
+def build_chat_model(config, timeout):
+    """
+    Builds the LangChain chat model for one LLM_BACKENDS entry.
+    """
+    key = env(config["api_key_env"]) if config.get("api_key_env") else config.get("api_key")
+    if config["provider"] == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(model=config["model"], temperature=0.1, api_key=key, timeout=timeout)
+    if config["provider"] == "openai":
+        from langchain_openai import ChatOpenAI
+
+        # Retries are the router's job: fail fast and let it move to the next backend
+        return ChatOpenAI(
+            model=config["model"], base_url=config.get("base_url"), api_key=key or "not-needed",
+            timeout=timeout, max_retries=0,
+        )
+    raise ValueError(f"Unknown LLM provider: {config['provider']}")
+
+
+def build_router(configs):
+    from .llm_router import CircuitBreaker, LLMBackend, LLMRouter
+
+    backends = []
+    for config in configs:
+        timeout = config.get("timeout", settings.LLM_TIMEOUT)
+        backends.append(LLMBackend(
+            name=config.get("name", config["model"]),
+            model=build_chat_model(config, timeout),
+            model_name=config["model"],
+            timeout=timeout,
+            breaker=CircuitBreaker(settings.LLM_CIRCUIT_FAILURES, settings.LLM_CIRCUIT_RESET_SECONDS),
+            provider=config["provider"],
+            structured_output=config.get("structured_output", True),
+        ))
+    return LLMRouter(backends, settings.LLM_HEDGE_QUANTILE, settings.LLM_HEDGE_MIN_SAMPLES)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm():
+    """
+    Returns the process-wide LLMRouter, building it on first use.
+    """
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = build_router(backend_configs())
+                logger.info(f"Using LLM: {', '.join(backend.name for backend in _router.backends)}")
+    return _router
+
+
+def __getattr__(name):
+    if name == 'primary_llm':
+        return get_llm()
+    if name == 'model_name':
+        # Known from the settings alone; no need to build the clients
+        return backend_configs()[0]["model"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
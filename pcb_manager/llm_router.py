@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import threading
+import time
+
+from rest_framework.exceptions import APIException
+
+from .instrumentation import content_chars, record_llm_call
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# response_metadata key naming the backend model that produced a reply
+ANSWERED_BY_KEY = 'router_model_name'
+
+
+class LLMUnavailable(APIException):
+    status_code = 503
+    default_detail = 'No LLM backend is available right now.'
+    default_code = 'llm_unavailable'
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a backend after `failure_threshold` consecutive failures.
+    After `reset_seconds` a single trial call is let through (half-open); its
+    outcome closes the circuit again or restarts the wait.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        # A call abandoned without an outcome (hedge loser, client gone)
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def answered_by(result, default=None):
+    """
+    Model name of the backend that produced `result`, or `default` for
+    replies that did not come through an LLMRouter.
+    """
+    metadata = getattr(result, 'response_metadata', None)
+    if isinstance(metadata, dict):
+        return metadata.get(ANSWERED_BY_KEY, default)
+    return default
+
+
+class LLMBackend:
+    """
+    One configured chat model with its timeout, circuit breaker and latency
+    histograms: of successful invoke/ainvoke calls, which set the hedge delay,
+    and of the time streams take to their first chunk.
+    """
+
+    def __init__(self, name, model, model_name, timeout, breaker, provider='openai', structured_output=True):
+        self.name = name
+        self.model = model
+        self.model_name = model_name
+        self.timeout = timeout
+        self.breaker = breaker
+        self.provider = provider
+        self.structured_output = structured_output
+        self.latency = Histogram()
+        self.first_chunk_latency = Histogram()
+        self.failures = 0
+
+    def _call_kwargs(self, structured_output, kwargs):
+        """
+        Adds the provider's native JSON-schema output mode for `structured_output`
+        (a pydantic model), unless the backend is configured without it.
+        """
+        if structured_output is None or not self.structured_output:
+            return kwargs
+        schema = structured_output.model_json_schema()
+        if self.provider == 'google':
+            return {"response_mime_type": "application/json", "response_json_schema": schema, **kwargs}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": structured_output.__name__, "schema": schema},
+            },
+            **kwargs,
+        }
+
+    def succeeded(self, elapsed=None, result=None):
+        if elapsed is not None:
+            self.latency.observe(elapsed)
+        self.breaker.record_success()
+        # Failover and hedging hide which backend answered; callers caching by model need it
+        metadata = getattr(result, 'response_metadata', None)
+        if isinstance(metadata, dict):
+            metadata[ANSWERED_BY_KEY] = self.model_name
+
+    def failed(self, error):
+        self.failures += 1
+        self.breaker.record_failure()
+        logger.warning(f"LLM backend {self.name} failed: {type(error).__name__}: {error}")
+
+    def invoke(self, messages, structured_output=None, **kwargs):
+        start = time.monotonic()
+        try:
+            result = self.model.invoke(messages, **self._call_kwargs(structured_output, kwargs))
+        except Exception as e:
+            self.failed(e)
+            raise
+        self.succeeded(time.monotonic() - start, result)
+        return result
+
+    async def ainvoke(self, messages, structured_output=None, **kwargs):
+        start = time.monotonic()
+        try:
+            coroutine = self.model.ainvoke(messages, **self._call_kwargs(structured_output, kwargs))
+            result = await asyncio.wait_for(coroutine, self.timeout)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.failed(e)
+            raise
+        self.succeeded(time.monotonic() - start, result)
+        return result
+
+    async def astream(self, messages, **kwargs):
+        start = time.monotonic()
+        first = True
+        try:
+            async for chunk in self.model.astream(messages, **kwargs):
+                if first:
+                    # Not into `latency`: whole streams run far longer than a
+                    # reply takes to start, and would push out the hedge delay
+                    self.first_chunk_latency.observe(time.monotonic() - start)
+                    first = False
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.failed(e)
+            raise
+        self.succeeded()
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "model": self.model_name,
+            "provider": self.provider,
+            "timeout": self.timeout,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "failures": self.failures,
+            "latency_seconds": self.latency.snapshot(),
+            "first_chunk_seconds": self.first_chunk_latency.snapshot(),
+        }
+
+
+class LLMRouter:
+    """
+    Sends each call to the first backend whose circuit is closed, failing
+    over down the list on errors and timeouts.
+
+    Async calls are also hedged: when a backend has not answered by its own
+    recent `hedge_quantile` latency, the next backend is started as well and
+    the first good answer wins. Sync calls (background workers) only fail over.
+    Streams fail over until the first chunk has been yielded.
+
+    invoke/ainvoke take an optional `structured_output` pydantic model, which
+    each backend turns into its provider's JSON-schema output parameters.
+    """
+
+    def __init__(self, backends, hedge_quantile=0.95, hedge_min_samples=20):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = list(backends)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedged_calls = 0
+
+    @property
+    def model_name(self):
+        return self.backends[0].model_name
+
+    def _candidates(self):
+        # Lazily, so a half-open backend's trial slot is only taken when it is used
+        return (backend for backend in self.backends if backend.breaker.allow())
+
+    def _unavailable(self, errors):
+        detail = "; ".join(f"{name}: {type(error).__name__}" for name, error in errors)
+        return LLMUnavailable(detail=f"All LLM backends failed ({detail})." if errors else None)
+
+    def _hedge_delay(self, backend):
+        if not self.hedge_quantile:
+            return None
+        return backend.latency.quantile(self.hedge_quantile, self.hedge_min_samples)
+
+    def invoke(self, messages, **kwargs):
+        start = time.monotonic()
+        result = None
+        try:
+            result = self._invoke(messages, **kwargs)
+            return result
+        finally:
+            record_llm_call(time.monotonic() - start, messages, content_chars(getattr(result, 'content', None)))
+
+    async def ainvoke(self, messages, **kwargs):
+        start = time.monotonic()
+        result = None
+        try:
+            result = await self._ainvoke(messages, **kwargs)
+            return result
+        finally:
+            record_llm_call(time.monotonic() - start, messages, content_chars(getattr(result, 'content', None)))
+
+    async def astream(self, messages, **kwargs):
+        start = time.monotonic()
+        response_chars = 0
+        try:
+            async for chunk in self._astream(messages, **kwargs):
+                response_chars += content_chars(chunk.content)
+                yield chunk
+        finally:
+            record_llm_call(time.monotonic() - start, messages, response_chars)
+
+    def _invoke(self, messages, **kwargs):
+        errors = []
+        for backend in self._candidates():
+            try:
+                return backend.invoke(messages, **kwargs)
+            except Exception as e:
+                errors.append((backend.name, e))
+        raise self._unavailable(errors)
+
+    async def _ainvoke(self, messages, **kwargs):
+        candidates = self._candidates()
+        pending = {}
+        errors = []
+        hedge_delay = None
+
+        def launch():
+            nonlocal hedge_delay
+            backend = next(candidates, None)
+            if backend is None:
+                hedge_delay = None
+                return False
+            pending[asyncio.ensure_future(backend.ainvoke(messages, **kwargs))] = backend
+            hedge_delay = self._hedge_delay(backend)
+            return True
+
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than usual: race the next backend against it
+                    if launch():
+                        self.hedged_calls += 1
+                    continue
+                winners = []
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        winners.append(task.result())
+                    else:
+                        errors.append((backend.name, task.exception()))
+                if winners:
+                    return winners[0]
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise self._unavailable(errors)
+
+    async def _astream(self, messages, **kwargs):
+        errors = []
+        for backend in self._candidates():
+            stream = backend.astream(messages, **kwargs)
+            try:
+                first = await asyncio.wait_for(anext(stream), backend.timeout)
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    backend.failed(e)
+                await stream.aclose()
+                errors.append((backend.name, e))
+                continue
+
+            try:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+            return
+        raise self._unavailable(errors)
+
+    def stats(self):
+        return {
+            "hedged_calls": self.hedged_calls,
+            "backends": [backend.stats() for backend in self.backends],
+        }
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pcb_manager.components import link_components
+from pcb_manager.models import Device
+
+
+class Command(BaseCommand):
+    help = (
+        "Links existing devices to the normalized component catalog, in chunks "
+        "of devices ordered by id. Safe to re-run or resume with --start-id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Devices per transaction.')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume from this device id.')
+
+    def handle(self, *args, **options):
+        last_id = options['start_id'] - 1
+        processed = 0
+        while True:
+            # Keyset paging on the primary key: each chunk is an index range scan
+            chunk = list(
+                Device.objects.filter(id__gt=last_id).order_by('id').only('id', 'components')[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            with transaction.atomic():
+                link_components(chunk)
+            last_id = chunk[-1].id
+            processed += len(chunk)
+            self.stdout.write(f"Linked {processed} devices (up to id {last_id}).")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled components for {processed} devices."))
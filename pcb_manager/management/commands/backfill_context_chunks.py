@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pcb_manager.models import Device
+from pcb_manager.retrieval import rebuild_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-chunks and embeds the descriptions and chat messages of every device, "
+        "for chat retrieval, in chunks of devices ordered by id. Safe to re-run or "
+        "resume with --start-id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Devices per transaction.')
+        parser.add_argument('--start-id', type=int, default=0, help='Resume from this device id.')
+
+    def handle(self, *args, **options):
+        last_id = options['start_id'] - 1
+        processed = 0
+        while True:
+            batch = list(
+                Device.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'user_id', 'description')[:options['chunk_size']]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                rebuild_chunks(batch)
+            last_id = batch[-1].id
+            processed += len(batch)
+            self.stdout.write(f"Chunked {processed} devices (up to id {last_id}).")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled chat context chunks for {processed} devices."))
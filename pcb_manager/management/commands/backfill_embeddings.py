@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from pcb_manager.embeddings import embedding_model_name, save_embeddings
+from pcb_manager.models import Device
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes embeddings for devices that have none, or one from a different "
+        "EMBEDDING_FUNCTION/EMBEDDING_DIMENSIONS, in chunks of devices ordered by id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Devices per batch.')
+
+    def handle(self, *args, **options):
+        stale = Device.objects.exclude(embedding__model_name=embedding_model_name())
+        last_id = 0
+        processed = 0
+        while True:
+            chunk = list(
+                stale.filter(id__gt=last_id).order_by('id')
+                .only('id', 'user_id', 'components', 'description')[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            save_embeddings(chunk)
+            last_id = chunk[-1].id
+            processed += len(chunk)
+            self.stdout.write(f"Embedded {processed} devices (up to id {last_id}).")
+        self.stdout.write(self.style.SUCCESS(f"Backfilled embeddings for {processed} devices."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from pcb_manager.analysis_cache import analysis_cache
+from pcb_manager.analysis import ANALYSIS_PROMPT_VERSION
+from pcb_manager.llm import backend_configs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes cached PCB analyses that were produced by a model no LLM backend "
+        "uses any more or by another prompt template. Use --all to wipe the cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Delete every cached analysis, including ones for the current model and prompt.',
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            deleted = analysis_cache.invalidate()
+        else:
+            deleted = analysis_cache.invalidate(
+                model_names=[config["model"] for config in backend_configs()], prompt_version=ANALYSIS_PROMPT_VERSION
+            )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} cached analyses."))
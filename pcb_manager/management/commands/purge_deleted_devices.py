@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from pcb_manager.purge import purge_deleted_devices
+
+
+class Command(BaseCommand):
+    help = (
+        "Removes deleted devices with their messages and files. Run it from a "
+        "scheduler when DEVICE_PURGE_INPROCESS is off; safe to run concurrently."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Devices per transaction (default DEVICE_PURGE_BATCH_SIZE).')
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_devices(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} deleted devices."))
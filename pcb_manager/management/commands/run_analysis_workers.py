@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from pcb_manager.jobs import AnalysisWorkerPool, requeue_stale_jobs, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Runs background PCB analysis workers that poll the AnalysisJob queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls when idle.')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Process every runnable job in this thread, then exit.',
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            requeue_stale_jobs()
+            processed = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} analysis jobs."))
+            return
+
+        pool = AnalysisWorkerPool(options['workers'], poll_interval=options['poll_interval'])
+        pool.start()
+        self.stdout.write(f"Started {options['workers']} analysis workers. Press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping analysis workers...")
+            pool.stop()
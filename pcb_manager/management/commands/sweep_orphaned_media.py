@@ -0,0 +1,80 @@
+import os
+import posixpath
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pcb_manager.models import AnalysisJob, Device
+from pcb_manager.purge import variant_dirs
+
+
+def _walk(root):
+    # (path, path relative to root with forward slashes) of every file under root
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            yield path, os.path.relpath(path, root).replace(os.sep, '/')
+
+
+def upload_dirs():
+    # The directories uploads are written into, e.g. 'images' and 'images/thumbs'
+    fields = [Device._meta.get_field('image'), Device._meta.get_field('thumbnail'),
+              AnalysisJob._meta.get_field('image')]
+    return {field.upload_to.strip('/') for field in fields}
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes uploaded images and thumbnails that no device or analysis job "
+        "refers to, and resized variants whose source image is not referenced. "
+        "Only the upload directories are swept, and names in MEDIA_SWEEP_KEEP are kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='Only delete files older than this many seconds; uploads are written before their row is saved.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the files without deleting them.')
+
+    def referenced_names(self):
+        names = set()
+        for image, thumbnail in Device.all_objects.values_list('image', 'thumbnail').iterator(chunk_size=5000):
+            names.update(name for name in (image, thumbnail) if name)
+        names.update(AnalysisJob.objects.exclude(image='').values_list('image', flat=True).iterator(chunk_size=5000))
+        return names
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_names()
+        cutoff = time.time() - options['min_age']
+        directories = upload_dirs()
+        keep = referenced | set(settings.MEDIA_SWEEP_KEEP)
+
+        def is_orphan(name):
+            # Files elsewhere under MEDIA_ROOT, like shipped assets, were not uploaded here
+            return posixpath.dirname(name) in directories and name not in keep
+
+        images_root = os.path.join(settings.MEDIA_ROOT, 'images')
+        orphans = [path for path, relative in _walk(images_root) if is_orphan(f'images/{relative}')]
+        for directory in variant_dirs():
+            orphans += [path for path, relative in _walk(directory) if is_orphan(f'images/{relative}')]
+
+        deleted = 0
+        freed = 0
+        for path in orphans:
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            deleted += 1
+            freed += stat.st_size
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {deleted} orphaned files ({freed / 1024 / 1024:.1f} MiB)."))
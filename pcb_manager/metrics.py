@@ -0,0 +1,77 @@
+import bisect
+import threading
+from collections import deque
+
+# Upper bounds, in seconds, of the latency buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """
+    Thread-safe latency histogram with fixed buckets plus a window of recent
+    samples for quantiles.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=256):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._recent.append(value)
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q, min_samples=1):
+        """
+        The q-quantile of the recent window, or None with fewer than min_samples.
+        """
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            count, total = self.count, self.sum
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "buckets": buckets,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class Counters:
+    """
+    Thread-safe named counters.
+    """
+
+    def __init__(self, *names):
+        self._values = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self._values, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_manager', '0007_chat_message_device_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='images/thumbs/'),
+        ),
+    ]
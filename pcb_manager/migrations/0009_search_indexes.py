@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Full-text search columns and indexes. PostgreSQL only: elsewhere search
+# falls back to icontains scans and these operations do nothing.
+# The tsvector columns are generated, so PostgreSQL keeps them current on
+# every insert and update without triggers or reindexing.
+FORWARD_SQL = [
+    """
+    ALTER TABLE pcb_manager_device ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(jsonb_to_tsvector('english', coalesce(components, '[]'::jsonb), '["string"]'), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX device_search_vector_idx ON pcb_manager_device USING GIN (search_vector)",
+    # For components @> '["ESP32"]' containment queries; dropped in 0016 once
+    # the component filter moved to the component catalog
+    "CREATE INDEX device_components_idx ON pcb_manager_device USING GIN (components jsonb_path_ops)",
+    """
+    ALTER TABLE pcb_manager_chatmessage ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED
+    """,
+    "CREATE INDEX chat_message_search_vector_idx ON pcb_manager_chatmessage USING GIN (search_vector)",
+]
+
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS chat_message_search_vector_idx",
+    "ALTER TABLE pcb_manager_chatmessage DROP COLUMN IF EXISTS search_vector",
+    "DROP INDEX IF EXISTS device_components_idx",
+    "DROP INDEX IF EXISTS device_search_vector_idx",
+    "ALTER TABLE pcb_manager_device DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run_on_postgresql(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_manager', '0008_device_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_on_postgresql(FORWARD_SQL), _run_on_postgresql(REVERSE_SQL)),
+    ]
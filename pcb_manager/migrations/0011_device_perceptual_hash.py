@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_manager', '0010_component'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_manager', '0012_deviceembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContextChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('description', 'Description'), ('message', 'Message')], max_length=20)),
+                ('text', models.TextField()),
+                ('model_name', models.CharField(max_length=255)),
+                ('vector', models.BinaryField()),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='context_chunks', to='pcb_manager.device')),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='context_chunks', to='pcb_manager.chatmessage')),
+            ],
+        ),
+    ]
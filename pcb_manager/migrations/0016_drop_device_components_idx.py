@@ -0,0 +1,27 @@
+from django.db import migrations
+
+# The component filter goes through the component catalog (Component.key and
+# the device links), so nothing queries components with @> any more and the
+# GIN index from 0009 was only slowing down device writes. PostgreSQL only,
+# like the migration that created it.
+FORWARD_SQL = "DROP INDEX IF EXISTS device_components_idx"
+REVERSE_SQL = "CREATE INDEX IF NOT EXISTS device_components_idx ON pcb_manager_device USING GIN (components jsonb_path_ops)"
+
+
+def _run_on_postgresql(statement):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pcb_manager', '0015_analysisjob_near_duplicate'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run_on_postgresql(FORWARD_SQL), _run_on_postgresql(REVERSE_SQL)),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from pydantic import BaseModel
 from typing import List
@@ -9,12 +10,33 @@ class PCBAnalysisResult(BaseModel):
     operating_voltage: str
     description: str
 
+class Component(models.Model):
+    # One row per distinct part across all devices; names are canonicalized
+    # (see pcb_manager.components) so spellings of the same part share a row
+    key = models.CharField(max_length=100, unique=True)
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+class ActiveDeviceManager(models.Manager):
+    # Soft-deleted devices are hidden from everything but the purge (see pcb_manager.purge)
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Device(models.Model):
     # Add user field to associate devices with users
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="devices")
     name = models.CharField(max_length=255, db_index=True)
     # ImageField handles file uploads and stores the path
     image = models.ImageField(upload_to='images/')
+    thumbnail = models.ImageField(upload_to='images/thumbs/', blank=True)
+    # 64-bit dHash of the image (stored signed), for near-duplicate detection
+    perceptual_hash = models.BigIntegerField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     # AI Analysis fields
@@ -22,22 +44,49 @@ class Device(models.Model):
     components = models.JSONField()
     operating_voltage = models.CharField(max_length=100)
     description = models.TextField()
+    # Normalized copy of `components`, kept in sync on save (see signals)
+    catalog_components = models.ManyToManyField(Component, blank=True, related_name="devices")
+    # Set when the device is deleted; the row and its files are removed later by the purge
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ActiveDeviceManager()
+    all_objects = models.Manager()
 
     class Meta:
         # Add ordering and unique constraint if needed
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's devices, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='device_user_created_idx'),
+            # Devices waiting for the purge
+            models.Index(fields=['deleted_at'], condition=models.Q(deleted_at__isnull=False), name='device_pending_purge_idx'),
+        ]
         # Optional: Ensure unique device names per user
         # unique_together = ['user', 'name']
 
     def __str__(self):
         return f"{self.name} ({self.user.username})"
 
-    # This method is useful for cleaning up the image file when a device is deleted
+    # This method is useful for cleaning up the image files when a device is deleted
     def delete(self, *args, **kwargs):
         if self.image:
             self.image.delete(save=False)  # delete file from storage
+        if self.thumbnail:
+            self.thumbnail.delete(save=False)
         super().delete(*args, **kwargs)
 
+class DeviceEmbedding(models.Model):
+    # float32 vector of the device's components and description, for similar
+    # device search (see pcb_manager.embeddings). Kept out of Device so device
+    # queries don't carry it.
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, primary_key=True, related_name="embedding")
+    model_name = models.CharField(max_length=255)
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Embedding of device {self.device_id} ({self.model_name})"
+
 class ChatMessage(models.Model):
     # The 'related_name' allows us to do device.chat_messages.all()
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="chat_messages")
@@ -47,6 +96,130 @@ class ChatMessage(models.Model):
 
     class Meta:
         ordering = ['created_at']  # Ensures history is always in order
+        indexes = [
+            # Latest-page, before=<id> and since=<id> reads of one device's history
+            models.Index(fields=['device', 'id'], name='chat_message_device_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} message for {self.device.name} by {self.device.user.username}"
+
+class ContextChunk(models.Model):
+    # A piece of a device's description or of one chat message, embedded for
+    # retrieving relevant context into chat prompts (see pcb_manager.retrieval)
+    DESCRIPTION = 'description'
+    MESSAGE = 'message'
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name="context_chunks")
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, null=True, blank=True, related_name="context_chunks")
+    source = models.CharField(max_length=20, choices=[(DESCRIPTION, 'Description'), (MESSAGE, 'Message')])
+    text = models.TextField()
+    model_name = models.CharField(max_length=255)
+    vector = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.source} chunk of device {self.device_id}"
+
+class AnalysisCacheEntry(models.Model):
+    # sha256 of the exact uploaded image bytes
+    content_hash = models.CharField(max_length=64)
+    model_name = models.CharField(max_length=100)
+    prompt_version = models.CharField(max_length=32)
+    result = models.JSONField()
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_hash', 'model_name', 'prompt_version'],
+                name='unique_analysis_cache_key',
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.model_name}, prompt {self.prompt_version})"
+
+
+class AnalysisJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="analysis_jobs")
+    name = models.CharField(max_length=255)
+    # The upload is kept here until the worker turns it into the device image
+    image = models.ImageField(upload_to='images/')
+    content_type = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    cache_hit = models.BooleanField(default=False)
+    # Analyze even if the image is a near-duplicate of one of the user's devices
+    reanalyze = models.BooleanField(default=False)
+    device = models.OneToOneField(
+        Device, on_delete=models.SET_NULL, null=True, blank=True, related_name="analysis_job"
+    )
+    # The existing device the image matched, and whether its analysis was reused
+    near_duplicate = models.ForeignKey(
+        Device, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    near_duplicate_distance = models.PositiveSmallIntegerField(null=True, blank=True)
+    near_duplicate_reused = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Earliest time a worker may pick the job up; pushed back on retries
+    available_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='analysis_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Analysis job {self.pk} ({self.status}) for {self.user.username}"
+
+
+class ConversationSummary(models.Model):
+    # Rolling summary of the chat messages that no longer fit in the prompt window
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, related_name="conversation_summary")
+    summary = models.TextField(blank=True)
+    # Messages with an id up to and including this one are folded into the summary
+    last_summarized_message_id = models.PositiveBigIntegerField(default=0)
+    summarized_messages = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Summary of {self.summarized_messages} messages for {self.device.name}"
+
+
+class UserStats(models.Model):
+    # Denormalized counters behind the stats endpoint, kept current by signals.
+    # A missing row is rebuilt from an aggregate query on first read.
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="pcb_stats")
+    device_count = models.PositiveIntegerField(default=0)
+    message_count = models.PositiveIntegerField(default=0)
+    low_complexity_count = models.PositiveIntegerField(default=0)
+    medium_complexity_count = models.PositiveIntegerField(default=0)
+    high_complexity_count = models.PositiveIntegerField(default=0)
+
+    # Device.complexity value -> counter field
+    COMPLEXITY_FIELDS = {
+        "Low": "low_complexity_count",
+        "Medium": "medium_complexity_count",
+        "High": "high_complexity_count",
+    }
 
     def __str__(self):
-        return f"{self.role} message for {self.device.name} by {self.device.user.username}"
\ No newline at end of file
+        return f"Stats for {self.user.username}"
@@ -0,0 +1,163 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import combinations
+
+from django.conf import settings
+
+from .models import Device
+
+HASH_BITS = 64
+
+
+def to_db_hash(value):
+    # Device.perceptual_hash is a signed bigint; keep the 64 bits, wrap the sign
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db_hash(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits, max_flips):
+    # Every mask of at most `max_flips` set bits within a `bits`-bit chunk
+    return tuple(
+        sum(1 << bit for bit in flipped)
+        for flips in range(max_flips + 1)
+        for flipped in combinations(range(bits), flips)
+    )
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes: each hash is filed under each of
+    its four 16-bit chunks. Two hashes within distance d differ in at most
+    ceil((d + 1) / 4) - 1 bits of some chunk (pigeonhole), so a lookup only
+    probes the chunk values that close to the query's and checks the few
+    hashes filed there, instead of walking the whole set.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+    CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+    def __init__(self):
+        self._tables = [{} for _ in range(self.CHUNKS)]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _chunks(self, key):
+        return ((key >> (index * self.CHUNK_BITS)) & self.CHUNK_MASK for index in range(self.CHUNKS))
+
+    def add(self, key, value):
+        self._size += 1
+        for table, chunk in zip(self._tables, self._chunks(key)):
+            table.setdefault(chunk, []).append((key, value))
+
+    def search(self, key, max_distance):
+        """
+        (distance, value) for every entry within `max_distance`, nearest first.
+        """
+        masks = _flip_masks(self.CHUNK_BITS, -(-(max_distance + 1) // self.CHUNKS) - 1)
+        seen = set()
+        matches = []
+        for table, chunk in zip(self._tables, self._chunks(key)):
+            for mask in masks:
+                for entry_key, value in table.get(chunk ^ mask, ()):
+                    if value in seen:
+                        continue
+                    seen.add(value)
+                    distance = (key ^ entry_key).bit_count()
+                    if distance <= max_distance:
+                        matches.append((distance, value))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class NearDuplicateIndex:
+    """
+    Per-process HammingIndexes of each user's device hashes, loaded on the user's
+    first lookup and topped up with newer devices (by id) on later ones, so
+    devices saved by other processes are picked up too. Deleted devices are
+    left in the index; callers check that a match still exists.
+    Holds the indexes of the NEAR_DUPLICATE_INDEX_MAX_USERS most recent users.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()  # user_id -> (HammingIndex, highest indexed device id)
+        self._lock = threading.Lock()
+
+    def _index(self, user_id):
+        with self._lock:
+            index, last_id = self._indexes.get(user_id, (None, 0))
+            if index is None:
+                index = HammingIndex()
+            new_rows = (
+                Device.objects.filter(user_id=user_id, id__gt=last_id, perceptual_hash__isnull=False)
+                .order_by('id').values_list('id', 'perceptual_hash')
+            )
+            for device_id, value in new_rows:
+                index.add(from_db_hash(value), device_id)
+                last_id = device_id
+            self._indexes[user_id] = (index, last_id)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > settings.NEAR_DUPLICATE_INDEX_MAX_USERS:
+                self._indexes.popitem(last=False)
+            return index
+
+    def find(self, user_id, value, max_distance):
+        """
+        [(distance, device_id)] of the user's devices whose hash is within
+        `max_distance` bits of `value`, nearest first.
+        """
+        return self._index(user_id).search(value, max_distance)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+near_duplicate_index = NearDuplicateIndex()
+
+
+def find_near_duplicate(user, value):
+    """
+    The user's closest existing device to an image with perceptual hash
+    `value`, as (device, distance), or None.
+    """
+    if not settings.NEAR_DUPLICATE_DETECTION or value is None:
+        return None
+    matches = near_duplicate_index.find(user.pk, value, settings.NEAR_DUPLICATE_MAX_DISTANCE)
+    if not matches:
+        return None
+    devices = Device.objects.filter(user=user).in_bulk([device_id for _, device_id in matches])
+    for distance, device_id in matches:
+        if device_id in devices:
+            return devices[device_id], distance
+    return None
+
+
+ANALYSIS_FIELDS = ("components", "operating_voltage", "complexity", "description")
+
+
+def reuse_near_duplicate(user, value, reanalyze=False):
+    """
+    Looks up the user's closest existing device to an image with perceptual
+    hash `value`. Returns (near_duplicate, analysis): the match as
+    (device, distance) or None, and the analysis to give the new device
+    instead of asking the LLM, copied from the match, or None when there is
+    no match, NEAR_DUPLICATE_REUSE is off or the caller asked to `reanalyze`.
+    """
+    near_duplicate = find_near_duplicate(user, value)
+    if near_duplicate is None or not settings.NEAR_DUPLICATE_REUSE or reanalyze:
+        return near_duplicate, None
+    return near_duplicate, {field: getattr(near_duplicate[0], field) for field in ANALYSIS_FIELDS}
+
+
+def describe_near_duplicate(near_duplicate, reused):
+    # The `near_duplicate` entry of analysis responses
+    device, distance = near_duplicate
+    return {"device_id": device.id, "distance": distance, "reused": reused}
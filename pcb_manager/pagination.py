@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DeviceCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's devices, newest first. The cursor encodes
+    the last seen created_at, so each page is an index range scan on
+    device_user_created_idx instead of an OFFSET.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at', '-id')
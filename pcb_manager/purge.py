@@ -0,0 +1,148 @@
+import logging
+import os
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .models import Device, UserStats
+from .response_cache import DEVICES, MESSAGES, bump_user_cache_version
+from .stats import rebuild_user_stats
+
+logger = logging.getLogger(__name__)
+
+
+# --- Soft delete ---
+# Deleting devices only sets deleted_at, in one UPDATE, which hides them from
+# the default manager at once. The purge below removes the rows (cascading to
+# their messages and other rows) and their files later, in batches.
+
+def soft_delete_devices(user, devices):
+    """
+    Marks the user's devices in the `devices` queryset as deleted and starts
+    the background purge. Returns the number of devices marked.
+    """
+    with transaction.atomic():
+        count = devices.filter(user=user).update(deleted_at=timezone.now())
+        if count:
+            # The UPDATE bypasses the model signals, so do their bookkeeping here
+            if settings.USER_STATS_DENORMALIZED and UserStats.objects.filter(user=user).exists():
+                rebuild_user_stats(user.pk)
+            bump_user_cache_version(user.pk, DEVICES, MESSAGES)
+            transaction.on_commit(ensure_purge_started)
+    return count
+
+
+# --- Media files ---
+
+def variant_dirs():
+    # One directory of resized copies per width, mirroring the layout under images/
+    try:
+        return [entry.path for entry in os.scandir(settings.MEDIA_VARIANT_ROOT) if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
+def variant_paths(name, directories):
+    """
+    Paths of the resized copies of stored image `name` that the media view
+    may have written, one per width directory.
+    """
+    relative = os.path.relpath(os.path.join(settings.MEDIA_ROOT, name), os.path.join(settings.MEDIA_ROOT, 'images'))
+    if relative.startswith(os.pardir):
+        return []
+    return [os.path.join(directory, relative) for directory in directories]
+
+
+def delete_media(names):
+    """
+    Deletes stored files and their resized variants. Files that are already
+    gone are skipped; other failures are logged and left to
+    `manage.py sweep_orphaned_media`.
+    """
+    directories = variant_dirs()
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError as e:
+            logger.warning(f"Could not delete media file {name}: {str(e)}")
+        for path in variant_paths(name, directories):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete media variant {path}: {str(e)}")
+
+
+# --- Purge ---
+
+def purge_deleted_devices(batch_size=None, max_batches=None):
+    """
+    Removes soft-deleted devices DEVICE_PURGE_BATCH_SIZE at a time: each
+    batch's rows in one transaction, then their image and thumbnail files.
+    Returns the number of devices purged.
+    """
+    batch_size = batch_size or settings.DEVICE_PURGE_BATCH_SIZE
+    purged = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            # skip_locked lets several purging processes share the backlog
+            batch = list(
+                Device.all_objects.select_for_update(skip_locked=True)
+                .filter(deleted_at__isnull=False).order_by('id')
+                .values_list('id', 'image', 'thumbnail')[:batch_size]
+            )
+            if not batch:
+                break
+            Device.all_objects.filter(id__in=[device_id for device_id, _, _ in batch]).delete()
+        # Files go only once the rows are gone; a crash in between leaves orphans for the sweep
+        delete_media([name for _, image, thumbnail in batch for name in (image, thumbnail) if name])
+        purged += len(batch)
+        batches += 1
+    return purged
+
+
+_purge_lock = threading.Lock()
+_purge_thread = None
+_purge_requested = False
+
+
+def _purge_in_background():
+    global _purge_thread, _purge_requested
+    while True:
+        with _purge_lock:
+            if not _purge_requested:
+                _purge_thread = None
+                break
+            _purge_requested = False
+        try:
+            purged = purge_deleted_devices()
+            if purged:
+                logger.info(f"Purged {purged} deleted devices")
+        except Exception:
+            logger.error(traceback.format_exc())
+        finally:
+            close_old_connections()
+    connections.close_all()
+
+
+def ensure_purge_started():
+    """
+    Runs the purge in a background thread of this process, when
+    DEVICE_PURGE_INPROCESS is on. A purge already running picks up the newly
+    deleted devices before it stops. Deployments that run
+    `manage.py purge_deleted_devices` separately should turn it off.
+    """
+    global _purge_thread, _purge_requested
+    if not settings.DEVICE_PURGE_INPROCESS:
+        return
+    with _purge_lock:
+        _purge_requested = True
+        if _purge_thread is None:
+            _purge_thread = threading.Thread(target=_purge_in_background, name="device-purge", daemon=True)
+            _purge_thread.start()
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+# Cached read responses are keyed on per-user version numbers, one per scope of
+# data they depend on. Writes bump the version instead of deleting keys, so a
+# stale entry simply stops being addressed and ages out of the cache.
+DEVICES = 'devices'
+MESSAGES = 'messages'
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(user_id, scope):
+    return f"pcb:version:{scope}:{user_id}"
+
+
+def _bump(user_id, scopes):
+    cache = _cache()
+    for scope in scopes:
+        key = _version_key(user_id, scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Never seen or evicted: start from the clock so old versions are not reused
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_user_cache_version(user_id, *scopes):
+    """
+    Invalidates the user's cached responses that depend on `scopes`.
+
+    Bumps now, so the writing request reads its own changes, and again on
+    commit, so a concurrent reader cannot cache pre-commit data under the new
+    version. Call it after bulk operations that bypass model signals.
+    """
+    _bump(user_id, scopes)
+    transaction.on_commit(lambda: _bump(user_id, scopes))
+
+
+def _versions(user_id, scopes):
+    cache = _cache()
+    keys = [_version_key(user_id, scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        # add() so concurrent first requests agree on one starting version
+        for key, value in missing.items():
+            cache.add(key, value, None)
+        versions.update(cache.get_many(list(missing)))
+    return ':'.join(str(versions.get(key, 0)) for key in keys)
+
+
+class ResponseCacheStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else None,
+            }
+
+
+response_cache_stats = ResponseCacheStats()
+
+
+def cache_user_response(*scopes):
+    """
+    Caches successful responses of a read-only DRF view per user and URL,
+    until one of `scopes` changes for that user or RESPONSE_CACHE_TIMEOUT
+    passes. Apply it below @api_view/@permission_classes.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def view(request, *args, **kwargs):
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+            if not timeout or not request.user.is_authenticated:
+                return func(request, *args, **kwargs)
+
+            url_hash = hashlib.sha256(request.build_absolute_uri().encode('utf-8')).hexdigest()
+            key = f"pcb:response:{func.__name__}:{request.user.pk}:{_versions(request.user.pk, scopes)}:{url_hash}"
+            cached = _cache().get(key)
+            response_cache_stats.record(cached is not None)
+            if cached is not None:
+                response = Response(cached)
+                response['X-Response-Cache'] = 'hit'
+                return response
+
+            response = func(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                _cache().set(key, response.data, timeout)
+            response['X-Response-Cache'] = 'miss'
+            return response
+
+        return view
+
+    return decorator
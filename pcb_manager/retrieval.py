@@ -0,0 +1,173 @@
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .embeddings import EmbeddingIndex, embed_text, embedding_model_name
+from .models import ChatMessage, ContextChunk
+
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+# --- Chunking ---
+# Device descriptions and chat messages are split into ContextChunks of at
+# most CHAT_RETRIEVAL_CHUNK_CHARS and embedded with EMBEDDING_FUNCTION.
+# Chunks are written when a message is stored or a description changes (see
+# signals); `manage.py backfill_context_chunks` covers older rows.
+
+def split_text(text, max_chars):
+    """
+    Splits text into pieces of at most max_chars, breaking between sentences
+    or lines where possible.
+    """
+    pieces = []
+    current = ''
+    for sentence in SENTENCE_BREAK_RE.split(text.strip()):
+        sentence = ' '.join(sentence.split())
+        while len(sentence) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ''
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def build_chunks(device, source, text, message=None):
+    model_name = embedding_model_name()
+    return [
+        ContextChunk(
+            device=device, message=message, source=source, text=piece, model_name=model_name,
+            vector=embed_text(piece).tobytes(),
+        )
+        for piece in split_text(text or '', settings.CHAT_RETRIEVAL_CHUNK_CHARS)
+    ]
+
+
+def _store_chunks(chunks):
+    ContextChunk.objects.bulk_create(chunks, batch_size=500)
+    for chunk in chunks:
+        chunk_index.update(chunk.device.user_id, chunk.pk, np.frombuffer(chunk.vector, dtype=np.float32))
+
+
+def index_message(message):
+    _store_chunks(build_chunks(message.device, ContextChunk.MESSAGE, message.content, message))
+
+
+def index_descriptions(devices):
+    """
+    Replaces the description chunks of `devices`.
+    """
+    stale = list(
+        ContextChunk.objects.filter(device__in=devices, source=ContextChunk.DESCRIPTION)
+        .values_list('id', 'device__user_id')
+    )
+    if stale:
+        ContextChunk.objects.filter(id__in=[chunk_id for chunk_id, _ in stale]).delete()
+        for chunk_id, user_id in stale:
+            chunk_index.remove(user_id, chunk_id)
+    _store_chunks([
+        chunk for device in devices for chunk in build_chunks(device, ContextChunk.DESCRIPTION, device.description)
+    ])
+
+
+def rebuild_chunks(devices):
+    """
+    Replaces all chunks of `devices`: descriptions and chat messages.
+    """
+    devices_by_id = {device.pk: device for device in devices}
+    ContextChunk.objects.filter(device__in=devices).delete()
+    chunks = [
+        chunk for device in devices for chunk in build_chunks(device, ContextChunk.DESCRIPTION, device.description)
+    ]
+    for message in ChatMessage.objects.filter(device__in=devices).only('id', 'device_id', 'content'):
+        chunks += build_chunks(devices_by_id[message.device_id], ContextChunk.MESSAGE, message.content, message)
+    _store_chunks(chunks)
+
+
+# --- Retrieval ---
+
+def _chunk_vector_rows(user_id, after_id, model_name):
+    return (
+        ContextChunk.objects.filter(device__user_id=user_id, id__gt=after_id, model_name=model_name)
+        .order_by('id').values_list('id', 'vector')
+    )
+
+
+# All chunks of a user, searched for context from their other devices
+chunk_index = EmbeddingIndex(_chunk_vector_rows)
+
+
+def retrieve_context(device, question, exclude_messages=(), other_devices=False):
+    """
+    [(chunk, score)] of the chunks most relevant to `question`, best first:
+    up to CHAT_RETRIEVAL_TOP_K from this device's description and earlier
+    messages (except those of `exclude_messages`, already in the prompt) and,
+    with `other_devices`, up to CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K from the
+    user's other devices. Chunks scoring below CHAT_RETRIEVAL_MIN_SCORE are
+    left out.
+    """
+    vector = embed_text(question)
+    min_score = settings.CHAT_RETRIEVAL_MIN_SCORE
+    exclude_messages = set(exclude_messages)
+
+    # This device's chunks are few enough to score straight from the database
+    rows = list(
+        ContextChunk.objects.filter(device=device, model_name=embedding_model_name())
+        .values_list('id', 'message_id', 'vector')
+    )
+    own_ids = [chunk_id for chunk_id, _, _ in rows]
+    candidates = [(chunk_id, vector_bytes) for chunk_id, message_id, vector_bytes in rows
+                  if message_id not in exclude_messages]
+    matches = []
+    if candidates:
+        matrix = np.frombuffer(b''.join(vector_bytes for _, vector_bytes in candidates), dtype=np.float32)
+        scores = matrix.reshape(len(candidates), -1) @ vector
+        best = np.argsort(-scores)[:settings.CHAT_RETRIEVAL_TOP_K]
+        matches = [(candidates[i][0], float(scores[i])) for i in best if scores[i] >= min_score]
+
+    other_matches = []
+    if other_devices and settings.CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K > 0:
+        # A few spares for chunks another process has deleted since the index was loaded
+        other_k = settings.CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K
+        other_matches = [
+            (chunk_id, score)
+            for chunk_id, score in chunk_index.search(device.user_id, vector, other_k + 5, exclude=own_ids)
+            if score >= min_score
+        ]
+
+    chunks = (
+        ContextChunk.objects.filter(device__user_id=device.user_id, device__deleted_at__isnull=True)
+        .select_related('device')
+        .in_bulk([chunk_id for chunk_id, _ in matches + other_matches])
+    )
+    results = [(chunks[chunk_id], score) for chunk_id, score in matches if chunk_id in chunks]
+    others = []
+    for chunk_id, score in other_matches:
+        if chunk_id not in chunks:
+            chunk_index.remove(device.user_id, chunk_id)
+        elif chunks[chunk_id].device_id != device.pk:
+            others.append((chunks[chunk_id], score))
+    results += others[:settings.CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K]
+    results.sort(key=lambda result: -result[1])
+    return results
+
+
+def format_snippet(device, chunk):
+    if chunk.device_id != device.pk:
+        origin = f'your board "{chunk.device.name}"'
+        origin += ', description' if chunk.source == ContextChunk.DESCRIPTION else ', earlier chat'
+    elif chunk.source == ContextChunk.DESCRIPTION:
+        origin = 'device description'
+    else:
+        origin = 'earlier in this chat'
+    return f"- ({origin}) {chunk.text}"
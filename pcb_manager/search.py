@@ -0,0 +1,63 @@
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .components import component_key
+from .models import ChatMessage, Device
+
+# Text search configuration of the search_vector columns (migration 0009)
+SEARCH_CONFIG = 'english'
+
+
+def full_text_available():
+    # The tsvector columns and GIN indexes only exist on PostgreSQL
+    return connection.vendor == 'postgresql'
+
+
+def _search_vector(model):
+    from django.contrib.postgres.search import SearchVectorField
+
+    # A generated column the ORM doesn't know about, so reference it directly
+    return RawSQL(f'"{model._meta.db_table}"."search_vector"', [], output_field=SearchVectorField())
+
+
+def _ranked(queryset, text):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    vector = _search_vector(queryset.model)
+    return (
+        queryset.alias(search_vector=vector)
+        .filter(search_vector=query)
+        .annotate(rank=SearchRank(vector, query))
+        .order_by('-rank', '-created_at')
+    )
+
+
+def search_devices(user, text=None, component=None):
+    """
+    The user's devices matching `text` (name, components and description) and
+    containing `component` in their component list, best matches first.
+    `component` goes through the component catalog, so any spelling or alias
+    of a part finds it.
+    """
+    devices = Device.objects.filter(user=user)
+    if component:
+        devices = devices.filter(catalog_components__key=component_key(component))
+    if not text:
+        return devices.order_by('-created_at', '-id')
+    if full_text_available():
+        return _ranked(devices, text)
+    return devices.filter(
+        Q(name__icontains=text) | Q(description__icontains=text) | Q(components__icontains=text)
+    ).order_by('-created_at', '-id')
+
+
+def search_messages(user, text):
+    """
+    Chat messages on the user's devices matching `text`, best matches first.
+    """
+    messages = ChatMessage.objects.filter(device__user=user, device__deleted_at__isnull=True)
+    if full_text_available():
+        return _ranked(messages, text)
+    return messages.filter(content__icontains=text).order_by('-created_at', '-id')
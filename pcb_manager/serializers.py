@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Device, ChatMessage
+from .models import Device, ChatMessage, AnalysisJob
+from .instrumentation import TimedSerializerMixin
 
 # --- Analysis Schemas ---
 # This is a plain Serializer, not a ModelSerializer, because it doesn't
@@ -10,33 +11,92 @@ class AnalysisResultSerializer(serializers.Serializer):
     operating_voltage = serializers.CharField(max_length=50)
     description = serializers.CharField()
 
+# --- Request metrics ---
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
 # --- Chat Message Schemas ---
-class ChatMessageSerializer(serializers.ModelSerializer):
+class ChatMessageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
         fields = ['id', 'role', 'content', 'created_at', 'device_id']
+        list_serializer_class = TimedListSerializer
 
 # --- Device Schemas ---
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an optional `fields` argument restricting
+    which of its fields are serialized.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
 # Corresponds to FastAPI's DeviceResponse
-class DeviceResponseSerializer(serializers.ModelSerializer):
+class DeviceResponseSerializer(TimedSerializerMixin, DynamicFieldsModelSerializer):
     class Meta:
         model = Device
+        list_serializer_class = TimedListSerializer
         fields = [
-            'id', 'name', 'image', 'created_at', 'complexity',
+            'id', 'name', 'image', 'thumbnail', 'created_at', 'complexity',
             'components', 'operating_voltage', 'description',
             'user'
         ]
-        read_only_fields = ['user']
+        read_only_fields = ['user', 'thumbnail']
 
 # Corresponds to FastAPI's DeviceWithMessages
-class DeviceWithMessagesSerializer(serializers.ModelSerializer):
-    # This nests the ChatMessageSerializer, automatically fetching
-    # related messages via the 'chat_messages' related_name.
-    chat_messages = ChatMessageSerializer(many=True, read_only=True)
+class DeviceWithMessagesSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # The view passes one page of messages as context['chat_messages'];
+    # without it the complete history is nested.
+    chat_messages = serializers.SerializerMethodField()
 
     class Meta:
         model = Device
         fields = [
-            'id', 'name', 'image', 'created_at', 'complexity',
+            'id', 'name', 'image', 'thumbnail', 'created_at', 'complexity',
             'components', 'operating_voltage', 'description', 'chat_messages'
-        ]
\ No newline at end of file
+        ]
+
+    def get_chat_messages(self, device):
+        messages = self.context.get('chat_messages')
+        if messages is None:
+            messages = device.chat_messages.all()
+        return ChatMessageSerializer(messages, many=True).data
+
+
+# --- Analysis Job Schemas ---
+class AnalysisJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    device = DeviceResponseSerializer(read_only=True)
+    queue_seconds = serializers.SerializerMethodField()
+    run_seconds = serializers.SerializerMethodField()
+    near_duplicate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AnalysisJob
+        fields = [
+            'id', 'name', 'status', 'attempts', 'error', 'cache_hit', 'near_duplicate', 'device',
+            'created_at', 'started_at', 'finished_at', 'queue_seconds', 'run_seconds'
+        ]
+
+    def get_queue_seconds(self, job):
+        if job.started_at is None:
+            return None
+        return round((job.started_at - job.created_at).total_seconds(), 3)
+
+    def get_near_duplicate(self, job):
+        if job.near_duplicate_id is None:
+            return None
+        return {
+            "device_id": job.near_duplicate_id,
+            "distance": job.near_duplicate_distance,
+            "reused": job.near_duplicate_reused,
+        }
+
+    def get_run_seconds(self, job):
+        if job.started_at is None or job.finished_at is None or job.finished_at < job.started_at:
+            return None
+        return round((job.finished_at - job.started_at).total_seconds(), 3)
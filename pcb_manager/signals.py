@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .chat_cache import chat_response_cache
+from .components import link_components
+from .embeddings import embedding_index, save_embeddings
+from .models import ChatMessage, Device, UserStats
+from .response_cache import DEVICES, MESSAGES, bump_user_cache_version
+from .retrieval import index_descriptions, index_message
+from .stats import rebuild_user_stats
+
+
+# --- Denormalized UserStats counters ---
+# Only rows that already exist are updated; a missing row is rebuilt from an
+# aggregate on the next stats read. Chat messages are only ever deleted through
+# their device, so message counts are adjusted from the Device delete signals.
+# (A ChatMessage post_delete receiver would also stop Django from fast-deleting
+# the cascaded messages.) Soft-deleted devices were already taken out of the
+# counters and response caches when they were marked, so purging them skips both.
+
+def _adjust_user_stats(user_id, **deltas):
+    UserStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + Value(delta), Value(0)) for field, delta in deltas.items()
+    })
+
+
+def _device_deltas(device, sign):
+    deltas = {'device_count': sign}
+    complexity_field = UserStats.COMPLEXITY_FIELDS.get(device.complexity)
+    if complexity_field:
+        deltas[complexity_field] = sign
+    return deltas
+
+
+@receiver(post_save, sender=Device)
+def count_saved_device(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not settings.USER_STATS_DENORMALIZED:
+        return
+    if created:
+        _adjust_user_stats(instance.user_id, **_device_deltas(instance, 1))
+    elif update_fields is None or 'complexity' in update_fields:
+        # Complexity may have changed; edits are rare, so recount instead of tracking the old value
+        if UserStats.objects.filter(user_id=instance.user_id).exists():
+            rebuild_user_stats(instance.user_id)
+
+
+@receiver(pre_delete, sender=Device)
+def remember_message_count(sender, instance, **kwargs):
+    if settings.USER_STATS_DENORMALIZED and instance.deleted_at is None:
+        instance._stats_message_count = instance.chat_messages.count()
+
+
+@receiver(post_delete, sender=Device)
+def count_deleted_device(sender, instance, **kwargs):
+    if not settings.USER_STATS_DENORMALIZED or instance.deleted_at is not None:
+        return
+    deltas = _device_deltas(instance, -1)
+    deltas['message_count'] = -getattr(instance, '_stats_message_count', 0)
+    _adjust_user_stats(instance.user_id, **deltas)
+
+
+@receiver(post_save, sender=ChatMessage)
+def count_new_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and settings.USER_STATS_DENORMALIZED:
+        _adjust_user_stats(instance.device.user_id, message_count=1)
+
+
+# --- Response cache versions ---
+# Device deletes cascade to their messages, so they bump both scopes.
+
+@receiver(post_save, sender=Device)
+def expire_device_responses(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_cache_version(instance.user_id, DEVICES)
+
+
+@receiver(post_delete, sender=Device)
+def expire_deleted_device_responses(sender, instance, **kwargs):
+    if instance.deleted_at is None:
+        bump_user_cache_version(instance.user_id, DEVICES, MESSAGES)
+
+
+@receiver(post_save, sender=ChatMessage)
+def expire_message_responses(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_user_cache_version(instance.device.user_id, MESSAGES)
+
+
+# --- Component catalog ---
+# bulk_create skips this, so bulk paths call link_components themselves.
+
+@receiver(post_save, sender=Device)
+def link_device_components(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and (created or update_fields is None or 'components' in update_fields):
+        link_components([instance])
+
+
+# --- Device embeddings ---
+# bulk_create skips these too; bulk paths call save_embeddings themselves.
+
+EMBEDDED_FIELDS = {'components', 'description'}
+
+
+@receiver(post_save, sender=Device)
+def embed_saved_device(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if not raw and (created or update_fields is None or EMBEDDED_FIELDS & set(update_fields)):
+        save_embeddings([instance])
+
+
+@receiver(post_delete, sender=Device)
+def unindex_deleted_device(sender, instance, **kwargs):
+    embedding_index.remove(instance.user_id, instance.pk)
+
+
+# --- Chat retrieval chunks ---
+# Deleted devices and messages take their chunks with them (cascade); the
+# chunk index drops those lazily. bulk_create paths call index_descriptions.
+
+@receiver(post_save, sender=Device)
+def chunk_device_description(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or not settings.CHAT_RETRIEVAL_ENABLED:
+        return
+    if created or update_fields is None or 'description' in update_fields:
+        index_descriptions([instance])
+
+
+@receiver(post_save, sender=ChatMessage)
+def chunk_new_message(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and settings.CHAT_RETRIEVAL_ENABLED:
+        index_message(instance)
+
+
+# --- Chat response cache ---
+# Cached answers are tied to the device's fingerprint and stop matching after
+# any edit; these just free them straight away in this process.
+
+@receiver(post_save, sender=Device)
+def forget_saved_device_answers(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        chat_response_cache.invalidate_device(instance.pk)
+
+
+@receiver(post_delete, sender=Device)
+def forget_deleted_device_answers(sender, instance, **kwargs):
+    chat_response_cache.invalidate_device(instance.pk)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Device, UserStats
+
+STAT_FIELDS = [
+    'device_count', 'message_count',
+    'low_complexity_count', 'medium_complexity_count', 'high_complexity_count',
+]
+
+
+def aggregate_user_stats(user):
+    """
+    Computes every counter for a user in a single query.
+    """
+    complexity_counts = {
+        field: Count('id', filter=Q(complexity=complexity), distinct=True)
+        for complexity, field in UserStats.COMPLEXITY_FIELDS.items()
+    }
+    return Device.objects.filter(user=user).aggregate(
+        device_count=Count('id', distinct=True),
+        message_count=Count('chat_messages'),
+        **complexity_counts,
+    )
+
+
+def rebuild_user_stats(user_id):
+    """
+    Recomputes a user's denormalized counters from scratch.
+    """
+    totals = aggregate_user_stats(user_id)
+    UserStats.objects.update_or_create(user_id=user_id, defaults=totals)
+    return totals
+
+
+def get_user_stats_counts(user):
+    """
+    Returns the counters for the stats endpoint: a single-row lookup when
+    USER_STATS_DENORMALIZED is on, otherwise one aggregate query.
+    """
+    if not settings.USER_STATS_DENORMALIZED:
+        return aggregate_user_stats(user)
+
+    stats = UserStats.objects.filter(user=user).values(*STAT_FIELDS).first()
+    if stats is None:
+        # First read, or rows created with bulk_create: rebuild once, then keep
+        # incrementally. The row exists before counting, so the signals' updates
+        # for anything created meanwhile land on it instead of being lost.
+        UserStats.objects.get_or_create(user=user)
+        with transaction.atomic():
+            row = UserStats.objects.select_for_update().get(user=user)
+            stats = aggregate_user_stats(user)
+            for field, value in stats.items():
+                setattr(row, field, value)
+            row.save(update_fields=STAT_FIELDS)
+    return stats
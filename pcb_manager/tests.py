@@ -1,3 +1,2027 @@
-# from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+from unittest.mock import patch, AsyncMock, MagicMock
+import numpy as np
+from PIL import Image
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+
+from accounts.authentication import token_cache
+from pcb_manager import jobs, llm
+from pcb_manager.analysis import analysis_metrics, extract_json
+from pcb_manager.analysis_cache import AnalysisCache, analysis_cache, hash_image_bytes
+from pcb_manager.components import canonicalize_components, component_key
+from pcb_manager.chat_cache import chat_cache_metrics, chat_response_cache, is_follow_up, normalize_question
+from pcb_manager.chat_context import estimate_prompt_tokens, split_history
+from pcb_manager.images import dhash, prepare_image
+from pcb_manager.llm_router import CircuitBreaker, LLMBackend, LLMRouter, LLMUnavailable
+from pcb_manager.near_duplicates import HammingIndex, from_db_hash, near_duplicate_index, to_db_hash
+from pcb_manager.instrumentation import request_metrics
+from pcb_manager.embeddings import UserVectors, embed_device, embedding_index
+from pcb_manager.jobs import claim_next_job, job_metrics, run_job, run_pending_jobs
+from pcb_manager.purge import ensure_purge_started, purge_deleted_devices
+from pcb_manager.response_cache import response_cache_stats
+from pcb_manager.retrieval import chunk_index, split_text
+from pcb_manager.models import (
+    PCBAnalysisResult, AnalysisCacheEntry, AnalysisJob, ChatMessage, Component, ContextChunk, ConversationSummary,
+    Device, DeviceEmbedding, UserStats,
+)
+from pcb_manager.stats import aggregate_user_stats
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+ANALYSIS_JSON = json.dumps({
+    "complexity": "Medium",
+    "components": ["ESP32", "AMS1117"],
+    "operating_voltage": "3.3V",
+    "description": "A small microcontroller board.",
+})
+
+
+def make_image_bytes(color=(0, 128, 0), size=(64, 64), fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def make_upload(color=(0, 128, 0), name='board.png'):
+    return SimpleUploadedFile(name, make_image_bytes(color), content_type='image/png')
+
+
+class AuthenticatedAPITestCase(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='tech', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        token_cache.clear()
+        cache.clear()
+        near_duplicate_index.clear()
+        embedding_index.clear()
+        chunk_index.clear()
+        chat_response_cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+
+# ------------ Analysis cache ------------
+# Plain-colour test images are all perceptual near-duplicates of each other
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, NEAR_DUPLICATE_DETECTION=False)
+class AnalysisCacheTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-analyze-save')
+        analysis_cache.invalidate()
+        analysis_cache.hits = analysis_cache.db_hits = analysis_cache.misses = 0
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_repeat_upload_skips_llm(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+
+        first = self.client.post(self.url, {'image': make_upload(), 'name': 'one'}, format='multipart')
+        second = self.client.post(self.url, {'image': make_upload(), 'name': 'two'}, format='multipart')
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(first['X-Analysis-Cache'], 'miss')
+        self.assertEqual(second['X-Analysis-Cache'], 'hit')
+        self.assertEqual(mock_llm.ainvoke.await_count, 1)
+        self.assertEqual(second.json()['components'], ["ESP32", "AMS1117"])
+        self.assertEqual(Device.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(analysis_cache.stats()['hits'], 1)
+        self.assertEqual(analysis_cache.stats()['misses'], 1)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_different_image_is_a_miss(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+
+        self.client.post(self.url, {'image': make_upload((0, 0, 0))}, format='multipart')
+        self.client.post(self.url, {'image': make_upload((255, 255, 255))}, format='multipart')
+
+        self.assertEqual(mock_llm.ainvoke.await_count, 2)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_invalid_analysis_is_not_cached(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=json.dumps({"complexity": "Low"})))
+
+        response = self.client.post(self.url, {'image': make_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AnalysisCacheEntry.objects.exists())
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_key_is_the_uploaded_file(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        upload = make_image_bytes()
+
+        self.client.post(self.url, {'image': SimpleUploadedFile('a.png', upload, 'image/png')}, format='multipart')
+        # Re-encoding the copy sent to the model does not split the cache
+        with override_settings(ANALYSIS_IMAGE_MAX_EDGE=32):
+            second = self.client.post(
+                self.url, {'image': SimpleUploadedFile('b.png', upload, 'image/png')}, format='multipart'
+            )
+
+        self.assertEqual(second['X-Analysis-Cache'], 'hit')
+        self.assertEqual(AnalysisCacheEntry.objects.get().content_hash, hash_image_bytes(upload))
+
+    @override_settings(LLM_BACKENDS=[
+        {"name": "primary", "provider": "openai", "model": "primary-model"},
+        {"name": "fallback", "provider": "openai", "model": "fallback-model"},
+    ])
+    def test_failover_answer_is_cached_under_the_answering_model(self):
+        primary = MagicMock(ainvoke=AsyncMock(side_effect=Exception("down")))
+        fallback = MagicMock(ainvoke=AsyncMock(return_value=AIMessage(content=ANALYSIS_JSON)))
+        router = LLMRouter([
+            LLMBackend('primary', primary, 'primary-model', 5, CircuitBreaker()),
+            LLMBackend('fallback', fallback, 'fallback-model', 5, CircuitBreaker()),
+        ])
+
+        with patch('pcb_manager.llm.primary_llm', router):
+            first = self.client.post(self.url, {'image': make_upload()}, format='multipart')
+            second = self.client.post(self.url, {'image': make_upload()}, format='multipart')
+
+        self.assertEqual(first['X-Analysis-Cache'], 'miss')
+        self.assertEqual(second['X-Analysis-Cache'], 'hit')
+        self.assertEqual(fallback.ainvoke.await_count, 1)
+        self.assertEqual(AnalysisCacheEntry.objects.get().model_name, 'fallback-model')
+
+    def test_db_layer_survives_lru_eviction(self):
+        cache = AnalysisCache(max_entries=1)
+        first = (hash_image_bytes(b'first'), 'model', 'v1')
+        second = (hash_image_bytes(b'second'), 'model', 'v1')
+        cache.set(first, {"complexity": "Low"})
+        cache.set(second, {"complexity": "High"})
+
+        self.assertEqual(cache.stats()['lru_size'], 1)
+        self.assertEqual(cache.get(first), {"complexity": "Low"})
+        self.assertEqual(cache.stats()['db_hits'], 1)
+
+    def test_invalidate_drops_other_model_and_prompt_versions(self):
+        cache = AnalysisCache()
+        content_hash = hash_image_bytes(b'board')
+        cache.set((content_hash, 'old-model', 'v1'), {})
+        cache.set((content_hash, 'new-model', 'v1'), {})
+        cache.set((content_hash, 'new-model', 'v2'), {})
+
+        deleted = cache.invalidate(model_names=['new-model'], prompt_version='v2')
+
+        self.assertEqual(deleted, 2)
+        self.assertIsNone(cache.get((content_hash, 'new-model', 'v1')))
+        self.assertIsNotNone(cache.get((content_hash, 'new-model', 'v2')))
+
+
+# ------------ Background analysis jobs ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    ANALYSIS_JOB_INPROCESS_WORKERS=0,
+    ANALYSIS_JOB_MAX_ATTEMPTS=2,
+    ANALYSIS_JOB_MAX_RUNNING_PER_USER=1,
+    ANALYSIS_JOB_MAX_PENDING_PER_USER=3,
+)
+class AnalysisJobTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-analyze-enqueue')
+        analysis_cache.invalidate()
+
+    def enqueue(self, color=(0, 128, 0), name='queued board'):
+        return self.client.post(self.url, {'image': make_upload(color), 'name': name}, format='multipart')
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_enqueue_returns_202_and_worker_fills_device(self, mock_llm):
+        mock_llm.invoke.return_value = MagicMock(content=ANALYSIS_JSON)
+
+        response = self.enqueue()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], AnalysisJob.QUEUED)
+        mock_llm.invoke.assert_not_called()
+
+        self.assertEqual(run_pending_jobs(), 1)
+
+        job_response = self.client.get(reverse('analysis-job-detail', args=[response.data['id']]))
+        self.assertEqual(job_response.data['status'], AnalysisJob.SUCCEEDED)
+        self.assertEqual(job_response.data['device']['name'], 'queued board')
+        self.assertIsNotNone(job_response.data['run_seconds'])
+        self.assertEqual(Device.objects.filter(user=self.user).count(), 1)
+
+        metrics = job_metrics()
+        self.assertEqual(metrics['jobs_by_status'][AnalysisJob.SUCCEEDED], 1)
+        self.assertIsNotNone(metrics['avg_run_time_seconds'])
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_failed_job_is_retried_with_backoff_then_fails(self, mock_llm):
+        mock_llm.invoke.side_effect = Exception("LLM unavailable")
+        job_id = self.enqueue().data['id']
+
+        run_pending_jobs()
+        job = AnalysisJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, AnalysisJob.QUEUED)
+        self.assertGreater(job.available_at, timezone.now())
+        # Backoff keeps it out of the queue until available_at
+        self.assertEqual(run_pending_jobs(), 0)
+
+        AnalysisJob.objects.filter(pk=job_id).update(available_at=timezone.now())
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn("LLM unavailable", job.error)
+
+    def test_pending_limit_per_user(self):
+        for index in range(3):
+            self.assertEqual(self.enqueue(name=f'board {index}').status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.enqueue().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_running_limit_per_user(self):
+        self.enqueue(name='first')
+        self.enqueue(name='second')
+
+        self.assertIsNotNone(claim_next_job())
+        self.assertIsNone(claim_next_job())
+
+    def test_running_limit_holds_when_claims_race(self):
+        first = self.enqueue(name='first').data['id']
+        second = self.enqueue(name='second').data['id']
+        lock_user = jobs._lock_user
+
+        def other_worker_claims_second(user_id):
+            # Another worker marked the second job running while this one waited for the user lock
+            AnalysisJob.objects.filter(pk=second).update(status=AnalysisJob.RUNNING)
+            lock_user(user_id)
+
+        with patch('pcb_manager.jobs._lock_user', side_effect=other_worker_claims_second):
+            self.assertIsNone(claim_next_job())
+        self.assertEqual(AnalysisJob.objects.get(pk=first).status, AnalysisJob.QUEUED)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_requeued_job_drops_the_late_result(self, mock_llm):
+        mock_llm.invoke.return_value = MagicMock(content=ANALYSIS_JSON)
+        self.enqueue()
+        job = claim_next_job()
+        # The job timed out and another worker claimed it again meanwhile
+        AnalysisJob.objects.filter(pk=job.pk).update(attempts=job.attempts + 1)
+
+        run_job(job)
+
+        self.assertFalse(Device.objects.filter(user=self.user).exists())
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.RUNNING)
+        self.assertTrue(job.image.storage.exists(job.image.name))
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_upload_is_deleted_only_after_commit(self, mock_llm):
+        mock_llm.invoke.return_value = MagicMock(content=ANALYSIS_JSON)
+        self.enqueue()
+        job = claim_next_job()
+        storage, upload = job.image.storage, job.image.name
+
+        # Saving the finished job fails, so the device is rolled back
+        with self.captureOnCommitCallbacks(execute=True):
+            with patch.object(AnalysisJob, 'save', side_effect=[Exception("database went away"), None]):
+                run_job(job)
+        self.assertFalse(Device.objects.filter(user=self.user).exists())
+        self.assertTrue(storage.exists(upload))
+
+        job = AnalysisJob.objects.get(pk=job.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_job(job)
+        self.assertEqual(AnalysisJob.objects.get(pk=job.pk).status, AnalysisJob.SUCCEEDED)
+        self.assertFalse(storage.exists(upload))
+
+    def test_other_users_cannot_see_job(self):
+        job_id = self.enqueue().data['id']
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+
+        response = self.client.get(reverse('analysis-job-detail', args=[job_id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+# ------------ Async views ------------
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class AsyncViewTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low',
+            components=['ATmega328'], operating_voltage='5V', description='An Arduino clone.',
+        )
+        self.chat_url = reverse('device-chat', args=[self.device.id])
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_chat_uses_async_llm_and_persists_messages(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content='Use a 5V supply.'))
+
+        response = self.client.post(self.chat_url, {'message': 'How do I power it?'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['ai_response'], 'Use a 5V supply.')
+        mock_llm.invoke.assert_not_called()
+        self.assertEqual(
+            list(self.device.chat_messages.values_list('role', flat=True)), ['user', 'ai']
+        )
+
+    def test_chat_requires_message(self):
+        response = self.client.post(self.chat_url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('detail', response.json())
+
+    def test_chat_unauthenticated(self):
+        self.client.credentials()
+        response = self.client.post(self.chat_url, {'message': 'hi'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertTrue(response.has_header('WWW-Authenticate'))
+
+    def test_chat_other_users_device(self):
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.post(self.chat_url, {'message': 'hi'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_wrong_method(self):
+        response = self.client.get(self.chat_url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_llm_connection_reports_failure(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(side_effect=Exception("connection refused"))
+
+        response = self.client.get(reverse('test_llm'))
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['connection_status'], 'failed')
+
+
+# ------------ Streaming chat ------------
+class FakeStreamingLLM:
+
+    def __init__(self, tokens, delay=0.0, fail_after=None):
+        self.tokens = tokens
+        self.delay = delay
+        self.fail_after = fail_after
+
+    async def astream(self, messages, **kwargs):
+        for index, token in enumerate(self.tokens):
+            if self.fail_after is not None and index >= self.fail_after:
+                raise Exception("stream interrupted")
+            await asyncio.sleep(self.delay)
+            yield AIMessageChunk(content=token)
+
+
+def parse_sse(body):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class StreamingChatTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low',
+            components=['ATmega328'], operating_voltage='5V', description='An Arduino clone.',
+        )
+        self.url = reverse('device-chat-stream', args=[self.device.id])
+        self.auth_headers = {'Authorization': 'Token ' + self.token.key}
+
+    async def test_tokens_are_forwarded_before_completion(self):
+        tokens = ['Use ', 'a ', '5V ', 'supply', '.']
+        with patch.object(llm, 'primary_llm', FakeStreamingLLM(tokens, delay=0.2)):
+            start = time.perf_counter()
+            response = await self.async_client.post(
+                self.url, {'message': 'How do I power it?'}, content_type='application/json',
+                headers=self.auth_headers,
+            )
+            chunks = []
+            time_to_first_byte = None
+            async for chunk in response.streaming_content:
+                if time_to_first_byte is None:
+                    time_to_first_byte = time.perf_counter() - start
+                chunks.append(chunk)
+            total_time = time.perf_counter() - start
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        # The first token arrives after one token delay, not after the whole reply
+        self.assertLess(time_to_first_byte, total_time / 2)
+
+        events = parse_sse(b"".join(chunks))
+        self.assertEqual("".join(data['content'] for event, data in events if event == 'token'), 'Use a 5V supply.')
+        self.assertEqual(events[-1][0], 'done')
+        ai_message = await ChatMessage.objects.aget(device=self.device, role='ai')
+        self.assertEqual(ai_message.content, 'Use a 5V supply.')
+        self.assertEqual(events[-1][1]['message_id'], ai_message.id)
+
+    async def test_failed_stream_does_not_store_partial_reply(self):
+        with patch.object(llm, 'primary_llm', FakeStreamingLLM(['partial ', 'reply'], fail_after=1)):
+            response = await self.async_client.post(
+                self.url, {'message': 'hi'}, content_type='application/json', headers=self.auth_headers
+            )
+            body = b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(parse_sse(body)[-1][0], 'error')
+        self.assertFalse(await ChatMessage.objects.filter(device=self.device, role='ai').aexists())
+        self.assertTrue(await ChatMessage.objects.filter(device=self.device, role='user').aexists())
+
+    def test_stream_requires_message(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ------------ Chat context window ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, CHAT_RETRIEVAL_ENABLED=False, CHAT_CONTEXT_MAX_MESSAGES=6, CHAT_CONTEXT_TOKEN_BUDGET=10000,
+)
+class ChatContextTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low',
+            components=['ATmega328'], operating_voltage='5V', description='An Arduino clone.',
+        )
+        self.url = reverse('device-chat', args=[self.device.id])
+        for index in range(30):
+            self.device.chat_messages.create(role='user' if index % 2 == 0 else 'ai', content=f'message {index}')
+        self.prompts = []
+
+    async def fake_ainvoke(self, messages, **kwargs):
+        self.prompts.append(messages)
+        if 'running summary' in str(messages[0].content):
+            return AIMessage(content=f'summary #{len(self.prompts)}')
+        return AIMessage(content='reply')
+
+    def chat(self, message):
+        return self.client.post(self.url, {'message': message}, format='json')
+
+    def test_split_history_respects_count_and_token_budget(self):
+        messages = [ChatMessage(content='x' * 40) for _ in range(10)]  # 11 tokens each
+
+        older, recent = split_history(messages, max_messages=4, token_budget=1000)
+        self.assertEqual((len(older), len(recent)), (6, 4))
+
+        older, recent = split_history(messages, max_messages=10, token_budget=30)
+        self.assertEqual((len(older), len(recent)), (8, 2))
+
+        # The newest message is kept even if it alone exceeds the budget
+        older, recent = split_history(messages, max_messages=10, token_budget=1)
+        self.assertEqual(len(recent), 1)
+
+    def test_long_history_is_folded_into_summary(self):
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=self.fake_ainvoke)):
+            response = self.chat('latest question')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary_prompt, chat_prompt = self.prompts
+        self.assertIn('message 0', summary_prompt[0].content)
+        # System message plus half the window of recent messages
+        self.assertEqual(len(chat_prompt), 1 + 3)
+        self.assertEqual(chat_prompt[-1].content, 'latest question')
+        self.assertIn('summary #1', chat_prompt[0].content)
+        self.assertEqual(response.json()['prompt_tokens'], estimate_prompt_tokens(chat_prompt))
+
+        summary = ConversationSummary.objects.get(device=self.device)
+        self.assertEqual(summary.summarized_messages, 28)
+
+    def test_summary_is_not_rebuilt_every_turn(self):
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=self.fake_ainvoke)):
+            self.chat('first')
+            self.prompts.clear()
+            self.chat('second')
+
+        self.assertEqual(len(self.prompts), 1)
+        self.assertIn('summary #1', self.prompts[0][0].content)
+        self.assertEqual(self.prompts[0][-1].content, 'second')
+
+    def test_summary_failure_still_answers(self):
+        async def failing_summary(messages, **kwargs):
+            if 'running summary' in str(messages[0].content):
+                raise Exception("summary failed")
+            self.prompts.append(messages)
+            return AIMessage(content='reply')
+
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=failing_summary)):
+            response = self.chat('question')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(self.prompts[0]), 1 + 3)
+        self.assertEqual(ConversationSummary.objects.get(device=self.device).last_summarized_message_id, 0)
+
+
+# ------------ User stats ------------
+# Response caching would hide the queries being counted
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class UserStatsTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('user-stats')
+
+    def create_devices(self, count, complexity='Low', messages_per_device=0):
+        devices = Device.objects.bulk_create([
+            Device(
+                user=self.user, name=f'board {index}', image='images/board.png', complexity=complexity,
+                components=[], operating_voltage='5V', description='',
+            )
+            for index in range(count)
+        ])
+        ChatMessage.objects.bulk_create([
+            ChatMessage(device=device, role='user', content='hi')
+            for device in devices for _ in range(messages_per_device)
+        ])
+        return devices
+
+    def populate(self):
+        self.create_devices(1500, 'Low', messages_per_device=2)
+        self.create_devices(1000, 'Medium')
+        self.create_devices(500, 'High', messages_per_device=1)
+
+    def assert_populated_stats(self, data):
+        self.assertEqual(data['total_devices'], 3000)
+        self.assertEqual(data['total_chat_messages'], 3500)
+        self.assertEqual(data['devices_by_complexity'], {'Low': 1500, 'Medium': 1000, 'High': 500})
+
+    @override_settings(USER_STATS_DENORMALIZED=False)
+    def test_aggregate_stats_use_a_single_query(self):
+        self.populate()
+        # One query for token authentication, one for the aggregate
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assert_populated_stats(response.data)
+
+    @override_settings(USER_STATS_DENORMALIZED=True)
+    def test_denormalized_stats_are_a_single_row_lookup(self):
+        self.populate()
+        self.assert_populated_stats(self.client.get(self.url).data)  # rebuilds the counters row
+
+        # The token is cached by now, so only the counters row is read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assert_populated_stats(response.data)
+
+    @override_settings(USER_STATS_DENORMALIZED=True)
+    def test_rebuild_counts_into_an_existing_row(self):
+        self.create_devices(2, 'Low')
+        row_existed = []
+
+        def aggregate(user):
+            # Signals only update existing rows, so the row must be there while counting
+            row_existed.append(UserStats.objects.filter(user=user).exists())
+            return aggregate_user_stats(user)
+
+        with patch('pcb_manager.stats.aggregate_user_stats', side_effect=aggregate):
+            response = self.client.get(self.url)
+
+        self.assertEqual(row_existed, [True])
+        self.assertEqual(response.data['total_devices'], 2)
+        self.assertEqual(UserStats.objects.get(user=self.user).device_count, 2)
+
+    @override_settings(USER_STATS_DENORMALIZED=True)
+    def test_counters_follow_creates_and_deletes(self):
+        self.create_devices(3, 'Medium', messages_per_device=2)
+        self.client.get(self.url)
+
+        device = Device.objects.create(
+            user=self.user, name='new', image='images/new.png', complexity='High',
+            components=[], operating_voltage='5V', description='',
+        )
+        device.chat_messages.create(role='user', content='hello')
+        device.chat_messages.create(role='ai', content='hi there')
+        Device.objects.filter(complexity='Medium').first().delete()
+
+        expected = aggregate_user_stats(self.user)
+        self.assertEqual(UserStats.objects.filter(user=self.user).values(*expected).get(), expected)
+        self.assertEqual(expected['device_count'], 3)
+        self.assertEqual(expected['message_count'], 6)
+
+
+# ------------ Device list pagination ------------
+class DeviceListTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-list')
+        self.devices = Device.objects.bulk_create([
+            Device(
+                user=self.user, name=f'board {index}', image='images/board.png', complexity='Low',
+                components=['ESP32'], operating_voltage='5V', description='A long description. ' * 20,
+            )
+            for index in range(25)
+        ])
+        other = User.objects.create_user(username='other', password='testpass123')
+        Device.objects.create(
+            user=other, name='not mine', image='images/board.png', complexity='Low',
+            components=[], operating_voltage='5V', description='',
+        )
+
+    def test_unpaginated_list_is_unchanged(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data), 25)
+        self.assertIn('description', response.data[0])
+
+    def test_cursor_pages_cover_every_device_once(self):
+        seen = []
+        url = self.url + '?page_size=10'
+        # Token lookup plus the page, then just the page once the token is cached
+        expected_queries = 2
+        while url:
+            with self.assertNumQueries(expected_queries):
+                response = self.client.get(url)
+            expected_queries = 1
+            seen.extend(device['id'] for device in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), {device.id for device in self.devices})
+        self.assertEqual(seen, list(
+            Device.objects.filter(user=self.user).order_by('-created_at', '-id').values_list('id', flat=True)
+        ))
+
+    def test_field_projection(self):
+        response = self.client.get(self.url, {'fields': 'id,name,image', 'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'image'})
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(self.url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ------------ Device detail chat history ------------
+class DeviceDetailHistoryTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low',
+            components=['ATmega328'], operating_voltage='5V', description='An Arduino clone.',
+        )
+        self.messages = ChatMessage.objects.bulk_create([
+            ChatMessage(device=self.device, role='user' if index % 2 == 0 else 'ai', content=f'message {index}')
+            for index in range(120)
+        ])
+        self.url = reverse('device-detail', args=[self.device.id])
+
+    def contents(self, response):
+        return [message['content'] for message in response.data['chat_messages']]
+
+    def test_latest_page_only(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data['name'], 'Sensor board')
+        self.assertEqual(self.contents(response), [f'message {index}' for index in range(70, 120)])
+        self.assertTrue(response.data['messages_page']['has_more'])
+        self.assertEqual(response.data['messages_page']['latest_id'], self.messages[-1].id)
+
+    def test_paging_back_reaches_start_of_history(self):
+        collected = []
+        params = {'messages_limit': 50}
+        while True:
+            response = self.client.get(self.url, params)
+            collected = self.contents(response) + collected
+            if not response.data['messages_page']['has_more']:
+                break
+            params['before'] = response.data['messages_page']['before']
+
+        self.assertEqual(collected, [f'message {index}' for index in range(120)])
+        self.assertIsNone(response.data['messages_page']['before'])
+
+    def test_paging_follows_ids_when_timestamps_disagree(self):
+        # A backfilled message: newest id, oldest timestamp
+        ChatMessage.objects.filter(pk=self.messages[-1].id).update(created_at=timezone.now() - timedelta(days=1))
+        collected = []
+        params = {'messages_limit': 50}
+        while True:
+            response = self.client.get(self.url, params)
+            collected = self.contents(response) + collected
+            if not response.data['messages_page']['has_more']:
+                break
+            params['before'] = response.data['messages_page']['before']
+
+        self.assertEqual(collected, [f'message {index}' for index in range(120)])
+
+        response = self.client.get(self.url, {'since': self.messages[-2].id})
+        self.assertEqual(self.contents(response), ['message 119'])
+
+    def test_since_returns_only_new_messages(self):
+        since = self.messages[-3].id
+        response = self.client.get(self.url, {'since': since})
+
+        self.assertEqual(self.contents(response), ['message 118', 'message 119'])
+        self.assertNotIn('description', response.data)
+        self.assertFalse(response.data['messages_page']['has_more'])
+
+        response = self.client.get(self.url, {'since': self.messages[-1].id})
+        self.assertEqual(response.data['chat_messages'], [])
+        self.assertEqual(response.data['messages_page']['latest_id'], self.messages[-1].id)
+
+    def test_since_checks_ownership(self):
+        self.client.force_authenticate(User.objects.create_user(username='other', password='testpass123'))
+        response = self.client.get(self.url, {'since': 0})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'before': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ------------ Image preprocessing ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    ANALYSIS_JOB_INPROCESS_WORKERS=0,
+    ANALYSIS_IMAGE_MAX_EDGE=400,
+    STORED_IMAGE_MAX_EDGE=800,
+    THUMBNAIL_MAX_EDGE=100,
+)
+class ImagePreprocessingTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        analysis_cache.invalidate()
+
+    def photo_bytes(self, size=(1600, 1200), orientation=None):
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        if orientation:
+            exif[0x0112] = orientation
+        Image.new('RGB', size, (0, 128, 0)).save(buffer, format='JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def test_prepare_image_downscales_and_applies_exif_rotation(self):
+        # Orientation 6: stored landscape, displayed portrait
+        prepared = prepare_image(self.photo_bytes(orientation=6), 'uploads/phone photo.jpg')
+
+        stored = Image.open(prepared.image)
+        self.assertEqual(stored.format, 'WEBP')
+        self.assertEqual(stored.size, (600, 800))
+        self.assertEqual(prepared.image.name, 'phone photo.webp')
+        self.assertEqual(max(Image.open(prepared.thumbnail).size), 100)
+
+        sent = Image.open(io.BytesIO(prepared.llm_bytes))
+        self.assertEqual(sent.format, 'JPEG')
+        self.assertEqual(sent.size, (300, 400))
+        self.assertLess(len(prepared.llm_bytes), prepared.original_size)
+
+    def test_transparent_png_is_flattened(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (50, 50), (0, 0, 0, 0)).save(buffer, format='PNG')
+
+        prepared = prepare_image(buffer.getvalue(), 'board.png')
+
+        self.assertEqual(Image.open(io.BytesIO(prepared.llm_bytes)).getpixel((25, 25)), (255, 255, 255))
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_llm_receives_small_jpeg_and_device_gets_thumbnail(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        upload = SimpleUploadedFile('board.jpg', self.photo_bytes(), content_type='image/jpeg')
+
+        response = self.client.post(reverse('device-analyze-save'), {'image': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        image_url = mock_llm.ainvoke.await_args.args[0][0].content[1]["image_url"]["url"]
+        self.assertTrue(image_url.startswith("data:image/jpeg;base64,"))
+        device = Device.objects.get(pk=response.json()['id'])
+        self.assertTrue(device.image.name.endswith('.webp'))
+        self.assertEqual(max(Image.open(device.thumbnail.path).size), 100)
+        self.assertIn('thumbnail', response.json())
+
+    def test_invalid_image_is_rejected(self):
+        upload = SimpleUploadedFile('board.png', b'not an image', content_type='image/png')
+
+        response = self.client.post(reverse('device-analyze-save'), {'image': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_job_replaces_raw_upload_with_processed_image(self, mock_llm):
+        mock_llm.invoke.return_value = MagicMock(content=ANALYSIS_JSON)
+        upload = SimpleUploadedFile('board.jpg', self.photo_bytes(), content_type='image/jpeg')
+        job_id = self.client.post(reverse('device-analyze-enqueue'), {'image': upload}, format='multipart').data['id']
+        raw_path = AnalysisJob.objects.get(pk=job_id).image.path
+
+        # The raw upload is deleted once the device is committed
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending_jobs()
+
+        job = AnalysisJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, AnalysisJob.SUCCEEDED)
+        self.assertFalse(job.image)
+        self.assertFalse(os.path.exists(raw_path))
+        self.assertTrue(job.device.thumbnail)
+
+
+# ------------ Per-user response cache ------------
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        response_cache_stats.reset()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low', components=[],
+        )
+        self.list_url = reverse('device-list')
+        self.detail_url = reverse('device-detail', args=[self.device.id])
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            responses = [self.client.get(self.list_url) for _ in range(4)]
+
+        self.assertEqual(first['X-Response-Cache'], 'miss')
+        self.assertTrue(all(response['X-Response-Cache'] == 'hit' for response in responses))
+        self.assertEqual(responses[-1].data, first.data)
+        self.assertEqual(response_cache_stats.stats(), {"hits": 4, "misses": 1, "hit_ratio": 0.8})
+
+    def test_device_changes_are_never_read_stale(self):
+        self.client.get(self.list_url)
+        self.client.get(reverse('user-stats'))
+
+        Device.objects.create(user=self.user, name='New board', image='images/new.png', complexity='High', components=[])
+        self.assertEqual(len(self.client.get(self.list_url).data), 2)
+        self.assertEqual(self.client.get(reverse('user-stats')).data['total_devices'], 2)
+
+        self.device.name = 'Renamed board'
+        self.device.save()
+        self.assertEqual(self.client.get(self.detail_url).data['name'], 'Renamed board')
+
+        self.client.delete(reverse('device-delete', args=[self.device.id]))
+        self.assertEqual([device['name'] for device in self.client.get(self.list_url).data], ['New board'])
+
+    def test_new_message_expires_detail_but_not_list(self):
+        self.client.get(self.list_url)
+        self.client.get(self.detail_url)
+
+        ChatMessage.objects.create(device=self.device, role='user', content='What is U1?')
+
+        detail = self.client.get(self.detail_url)
+        self.assertEqual(detail['X-Response-Cache'], 'miss')
+        self.assertEqual(detail.data['chat_messages'][0]['content'], 'What is U1?')
+        self.assertEqual(self.client.get(self.list_url)['X-Response-Cache'], 'hit')
+
+    def test_responses_are_per_user(self):
+        self.client.get(self.list_url)
+        other = User.objects.create_user(username='other', password='otherpass123')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=other).key)
+
+        response = self.client.get(self.list_url)
+
+        self.assertEqual(response['X-Response-Cache'], 'miss')
+        self.assertEqual(response.data, [])
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_can_be_disabled(self):
+        self.client.get(self.list_url)
+
+        self.assertNotIn('X-Response-Cache', self.client.get(self.list_url))
+
+
+# ------------ LLM router ------------
+class FakeOpenAIServer:
+    """
+    Local OpenAI-compatible /v1/chat/completions endpoint with a configurable
+    reply, delay and status code.
+    """
+
+    def __init__(self, reply='ok', delay=0.0, status=200):
+        self.reply = reply
+        self.delay = delay
+        self.status = status
+        self.requests = 0
+
+    def __enter__(self):
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                # Hedged and timed-out requests are abandoned by the client
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                owner.requests += 1
+                time.sleep(owner.delay)
+                if owner.status != 200:
+                    self.send_response(owner.status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"error": {"message": "fake failure"}}).encode())
+                    return
+                self.send_response(200)
+                if body.get('stream'):
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.end_headers()
+                    for token in owner.reply.split(' '):
+                        chunk = {"id": "fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+                                 "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    return
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": 0, "model": "fake",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": owner.reply},
+                                 "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                }).encode())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def config(self, name, **extra):
+        return {"name": name, "provider": "openai", "model": name,
+                "base_url": f"http://127.0.0.1:{self.server.server_port}/v1", "api_key": "fake", **extra}
+
+
+@override_settings(
+    LLM_TIMEOUT=5.0, LLM_HEDGE_QUANTILE=0.95, LLM_HEDGE_MIN_SAMPLES=5,
+    LLM_CIRCUIT_FAILURES=2, LLM_CIRCUIT_RESET_SECONDS=60.0,
+)
+class LLMRouterTests(SimpleTestCase):
+
+    prompt = [HumanMessage(content="Which regulator is on this board?")]
+
+    def test_fails_over_to_next_backend(self):
+        with FakeOpenAIServer(status=500) as broken, FakeOpenAIServer(reply='AMS1117') as healthy:
+            router = llm.build_router([broken.config('broken'), healthy.config('healthy')])
+
+            response = asyncio.run(router.ainvoke(self.prompt))
+
+        self.assertEqual(response.content, 'AMS1117')
+        self.assertEqual(router.backends[0].failures, 1)
+        self.assertEqual(router.backends[1].latency.count, 1)
+
+    def test_timeout_fails_over(self):
+        with FakeOpenAIServer(delay=2.0) as slow, FakeOpenAIServer(reply='fast') as fast:
+            router = llm.build_router([slow.config('slow', timeout=0.3), fast.config('fast')])
+
+            start = time.monotonic()
+            response = asyncio.run(router.ainvoke(self.prompt))
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(response.content, 'fast')
+        self.assertLess(elapsed, 1.5)
+        self.assertEqual(router.backends[0].failures, 1)
+
+    def test_open_circuit_skips_backend_until_reset(self):
+        with FakeOpenAIServer(status=500) as broken, FakeOpenAIServer() as healthy:
+            router = llm.build_router([broken.config('broken'), healthy.config('healthy')])
+
+            for _ in range(3):
+                router.invoke(self.prompt)
+            self.assertEqual(broken.requests, 2)
+            self.assertEqual(router.stats()['backends'][0]['circuit'], 'open')
+
+            # After the reset period one trial call goes through
+            router.backends[0].breaker.reset_seconds = 0
+            router.invoke(self.prompt)
+            self.assertEqual(broken.requests, 3)
+
+    def test_slow_backend_is_hedged(self):
+        with FakeOpenAIServer(reply='slow', delay=1.5) as slow, FakeOpenAIServer(reply='hedge') as fast:
+            router = llm.build_router([slow.config('slow'), fast.config('fast')])
+            for _ in range(5):
+                router.backends[0].latency.observe(0.05)
+
+            start = time.monotonic()
+            response = asyncio.run(router.ainvoke(self.prompt))
+            elapsed = time.monotonic() - start
+
+        self.assertEqual(response.content, 'hedge')
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(router.hedged_calls, 1)
+        # The abandoned call is not held against the slow backend
+        self.assertEqual(router.backends[0].failures, 0)
+
+    def test_stream_fails_over_before_first_chunk(self):
+        async def collect(router):
+            return [chunk.content async for chunk in router.astream(self.prompt)]
+
+        with FakeOpenAIServer(status=500) as broken, FakeOpenAIServer(reply='three short tokens') as healthy:
+            router = llm.build_router([broken.config('broken'), healthy.config('healthy')])
+
+            chunks = asyncio.run(collect(router))
+
+        self.assertEqual(''.join(chunks), 'threeshorttokens')
+        self.assertEqual(router.backends[0].failures, 1)
+        # Streams don't feed the histogram that sets the hedge delay
+        self.assertEqual(router.backends[1].latency.count, 0)
+        self.assertEqual(router.stats()['backends'][1]['first_chunk_seconds']['count'], 1)
+
+    def test_all_backends_down(self):
+        with FakeOpenAIServer(status=500) as first, FakeOpenAIServer(status=503) as second:
+            router = llm.build_router([first.config('first'), second.config('second')])
+
+            with self.assertRaises(LLMUnavailable):
+                asyncio.run(router.ainvoke(self.prompt))
+            with self.assertRaises(LLMUnavailable):
+                router.invoke(self.prompt)
+
+    def test_latency_histogram(self):
+        with FakeOpenAIServer() as healthy:
+            router = llm.build_router([healthy.config('healthy')])
+            for _ in range(3):
+                router.invoke(self.prompt)
+
+        latency = router.stats()['backends'][0]['latency_seconds']
+        self.assertEqual(latency['count'], 3)
+        self.assertEqual(latency['buckets']['+Inf'], 3)
+        self.assertIsNotNone(latency['p95'])
+
+
+# ------------ Batch analysis ------------
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, ANALYSIS_BATCH_CONCURRENCY=2, ANALYSIS_BATCH_MAX_ITEMS=5)
+class BatchAnalysisTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-analyze-batch')
+        analysis_cache.invalidate()
+
+    def uploads(self, count):
+        return [make_upload((index * 40, 0, 0), name=f'board_{index}.png') for index in range(count)]
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_images_are_analyzed_concurrently_and_saved(self, mock_llm):
+        in_flight = 0
+        peak = 0
+
+        async def slow_analysis(messages, **kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+            return MagicMock(content=ANALYSIS_JSON)
+
+        mock_llm.ainvoke = slow_analysis
+        UserStats.objects.create(user=self.user)
+
+        response = self.client.post(self.url, {'images': self.uploads(4)}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        data = response.json()
+        self.assertEqual(data['created'], 4)
+        self.assertEqual([result['device']['name'] for result in data['results']],
+                         ['board_0', 'board_1', 'board_2', 'board_3'])
+        self.assertEqual(peak, 2)
+        devices = Device.objects.filter(user=self.user)
+        self.assertEqual(devices.count(), 4)
+        self.assertTrue(all(device.thumbnail for device in devices))
+        self.assertEqual(UserStats.objects.get(user=self.user).device_count, 4)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_failures_are_reported_per_item(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        broken = SimpleUploadedFile('broken.png', b'not an image', content_type='image/png')
+
+        response = self.client.post(self.url, {'images': [*self.uploads(2), broken]}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'created', 'failed'])
+        self.assertIn('valid image', results[2]['error'])
+        self.assertEqual(Device.objects.filter(user=self.user).count(), 2)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_zip_archive(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('batch/left.png', make_image_bytes((10, 10, 10)))
+            archive.writestr('batch/right.jpg', make_image_bytes((20, 20, 20), fmt='JPEG'))
+            archive.writestr('batch/notes.txt', 'not a board')
+        upload = SimpleUploadedFile('batch.zip', buffer.getvalue(), content_type='application/zip')
+
+        response = self.client.post(self.url, {'archive': upload}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(sorted(result['filename'] for result in response.json()['results']), ['left.png', 'right.jpg'])
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_batch_is_visible_in_cached_device_list(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        self.assertEqual(self.client.get(reverse('device-list')).data, [])
+
+        self.client.post(self.url, {'images': self.uploads(2)}, format='multipart')
+
+        self.assertEqual(len(self.client.get(reverse('device-list')).data), 2)
+
+    def test_batch_limits(self):
+        self.assertEqual(self.client.post(self.url, {}, format='multipart').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'images': self.uploads(6)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ------------ Analysis output parsing ------------
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, ANALYSIS_REPAIR_ATTEMPTS=1)
+class AnalysisOutputTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-analyze-save')
+        analysis_cache.invalidate()
+        analysis_metrics.reset()
+
+    def test_extract_json_tolerates_fences_and_chatter(self):
+        expected = json.loads(ANALYSIS_JSON)
+        self.assertEqual(extract_json(ANALYSIS_JSON), expected)
+        self.assertEqual(extract_json(f"```json\n{ANALYSIS_JSON}\n```"), expected)
+        self.assertEqual(extract_json(f"```\n{ANALYSIS_JSON}```"), expected)
+        self.assertEqual(extract_json(f"Here is the analysis:\n{ANALYSIS_JSON}\nHope this helps!"), expected)
+        with self.assertRaises(json.JSONDecodeError):
+            extract_json("no json here")
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_requests_schema_constrained_output(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+
+        self.client.post(self.url, {'image': make_upload()}, format='multipart')
+
+        self.assertIs(mock_llm.ainvoke.await_args.kwargs['structured_output'], PCBAnalysisResult)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_malformed_reply_is_repaired_without_resending_image(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(side_effect=[
+            MagicMock(content='{"complexity": "Medium", "components": ["ESP32"'),
+            MagicMock(content=ANALYSIS_JSON),
+        ])
+
+        response = self.client.post(self.url, {'image': make_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        repair_message = mock_llm.ainvoke.await_args_list[1].args[0][0]
+        self.assertIsInstance(repair_message.content, str)
+        self.assertIn('not valid JSON', repair_message.content)
+        self.assertEqual(analysis_metrics.snapshot(),
+                         {"llm_calls": 2, "parse_failures": 1, "repaired": 1, "wasted_calls": 0})
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_unrepairable_reply_counts_wasted_calls(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content='I cannot see a PCB in this image.'))
+
+        response = self.client.post(self.url, {'image': make_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertEqual(mock_llm.ainvoke.await_count, 2)
+        self.assertEqual(analysis_metrics.snapshot()['wasted_calls'], 2)
+        admin = User.objects.create_superuser(username='admin', password='adminpass123')
+        self.client.force_authenticate(admin)
+        parsing = self.client.get(reverse('analysis-cache-stats')).data['output_parsing']
+        self.assertEqual(parsing['parse_failure_rate'], 1.0)
+
+    def test_backends_translate_structured_output(self):
+        openai_backend = LLMBackend('local', MagicMock(), 'local', 5, CircuitBreaker(), provider='openai')
+        google_backend = LLMBackend('gemini', MagicMock(), 'gemini', 5, CircuitBreaker(), provider='google')
+        plain_backend = LLMBackend('old', MagicMock(), 'old', 5, CircuitBreaker(), structured_output=False)
+
+        openai_backend.invoke([], structured_output=PCBAnalysisResult)
+        google_backend.invoke([], structured_output=PCBAnalysisResult)
+        plain_backend.invoke([], structured_output=PCBAnalysisResult)
+
+        response_format = openai_backend.model.invoke.call_args.kwargs['response_format']
+        self.assertEqual(response_format['json_schema']['schema'], PCBAnalysisResult.model_json_schema())
+        self.assertEqual(google_backend.model.invoke.call_args.kwargs['response_mime_type'], 'application/json')
+        self.assertEqual(plain_backend.model.invoke.call_args.kwargs, {})
+
+
+# ------------ Search ------------
+class SearchTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('search')
+        self.esp = Device.objects.create(
+            user=self.user, name='Weather station', image='images/board.png', complexity='Medium',
+            components=['ESP32-WROOM-32', 'BME280'], operating_voltage='3.3V',
+            description='A WiFi board that logs temperature and humidity.',
+        )
+        self.psu = Device.objects.create(
+            user=self.user, name='Bench supply', image='images/board.png', complexity='Low',
+            components=['LM7805', 'Electrolytic capacitor'], operating_voltage='12V',
+            description='A linear regulator board.',
+        )
+        ChatMessage.objects.create(device=self.psu, role='user', content='Why does the regulator get hot?')
+        ChatMessage.objects.create(device=self.psu, role='ai', content='It drops 7V at full load.')
+        other = User.objects.create_user(username='other', password='testpass123')
+        other_device = Device.objects.create(
+            user=other, name='Regulator test jig', image='images/board.png', complexity='Low',
+            components=['LM7805'], operating_voltage='12V', description='',
+        )
+        ChatMessage.objects.create(device=other_device, role='user', content='regulator question')
+
+    def test_matches_devices_and_messages(self):
+        response = self.client.get(self.url, {'q': 'regulator'})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.psu.id])
+        self.assertEqual([message['content'] for message in response.data['messages']],
+                         ['Why does the regulator get hot?'])
+
+    def test_text_matches_components(self):
+        response = self.client.get(self.url, {'q': 'bme280'})
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.esp.id])
+
+    def test_component_filter_is_scoped_to_user(self):
+        response = self.client.get(self.url, {'component': 'LM7805'})
+
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.psu.id])
+        self.assertEqual(response.data['messages'], [])
+
+    def test_component_filter_ignores_spelling(self):
+        response = self.client.get(self.url, {'component': 'lm 7805'})
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.psu.id])
+
+        response = self.client.get(self.url, {'component': 'esp32 wroom 32'})
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.esp.id])
+
+    def test_component_filter_matches_aliases(self):
+        response = self.client.get(self.url, {'component': 'electrolytic capacitors'})
+        self.assertEqual([device['id'] for device in response.data['devices']], [self.psu.id])
+
+    def test_limit(self):
+        response = self.client.get(self.url, {'q': 'board', 'limit': 1})
+        self.assertEqual(len(response.data['devices']), 1)
+
+    def test_requires_a_term(self):
+        response = self.client.get(self.url, {'q': '  '})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+# ------------ Component catalog ------------
+class ComponentCatalogTests(AuthenticatedAPITestCase):
+
+    def make_device(self, components, user=None):
+        return Device.objects.create(
+            user=user or self.user, name='board', image='images/board.png', complexity='Low',
+            components=components, operating_voltage='5V', description='',
+        )
+
+    def test_spellings_fold_to_one_component(self):
+        self.assertEqual(component_key('ESP32 WROOM-32'), component_key('esp32-wroom-32'))
+        self.assertEqual(canonicalize_components([' Resistors ', 'resistor', 'LED', 'leds', 'ATmega328P']),
+                         ['Resistor', 'LED', 'ATmega328P'])
+
+    @override_settings(COMPONENT_ALIASES={'ATmega328P-PU': 'ATmega328P'})
+    def test_configured_aliases(self):
+        self.assertEqual(component_key('atmega328p-pu'), component_key('ATmega328P'))
+
+    def test_saving_a_device_links_its_components(self):
+        device = self.make_device(['ATmega328P', 'atmega 328p', 'LM7805'])
+        self.make_device(['ATMEGA328P'])
+
+        self.assertEqual(Component.objects.count(), 2)
+        self.assertEqual(sorted(device.catalog_components.values_list('name', flat=True)), ['ATmega328P', 'LM7805'])
+
+        device.components = ['LM7805']
+        device.save(update_fields=['components'])
+        self.assertEqual(list(device.catalog_components.values_list('name', flat=True)), ['LM7805'])
+
+    def test_frequencies(self):
+        self.make_device(['ATmega328P', 'LM7805'])
+        self.make_device(['atmega328p', 'CH340G'])
+        self.make_device(['ATmega328P'], user=User.objects.create_user(username='other', password='testpass123'))
+
+        response = self.client.get(reverse('component-frequencies'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [
+            {'name': 'ATmega328P', 'device_count': 2},
+            {'name': 'CH340G', 'device_count': 1},
+            {'name': 'LM7805', 'device_count': 1},
+        ])
+        response = self.client.get(reverse('component-frequencies'), {'name': 'ATMEGA 328P'})
+        self.assertEqual(response.data, [{'name': 'ATmega328P', 'device_count': 2}])
+
+    def test_backfill_links_existing_devices(self):
+        Device.objects.bulk_create([
+            Device(user=self.user, name=f'board {index}', image='images/board.png', complexity='Low',
+                   components=['ESP32', f'Part {index % 3}'], operating_voltage='5V', description='')
+            for index in range(7)
+        ])
+        self.assertFalse(Device.catalog_components.through.objects.exists())
+
+        call_command('backfill_components', chunk_size=3, stdout=io.StringIO())
+
+        self.assertEqual(Component.objects.count(), 4)
+        self.assertEqual(Device.catalog_components.through.objects.count(), 14)
+        self.assertEqual(Component.objects.get(name='ESP32').devices.count(), 7)
+
+
+# ------------ Near-duplicate uploads ------------
+def make_board_photo(shift=0, brightness=0, size=(320, 240)):
+    """
+    A synthetic board: a grid of pads on a gradient, optionally shifted and
+    brightened the way a re-shot photo would be.
+    """
+    image = Image.new('RGB', size)
+    for x in range(size[0]):
+        for y in range(size[1]):
+            image.putpixel((x, y), (0, min(255, 60 + x // 3 + brightness), min(255, 40 + y // 4 + brightness)))
+    for index in range(12):
+        left = 20 + (index * 53) % 260 + shift
+        top = 20 + (index * 31) % 180
+        image.paste((200, 180, 60), (left, top, left + 18 + index, top + 12))
+    return image
+
+
+def photo_upload(image, name='board.png'):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, NEAR_DUPLICATE_MAX_DISTANCE=6, NEAR_DUPLICATE_REUSE=True)
+class NearDuplicateTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('device-analyze-save')
+        analysis_cache.invalidate()
+
+    def test_reshot_photo_hashes_close(self):
+        original = dhash(make_board_photo())
+        reshot = dhash(make_board_photo(shift=2, brightness=12))
+        different = dhash(make_board_photo().transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+
+        self.assertLessEqual((original ^ reshot).bit_count(), 6)
+        self.assertGreater((original ^ different).bit_count(), 6)
+        self.assertEqual(from_db_hash(to_db_hash(2 ** 64 - 1)), 2 ** 64 - 1)
+
+    def test_hamming_index_finds_everything_within_distance(self):
+        index = HammingIndex()
+        base = 0x0123456789ABCDEF
+        for bits in range(10):
+            index.add(base ^ ((1 << bits) - 1), bits)  # `bits` low bits flipped
+
+        self.assertEqual([value for _, value in index.search(base, 6)], [0, 1, 2, 3, 4, 5, 6])
+        self.assertEqual(index.search(base ^ (1 << 63), 0), [])
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_near_duplicate_reuses_analysis(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+
+        first = self.client.post(self.url, {'image': photo_upload(make_board_photo())}, format='multipart')
+        second = self.client.post(
+            self.url, {'image': photo_upload(make_board_photo(shift=2, brightness=12))}, format='multipart'
+        )
+
+        self.assertEqual(mock_llm.ainvoke.await_count, 1)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second['X-Analysis-Cache'], 'near-duplicate')
+        self.assertEqual(second.json()['components'], first.json()['components'])
+        self.assertEqual(second.json()['near_duplicate']['device_id'], first.json()['id'])
+        self.assertTrue(second.json()['near_duplicate']['reused'])
+        self.assertIsNotNone(Device.objects.get(id=second.json()['id']).perceptual_hash)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_reanalyze_and_other_users(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        self.client.post(self.url, {'image': photo_upload(make_board_photo())}, format='multipart')
+
+        forced = self.client.post(
+            self.url, {'image': photo_upload(make_board_photo(shift=2)), 'reanalyze': 'true'}, format='multipart'
+        )
+        self.assertEqual(mock_llm.ainvoke.await_count, 2)
+        self.assertFalse(forced.json()['near_duplicate']['reused'])
+
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        response = self.client.post(self.url, {'image': photo_upload(make_board_photo())}, format='multipart')
+        self.assertNotIn('near_duplicate', response.json())
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_deleted_device_is_not_reused(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        first = self.client.post(self.url, {'image': photo_upload(make_board_photo())}, format='multipart')
+        Device.objects.get(id=first.json()['id']).delete()
+
+        second = self.client.post(self.url, {'image': photo_upload(make_board_photo(shift=1))}, format='multipart')
+
+        self.assertEqual(mock_llm.ainvoke.await_count, 2)
+        self.assertNotIn('near_duplicate', second.json())
+
+    @override_settings(ANALYSIS_JOB_INPROCESS_WORKERS=0)
+    @patch('pcb_manager.llm.primary_llm')
+    def test_queued_job_reuses_near_duplicate(self, mock_llm):
+        mock_llm.invoke.return_value = MagicMock(content=ANALYSIS_JSON)
+        enqueue_url = reverse('device-analyze-enqueue')
+        first = self.client.post(enqueue_url, {'image': photo_upload(make_board_photo())}, format='multipart')
+        run_pending_jobs()
+        second = self.client.post(
+            enqueue_url, {'image': photo_upload(make_board_photo(shift=2, brightness=12))}, format='multipart'
+        )
+        forced = self.client.post(
+            enqueue_url, {'image': photo_upload(make_board_photo(shift=1)), 'reanalyze': 'true'}, format='multipart'
+        )
+        run_pending_jobs()
+
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+        first_device = AnalysisJob.objects.get(pk=first.data['id']).device_id
+        job = self.client.get(reverse('analysis-job-detail', args=[second.data['id']])).data
+        self.assertEqual(job['status'], AnalysisJob.SUCCEEDED)
+        self.assertEqual(job['near_duplicate']['device_id'], first_device)
+        self.assertTrue(job['near_duplicate']['reused'])
+        self.assertEqual(job['device']['components'], Device.objects.get(pk=first_device).components)
+        self.assertFalse(AnalysisJob.objects.get(pk=forced.data['id']).near_duplicate_reused)
+
+    @patch('pcb_manager.llm.primary_llm')
+    def test_batch_reuses_near_duplicate(self, mock_llm):
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content=ANALYSIS_JSON))
+        first = self.client.post(self.url, {'image': photo_upload(make_board_photo())}, format='multipart')
+
+        response = self.client.post(
+            reverse('device-analyze-batch'),
+            {'images': [photo_upload(make_board_photo(shift=2), 'again.png')]}, format='multipart',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(mock_llm.ainvoke.await_count, 1)
+        self.assertEqual(response.json()['results'][0]['near_duplicate']['device_id'], first.json()['id'])
+        self.assertTrue(response.json()['results'][0]['near_duplicate']['reused'])
+
+
+# ------------ Request metrics ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, RESPONSE_CACHE_TIMEOUT=300,
+    MIDDLEWARE=['pcb_manager.instrumentation.RequestMetricsMiddleware', *settings.MIDDLEWARE],
+)
+class RequestMetricsTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        request_metrics.reset()
+        analysis_metrics.reset()
+        analysis_cache.invalidate()
+        self.admin = User.objects.create_superuser(username='admin', password='adminpass123')
+
+    def scrape(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_records_queries_and_serializer_time_per_route(self):
+        Device.objects.create(
+            user=self.user, name='board', image='images/board.png', complexity='Low',
+            components=[], operating_voltage='5V', description='',
+        )
+        self.client.get(reverse('device-list'))
+        self.client.get(reverse('device-list'))
+
+        body = self.scrape()
+        route = 'method="GET",route="api/devices/"'
+        self.assertIn(f'pcb_http_requests_total{{{route},status="200"}} 2', body)
+        self.assertIn(f'pcb_http_request_duration_seconds_count{{{route}}} 2', body)
+        # Token and device queries on the first request; the second is a response cache hit
+        self.assertIn(f'pcb_http_request_db_queries_sum{{{route}}} 2.0', body)
+        self.assertIn(f'pcb_http_request_db_queries_bucket{{{route},le="1"}} 1', body)
+        self.assertIn(f'pcb_http_request_serialize_seconds_count{{{route}}} 2', body)
+        self.assertNotIn(f'pcb_http_request_llm_seconds_count{{{route}}}', body)
+
+    def test_records_llm_time_and_sizes_of_async_views(self):
+        model = MagicMock()
+        model.ainvoke = AsyncMock(return_value=AIMessage(content=ANALYSIS_JSON))
+        router = LLMRouter([LLMBackend('fake', model, 'fake', 5, CircuitBreaker())])
+
+        with patch('pcb_manager.llm.primary_llm', router):
+            response = self.client.post(reverse('device-analyze-save'), {'image': make_upload()}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        body = self.scrape()
+        route = 'method="POST",route="api/devices/analyze-pcb/"'
+        self.assertIn(f'pcb_http_request_llm_seconds_count{{{route}}} 1', body)
+        self.assertIn(f'pcb_http_request_llm_response_chars_sum{{{route}}} {len(ANALYSIS_JSON)}', body)
+        self.assertRegex(body, rf'pcb_http_request_llm_prompt_chars_sum{{{route}}} [1-9]')
+        self.assertRegex(body, rf'pcb_http_request_db_queries_sum{{{route}}} [1-9]')
+        self.assertIn('pcb_analysis_llm_calls_total 1', body)
+
+    def test_metrics_require_admin(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RequestMetricsDisabledTests(AuthenticatedAPITestCase):
+
+    def test_nothing_is_recorded_without_the_middleware(self):
+        request_metrics.reset()
+        self.client.get(reverse('device-list'))
+        self.assertFalse([line for line in request_metrics.prometheus_lines() if 'api/devices/' in line])
+
+
+# ------------ Similar devices ------------
+class SimilarDevicesTests(AuthenticatedAPITestCase):
+
+    def make_device(self, name, components, description, user=None):
+        return Device.objects.create(
+            user=user or self.user, name=name, image='images/board.png', complexity='Low',
+            components=components, operating_voltage='5V', description=description,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.weather = self.make_device(
+            'weather', ['ESP32-WROOM-32', 'BME280'], 'WiFi weather station logging temperature and humidity.')
+        self.weather2 = self.make_device(
+            'weather v2', ['ESP32-WROOM-32', 'BME280', 'CR2032 holder'], 'Battery WiFi sensor for temperature and humidity.')
+        self.psu = self.make_device(
+            'psu', ['LM7805', 'Electrolytic capacitor'], 'Linear 5V regulator supply for a bench.')
+        self.other = self.make_device(
+            'not mine', ['ESP32-WROOM-32', 'BME280'], 'WiFi weather station logging temperature and humidity.',
+            user=User.objects.create_user(username='other', password='testpass123'))
+
+    def similar(self, device, **params):
+        response = self.client.get(reverse('device-similar', args=[device.id]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(result['device']['id'], result['score']) for result in response.data]
+
+    def test_embeddings_are_deterministic_unit_vectors(self):
+        vector = embed_device(self.weather)
+        self.assertAlmostEqual(float((vector ** 2).sum()), 1.0, places=5)
+        self.assertEqual(bytes(DeviceEmbedding.objects.get(device=self.weather).vector), vector.tobytes())
+
+    def test_ranks_the_users_other_devices(self):
+        results = self.similar(self.weather)
+
+        self.assertEqual([device_id for device_id, _ in results], [self.weather2.id, self.psu.id])
+        self.assertGreater(results[0][1], results[1][1])
+        self.assertEqual(len(self.similar(self.weather, k=1)), 1)
+
+    def test_index_follows_creates_edits_and_deletes(self):
+        self.similar(self.psu)  # load the index
+        clone = self.make_device('psu clone', ['LM7805', 'Electrolytic capacitor'], 'Linear 5V regulator supply.')
+        self.assertEqual(self.similar(self.psu)[0][0], clone.id)
+        self.assertGreater(dict(self.similar(self.psu))[clone.id], 0.5)
+
+        clone.components = ['BME280']
+        clone.description = 'Temperature and humidity sensor.'
+        clone.save(update_fields=['components', 'description'])
+        self.assertLess(dict(self.similar(self.psu))[clone.id], 0.3)
+
+        self.weather2.delete()
+        self.assertNotIn(self.weather2.id, [device_id for device_id, _ in self.similar(self.weather)])
+
+    def test_other_users_device_is_not_found(self):
+        response = self.client.get(reverse('device-similar', args=[self.other.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_user_vectors_swap_remove(self):
+        vectors = UserVectors(4)
+        for device_id in range(1, 21):
+            vectors.add(device_id, [1.0, device_id / 20, 0.0, 0.0])
+        vectors.remove(3)
+        vectors.remove(20)
+
+        results = vectors.search(np.array([1.0, 1.0, 0.0, 0.0], dtype=np.float32), 20)
+        self.assertEqual(vectors.size, 18)
+        self.assertEqual(sorted(device_id for device_id, _ in results), [i for i in range(1, 20) if i != 3])
+        self.assertEqual(results[0][0], 19)
+
+
+# ------------ Retrieval-augmented chat ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, CHAT_RETRIEVAL_RECENT_MESSAGES=4, CHAT_RETRIEVAL_TOP_K=3,
+    CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K=2, CHAT_RETRIEVAL_CHUNK_CHARS=120, CHAT_RETRIEVAL_MIN_SCORE=0.05,
+    EMBEDDING_DIMENSIONS=1024,  # fewer hash collisions between the short test texts
+    CHAT_CONTEXT_MAX_MESSAGES=50,  # no summary unless a test asks for one
+)
+class RetrievalChatTests(AuthenticatedAPITestCase):
+
+    def make_device(self, name, description, user=None):
+        return Device.objects.create(
+            user=user or self.user, name=name, image='images/board.png', complexity='Medium',
+            components=['ESP32-WROOM-32', 'LM7805'], operating_voltage='5V', description=description,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.device = self.make_device(
+            'Controller',
+            'The board is powered from a 12V barrel jack through an LM7805 linear regulator. '
+            'An ESP32-WROOM-32 module handles WiFi and drives two relays through transistors. '
+            'A CH340G USB to serial converter is used for programming.',
+        )
+        self.regulator_message = self.device.chat_messages.create(
+            role='ai', content='The LM7805 regulator overheats because it drops 7V at 400mA; add a heatsink.')
+        for index in range(20):
+            self.device.chat_messages.create(
+                role='user' if index % 2 == 0 else 'ai', content=f'Unrelated chatter number {index} about colours.')
+        self.sensor = self.make_device(
+            'Weather node', 'A BME280 humidity and pressure sensor is read over I2C by the ESP32.')
+        self.other_user_device = self.make_device(
+            'Private', 'A BME280 humidity and pressure sensor on a secret board.',
+            user=User.objects.create_user(username='other', password='testpass123'))
+        self.url = reverse('device-chat', args=[self.device.id])
+        self.prompts = []
+
+    async def fake_ainvoke(self, messages, **kwargs):
+        self.prompts.append(messages)
+        return AIMessage(content='reply')
+
+    def chat(self, message, **data):
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=self.fake_ainvoke)):
+            response = self.client.post(self.url, {'message': message, **data}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_split_text_keeps_sentences_within_limit(self):
+        text = 'First sentence here. Second one is a bit longer! Third?\n' + 'x' * 50
+        pieces = split_text(text, 30)
+        self.assertEqual(pieces[:2], ['First sentence here.', 'Second one is a bit longer!'])
+        self.assertTrue(all(len(piece) <= 30 for piece in pieces))
+        self.assertEqual(''.join(pieces[-2:]), 'x' * 50)
+
+    def test_descriptions_and_messages_are_chunked(self):
+        description_chunks = ContextChunk.objects.filter(device=self.device, source=ContextChunk.DESCRIPTION)
+        self.assertEqual(description_chunks.count(), 3)
+        self.assertTrue(ContextChunk.objects.filter(message=self.regulator_message).exists())
+
+        self.device.description = 'Now a battery powered board.'
+        self.device.save(update_fields=['description'])
+        self.assertEqual(list(description_chunks.values_list('text', flat=True)), ['Now a battery powered board.'])
+
+    def test_prompt_has_recent_messages_and_relevant_snippets(self):
+        body = self.chat('Why does the LM7805 regulator get so hot?')
+
+        prompt = self.prompts[0]
+        self.assertEqual(len(prompt), 1 + 4)
+        self.assertEqual(prompt[-1].content, 'Why does the LM7805 regulator get so hot?')
+        self.assertIn('drops 7V at 400mA', prompt[0].content)
+        self.assertIn('LM7805 linear regulator', prompt[0].content)
+        self.assertNotIn('CH340G USB to serial', prompt[0].content)
+        self.assertNotIn('BME280', prompt[0].content)
+        self.assertIn(self.regulator_message.id, [source['message_id'] for source in body['retrieved']])
+        self.assertEqual(body['prompt_tokens'], estimate_prompt_tokens(prompt))
+
+    def test_recent_messages_are_not_retrieved_twice(self):
+        self.chat('Tell me about the regulator heatsink.')
+        self.chat('And the regulator again?')
+
+        retrieved = [chunk.content for chunk in self.prompts[1][1:]]
+        self.assertNotIn('And the regulator again?', self.prompts[1][0].content)
+        self.assertIn('Tell me about the regulator heatsink.', retrieved)
+
+    def test_other_devices_only_on_request(self):
+        question = 'Which humidity sensor could I add over I2C?'
+        self.chat(question)
+        self.assertNotIn('Weather node', self.prompts[-1][0].content)
+
+        body = self.chat(question, other_devices=True)
+        self.assertIn('your board "Weather node"', self.prompts[-1][0].content)
+        self.assertNotIn('secret board', self.prompts[-1][0].content)
+        self.assertIn(self.sensor.id, [source['device_id'] for source in body['retrieved']])
+
+        self.sensor.delete()
+        body = self.chat(question, other_devices=True)
+        self.assertNotIn(self.sensor.id, [source['device_id'] for source in body['retrieved']])
+
+    @override_settings(CHAT_CONTEXT_MAX_MESSAGES=10)
+    def test_older_turns_are_still_summarized(self):
+        async def fake_ainvoke(messages, **kwargs):
+            self.prompts.append(messages)
+            if 'running summary' in str(messages[0].content):
+                return AIMessage(content='Summary: the user wants to run the relays from a battery.')
+            return AIMessage(content='reply')
+
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=fake_ainvoke)):
+            self.client.post(self.url, {'message': 'Why does the LM7805 regulator get so hot?'}, format='json')
+
+        summary_prompt, prompt = self.prompts
+        self.assertIn('drops 7V at 400mA', summary_prompt[0].content)
+        self.assertEqual(len(prompt), 1 + 4)
+        self.assertIn('run the relays from a battery', prompt[0].content)
+        self.assertIn('LM7805 linear regulator', prompt[0].content)
+        self.assertEqual(ConversationSummary.objects.get(device=self.device).summarized_messages, 17)
+
+    def test_prompt_is_smaller_than_full_context(self):
+        retrieval_tokens = self.chat('Why does the LM7805 regulator get so hot?')['prompt_tokens']
+        with override_settings(CHAT_RETRIEVAL_ENABLED=False):
+            full_tokens = self.chat('Why does the LM7805 regulator get so hot?', fresh=True)['prompt_tokens']
+        self.assertLess(retrieval_tokens, full_tokens)
+
+    def test_backfill_rebuilds_chunks(self):
+        ContextChunk.objects.all().delete()
+        call_command('backfill_context_chunks', chunk_size=1, stdout=io.StringIO())
+        self.assertEqual(ContextChunk.objects.filter(device=self.device, source=ContextChunk.DESCRIPTION).count(), 3)
+        self.assertEqual(ContextChunk.objects.filter(device=self.device, source=ContextChunk.MESSAGE).count(), 21)
+
+
+# ------------ Chat response cache ------------
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, CHAT_RESPONSE_CACHE_TTL=60, CHAT_RESPONSE_CACHE_SIMILARITY=0.0)
+class ChatResponseCacheTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        chat_cache_metrics.reset()
+        self.device = Device.objects.create(
+            user=self.user, name='Sensor board', image='images/board.png', complexity='Low',
+            components=['ATmega328'], operating_voltage='5V', description='An Arduino clone.',
+        )
+        self.url = reverse('device-chat', args=[self.device.id])
+        self.llm_calls = 0
+
+    async def fake_ainvoke(self, messages, **kwargs):
+        self.llm_calls += 1
+        return AIMessage(content=f'answer {self.llm_calls}')
+
+    def chat(self, message, **data):
+        with patch.object(llm, 'primary_llm', MagicMock(ainvoke=self.fake_ainvoke)):
+            response = self.client.post(self.url, {'message': message, **data}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json()
+
+    def test_normalize_question(self):
+        self.assertEqual(normalize_question('  What is the Operating   Voltage?? '), 'what is the operating voltage')
+        self.assertEqual(normalize_question('Is 3.3V ok for the USB-C port?'), 'is 3.3v ok for the usb-c port')
+
+    def test_follow_up_questions(self):
+        self.assertTrue(is_follow_up('Why?'))
+        self.assertTrue(is_follow_up('Tell me more about the regulator'))
+        self.assertTrue(is_follow_up('What about the second one?'))
+        self.assertFalse(is_follow_up('What is the operating voltage?'))
+
+    def test_repeated_question_is_answered_without_llm(self):
+        first = self.chat('What is the operating voltage?')
+        second = self.chat('what is the operating voltage')
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['ai_response'], 'answer 1')
+        self.assertEqual(self.llm_calls, 1)
+        # The cached turn is still part of the history
+        self.assertEqual(list(self.device.chat_messages.values_list('role', flat=True)), ['user', 'ai'] * 2)
+        self.assertEqual(chat_cache_metrics.snapshot(), {'hits': 1, 'similar_hits': 0, 'misses': 1})
+
+    def test_answers_depend_on_what_the_user_said(self):
+        self.chat('What is the operating voltage?')
+        self.chat('My board actually runs from a 3.3V supply')
+
+        self.assertFalse(self.chat('What is the operating voltage?')['cached'])
+        self.assertTrue(self.chat('What is the operating voltage?')['cached'])
+        self.assertEqual(self.llm_calls, 3)
+
+    def test_follow_ups_are_not_cached(self):
+        self.chat('List the main ICs')
+        self.chat('Why?')
+
+        self.assertFalse(self.chat('Why?')['cached'])
+        self.assertEqual(self.llm_calls, 3)
+
+    @override_settings(CHAT_RESPONSE_CACHE_SIMILARITY=0.8)
+    def test_similar_wording_needs_the_same_conversation(self):
+        self.chat('List the main ICs')
+        self.chat('The regulator was replaced by an AMS1117')
+
+        self.assertFalse(self.chat('list the main ICs please')['cached'])
+
+    def test_device_changes_invalidate_answers(self):
+        self.chat('List the main ICs')
+        self.device.components = ['ATmega328', 'CH340G']
+        self.device.save()
+        self.assertFalse(self.chat('List the main ICs')['cached'])
+
+        # Edits that bypass signals change the fingerprint too
+        Device.objects.filter(pk=self.device.pk).update(operating_voltage='3.3V')
+        self.assertFalse(self.chat('List the main ICs')['cached'])
+        self.assertEqual(self.llm_calls, 3)
+
+    def test_fresh_and_other_devices_skip_the_cache(self):
+        self.chat('List the main ICs')
+        self.assertFalse(self.chat('List the main ICs', fresh=True)['cached'])
+        self.assertFalse(self.chat('List the main ICs', other_devices=True)['cached'])
+        self.assertEqual(self.chat('List the main ICs')['ai_response'], 'answer 2')
+
+    def test_entries_expire(self):
+        self.chat('List the main ICs')
+        later = time.monotonic() + 61
+        with patch('pcb_manager.chat_cache.time.monotonic', return_value=later):
+            self.assertFalse(self.chat('List the main ICs')['cached'])
+
+    @override_settings(CHAT_RESPONSE_CACHE_MAX_ENTRIES=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        chat_response_cache.set(self.device, 'what does U1 do', 'a1')
+        chat_response_cache.set(self.device, 'what does U2 do', 'a2')
+        chat_response_cache.get(self.device, 'what does U1 do')
+        chat_response_cache.set(self.device, 'what does U3 do', 'a3')
+
+        self.assertIsNone(chat_response_cache.get(self.device, 'what does U2 do'))
+        self.assertEqual(chat_response_cache.get(self.device, 'what does U1 do'), ('a1', 1.0))
+        self.assertEqual(chat_response_cache.get(self.device, 'what does U3 do'), ('a3', 1.0))
+
+    @override_settings(CHAT_RESPONSE_CACHE_SIMILARITY=0.8)
+    def test_similar_wording_reuses_answer(self):
+        self.chat('List the main ICs')
+        similar = self.chat('list the main ICs please')
+        self.assertTrue(similar['cached'])
+        self.assertGreaterEqual(similar['cache_similarity'], 0.8)
+        self.assertFalse(self.chat('What is the operating voltage?')['cached'])
+        self.assertEqual(chat_cache_metrics.snapshot()['similar_hits'], 1)
+
+    def test_disabled_with_zero_ttl(self):
+        with override_settings(CHAT_RESPONSE_CACHE_TTL=0):
+            self.chat('List the main ICs')
+            self.assertFalse(self.chat('List the main ICs')['cached'])
+
+    async def test_streaming_serves_cached_answer(self):
+        chat_response_cache.set(self.device, 'List the main ICs', 'An ATmega328.')
+        response = await self.async_client.post(
+            reverse('device-chat-stream', args=[self.device.id]), {'message': 'List the main ICs'},
+            content_type='application/json', headers={'Authorization': 'Token ' + self.token.key},
+        )
+        events = parse_sse(b"".join([chunk async for chunk in response.streaming_content]))
+
+        self.assertEqual(events[0], ('token', {'content': 'An ATmega328.'}))
+        self.assertEqual(events[-1][0], 'done')
+        self.assertTrue(events[-1][1]['cached'])
+        self.assertTrue(await ChatMessage.objects.filter(device=self.device, role='ai', content='An ATmega328.').aexists())
+
+
+# ------------ Bulk deletion and media cleanup ------------
+DELETION_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(
+    MEDIA_ROOT=DELETION_MEDIA_ROOT, MEDIA_VARIANT_ROOT=os.path.join(DELETION_MEDIA_ROOT, 'variants'),
+    DEVICE_PURGE_INPROCESS=False, USER_STATS_DENORMALIZED=True, RESPONSE_CACHE_TIMEOUT=0,
+)
+class DeviceDeletionTests(AuthenticatedAPITestCase):
+
+    def make_device(self, name, user=None):
+        device = Device.objects.create(
+            user=user or self.user, name=name, image=ContentFile(b'image', name=f'{name}.png'),
+            thumbnail=ContentFile(b'thumb', name=f'{name}.webp'), complexity='Low',
+            components=['LM7805'], operating_voltage='5V', description=f'{name} regulator board.',
+        )
+        device.chat_messages.create(role='user', content='hello')
+        return device
+
+    def media_path(self, name):
+        return os.path.join(DELETION_MEDIA_ROOT, name)
+
+    def setUp(self):
+        super().setUp()
+        self.devices = [self.make_device(f'board{index}') for index in range(3)]
+        self.other = self.make_device('theirs', user=User.objects.create_user(username='other', password='testpass123'))
+        self.url = reverse('device-bulk-delete')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(DELETION_MEDIA_ROOT, ignore_errors=True)
+
+    def test_bulk_delete_hides_devices_at_once(self):
+        self.client.get(reverse('user-stats'))  # create the counters row
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                self.url, {'ids': [self.devices[0].id, self.devices[1].id, self.other.id, 999999]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        # One UPDATE marks every device; nothing is deleted inside the request
+        statements = [query['sql'] for query in queries.captured_queries]
+        self.assertEqual(len([sql for sql in statements if sql.startswith('UPDATE "pcb_manager_device"')]), 1)
+        self.assertFalse([sql for sql in statements if sql.startswith('DELETE')])
+        self.assertEqual(response.data, {'deleted': 2})
+        listed = [device['id'] for device in self.client.get(reverse('device-list')).data]
+        self.assertEqual(listed, [self.devices[2].id])
+        detail = self.client.get(reverse('device-detail', args=[self.devices[0].id]))
+        self.assertEqual(detail.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('user-stats')).data['total_devices'], 1)
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'hello'}).data['messages'][0]['id'],
+                         self.devices[2].chat_messages.get().id)
+        # The other user's device is untouched, and the rows stay until the purge
+        self.assertIsNone(Device.objects.get(pk=self.other.pk).deleted_at)
+        self.assertEqual(Device.all_objects.count(), 4)
+
+    def test_purge_removes_rows_messages_and_files(self):
+        device = self.devices[0]
+        variant = os.path.join(DELETION_MEDIA_ROOT, 'variants', 'w256', os.path.relpath(device.image.name, 'images'))
+        os.makedirs(os.path.dirname(variant), exist_ok=True)
+        with open(variant, 'wb') as f:
+            f.write(b'variant')
+        self.client.get(reverse('user-stats'))
+        self.client.delete(reverse('device-delete', args=[device.id]))
+        files = [self.media_path(device.image.name), self.media_path(device.thumbnail.name), variant]
+        self.assertTrue(all(os.path.exists(path) for path in files))
+
+        self.assertEqual(purge_deleted_devices(batch_size=1), 1)
+
+        self.assertFalse(Device.all_objects.filter(pk=device.pk).exists())
+        self.assertFalse(ChatMessage.objects.filter(device_id=device.pk).exists())
+        self.assertFalse(ContextChunk.objects.filter(device_id=device.pk).exists())
+        self.assertFalse(any(os.path.exists(path) for path in files))
+        self.assertTrue(os.path.exists(self.media_path(self.devices[1].image.name)))
+        # Counters were adjusted when the device was marked, not again on purge
+        expected = aggregate_user_stats(self.user)
+        self.assertEqual(UserStats.objects.filter(user=self.user).values(*expected).get(), expected)
+        self.assertEqual(expected['device_count'], 2)
+
+    def test_delete_all_and_purge_in_batches(self):
+        response = self.client.post(self.url, {'all': True}, format='json')
+        self.assertEqual(response.data, {'deleted': 3})
+        self.assertEqual(purge_deleted_devices(batch_size=2, max_batches=1), 2)
+        self.assertEqual(purge_deleted_devices(batch_size=2), 1)
+        self.assertEqual(list(Device.all_objects.all()), [self.other])
+
+    def test_purge_is_started_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(self.url, {'ids': [self.devices[0].id]}, format='json')
+        self.assertIn(ensure_purge_started, callbacks)
+
+    def test_invalid_requests(self):
+        for data in ({}, {'ids': []}, {'ids': 'all'}, {'ids': ['1']}, {'ids': [True]}):
+            response = self.client.post(self.url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        with override_settings(DEVICE_BULK_DELETE_MAX_IDS=2):
+            response = self.client.post(self.url, {'ids': [1, 2, 3]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        other_device = self.client.delete(reverse('device-delete', args=[self.other.id]))
+        self.assertEqual(other_device.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Device.objects.count(), 4)
+
+    def test_sweep_orphaned_media(self):
+        orphan = self.media_path('images/orphan.png')
+        fresh_orphan = self.media_path('images/uploading.png')
+        orphan_variant = os.path.join(DELETION_MEDIA_ROOT, 'variants', 'w128', 'orphan.png')
+        kept_variant = os.path.join(DELETION_MEDIA_ROOT, 'variants', 'w128', os.path.relpath(self.devices[0].image.name, 'images'))
+        os.makedirs(os.path.dirname(orphan_variant), exist_ok=True)
+        for path in (orphan, fresh_orphan, orphan_variant, kept_variant):
+            with open(path, 'wb') as f:
+                f.write(b'data')
+        old = time.time() - 7200
+        for path in (orphan, orphan_variant, kept_variant, self.media_path(self.devices[0].image.name)):
+            os.utime(path, (old, old))
+
+        call_command('sweep_orphaned_media', dry_run=True, stdout=io.StringIO())
+        self.assertTrue(os.path.exists(orphan))
+
+        out = io.StringIO()
+        call_command('sweep_orphaned_media', stdout=out)
+        self.assertIn('Deleted 2 orphaned files', out.getvalue())
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(orphan_variant))
+        self.assertTrue(os.path.exists(fresh_orphan))
+        self.assertTrue(os.path.exists(kept_variant))
+        self.assertTrue(os.path.exists(self.media_path(self.devices[0].image.name)))
+
+    def test_sweep_keeps_files_that_were_not_uploaded(self):
+        shipped = self.media_path('images/leftpanel.jpg')
+        hand_placed = self.media_path('images/branding/logo.png')
+        upload_orphan = self.media_path('images/thumbs/gone_thumb.webp')
+        for path in (shipped, hand_placed, upload_orphan):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'data')
+            os.utime(path, (time.time() - 7200, time.time() - 7200))
+
+        call_command('sweep_orphaned_media', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(shipped))
+        self.assertTrue(os.path.exists(hand_placed))
+        self.assertFalse(os.path.exists(upload_orphan))
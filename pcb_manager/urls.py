@@ -4,15 +4,28 @@ from . import views
 urlpatterns = [
     # Matches /api/analyze-pcb/
     path('devices/analyze-pcb/', views.analyze_and_save_device, name='device-analyze-save'),
+    path('devices/analyze-pcb/batch/', views.analyze_devices_batch, name='device-analyze-batch'),
+    path('devices/analyze-pcb/jobs/', views.enqueue_device_analysis, name='device-analyze-enqueue'),
+    path('analysis-jobs/<int:job_id>/', views.get_analysis_job, name='analysis-job-detail'),
 
     # Matches /api/devices/
     path('devices/', views.list_all_devices, name='device-list'),
 
     # Matches /api/devices/5/
     path('devices/<int:device_id>/', views.get_device_by_id, name='device-detail'),
+    path('devices/<int:device_id>/similar/', views.get_similar_devices, name='device-similar'),
     path('devices/<int:device_id>/delete/', views.delete_device, name='device-delete'),
+    path('devices/bulk-delete/', views.bulk_delete_devices, name='device-bulk-delete'),
 
     # Matches /api/devices/5/chat/
     path('devices/<int:device_id>/chat/', views.chat_with_device, name='device-chat'),
+    path('devices/<int:device_id>/chat/stream/', views.stream_chat_with_device, name='device-chat-stream'),
+    path('search/', views.search, name='search'),
+    path('components/', views.component_frequencies, name='component-frequencies'),
+    path('stats/', views.get_user_stats, name='user-stats'),
     path('test-llm/', views.test_llm_connection, name='test_llm'),
+    path('analysis-cache/stats/', views.analysis_cache_stats, name='analysis-cache-stats'),
+    path('analysis-jobs/stats/', views.analysis_job_stats, name='analysis-job-stats'),
+    path('llm/stats/', views.llm_stats, name='llm-stats'),
+    path('metrics/', views.prometheus_metrics, name='metrics'),
 ]
\ No newline at end of file
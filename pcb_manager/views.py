@@ -1,58 +1,81 @@
 import json
-import base64
 import traceback
 import logging
-from django.shortcuts import get_object_or_404
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.urls import reverse
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.exceptions import ParseError, APIException
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.fields import BooleanField
 
-from .models import Device, PCBAnalysisResult
+from . import llm
+from .models import Device, ChatMessage, AnalysisJob, Component, UserStats
 from .serializers import (
-    DeviceResponseSerializer, DeviceWithMessagesSerializer
+    DeviceResponseSerializer, DeviceWithMessagesSerializer, AnalysisJobSerializer,
+    ChatMessageSerializer,
 )
+from .analysis import (
+    ANALYSIS_PROMPT_VERSION, AIAnalysisException, aanalyze_image, analysis_metrics, analysis_metrics_stats,
+)
+from .async_api import async_api_view
+from .llm_router import LLMUnavailable
+from .chat_context import aload_chat_context, estimate_prompt_tokens
+from .analysis_cache import analysis_cache
+from .jobs import enqueue_analysis_job, job_metrics
+from .stats import get_user_stats_counts
+from .pagination import DeviceCursorPagination
+from .images import prepare_image
+from .batch import analyze_batch, collect_batch_items
+from .response_cache import DEVICES, MESSAGES, cache_user_response, response_cache_stats
+from .search import full_text_available, search_devices, search_messages
+from .components import component_key
+from .near_duplicates import describe_near_duplicate, reuse_near_duplicate, to_db_hash
+from .instrumentation import counters_prometheus_lines, request_metrics
+from .embeddings import similar_devices
+from .retrieval import format_snippet, retrieve_context
+from .chat_cache import chat_cache_metrics, chat_response_cache, is_follow_up
+from .purge import soft_delete_devices
 
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_core.prompts import PromptTemplate
-
-import environ
-
-env = environ.Env()
-environ.Env.read_env()
 
 # Set up logging for debugging
 logger = logging.getLogger(__name__)
 
-# --- LLM Setup (can be moved to a separate file, e.g., api/llm.py) ---
-api_key = env("GOOGLE_API_KEY")
+# Chat messages returned per device detail request
+CHAT_HISTORY_PAGE_SIZE = 50
+CHAT_HISTORY_MAX_PAGE_SIZE = 200
 
-if api_key:
-    primary_llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.1, api_key=api_key)
-    model_name = "gemini-1.5-flash"
-else:
-    primary_llm = ChatOpenAI(base_url="http://localhost:1234/v1", api_key="lm-studio")
-    model_name = "lm-studio"
+# Results per kind returned by the search endpoint
+SEARCH_RESULTS_LIMIT = 20
+SEARCH_RESULTS_MAX_LIMIT = 100
 
-print(f"Using LLM: {model_name}")
+SIMILAR_DEVICES_LIMIT = 10
+SIMILAR_DEVICES_MAX_LIMIT = 50
 
 
-class AIAnalysisException(APIException):
-    status_code = 500
-    default_detail = 'Error during AI analysis.'
-    default_code = 'ai_error'
-
 # --- API Views ---
 
-@api_view(['POST'])
-@permission_classes([IsAuthenticated])
-def analyze_and_save_device(request):
+def _save_analyzed_device(user, device_data, thumbnail, perceptual_hash):
+    serializer = DeviceResponseSerializer(data=device_data)
+    if serializer.is_valid():
+        serializer.save(user=user, thumbnail=thumbnail, perceptual_hash=to_db_hash(perceptual_hash))
+        return serializer.data, True
+    return serializer.errors, False
+
+
+@async_api_view(['POST'])
+async def analyze_and_save_device(request):
     """
     Analyzes a PCB image and saves the resulting device for the authenticated user.
+
+    A re-shot photo of one of the user's boards (see NEAR_DUPLICATE_* settings)
+    reuses that device's analysis unless `reanalyze` is true; the response's
+    `near_duplicate` then names the matching device.
     """
     image_file = request.FILES.get('image')
     if not image_file:
@@ -60,62 +83,21 @@ def analyze_and_save_device(request):
     if not image_file.content_type.startswith("image/"):
         raise ParseError("Invalid file type. Please upload an image.")
 
-    try:
-        # Read image bytes and reset pointer
-        image_bytes = image_file.read()
-        image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-        image_file.seek(0)  # Reset for DRF serializer later
-        
-        prompt_template = """
-        Analyze the provided image of a Printed Circuit Board (PCB). Based on your analysis, provide a detailed and structured JSON output.
-
-        Identify the key characteristics of the board and follow these instructions:
-        - complexity: Classify the board's complexity as 'Low', 'Medium', or 'High' based on component density, number of layers, and trace routing.
-        - components: List the names of the most prominent and identifiable components on the board.
-        - operating_voltage: Estimate the primary operating voltage (e.g., "3.3V", "5V", "12V", "3.3V - 5V"). If unsure, state "Not determinable".
-        - description: Write a concise, one-paragraph technical description of the board's likely function and features.
-
-        {format_instructions}
-
-        The user has provided the image. Analyze it now.
-        """
-
-        # Create prompt
-        parser = JsonOutputParser(pydantic_object=PCBAnalysisResult)
-        prompt = PromptTemplate(
-            template=prompt_template,
-            input_variables=[],
-            partial_variables={"format_instructions": parser.get_format_instructions()},
-        )
-
-        message_content = [
-            {"type": "text", "text": prompt.format()},
-            {"type": "image_url", "image_url": f"data:{image_file.content_type};base64,{image_base64}"}
-        ]
-        if not model_name.startswith("gemini"):
-            message_content[1]["image_url"] = {"url": message_content[1]["image_url"]}
-
-        message = HumanMessage(content=message_content)
-        output = primary_llm.invoke([message])
-
-        if not output.content:
-            raise AIAnalysisException(detail="LLM returned empty response")
-
-        content = output.content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
+    # Orient, downscale and re-encode off the event loop; the LLM gets the small copy
+    prepared = await sync_to_async(prepare_image, thread_sensitive=False)(image_file.read(), image_file.name)
+    near_duplicate, analysis = await sync_to_async(reuse_near_duplicate)(
+        request.user, prepared.perceptual_hash, request.data.get("reanalyze") in BooleanField.TRUE_VALUES
+    )
+    reused = analysis is not None
 
-        try:
-            parsed_data = json.loads(content)
-        except json.JSONDecodeError:
-            raise AIAnalysisException(detail="LLM output is not valid JSON.")
-
-        try:
-            analysis = parser.parse(content)
-        except Exception:
-            analysis = parsed_data
+    try:
+        if reused:
+            analysis_source = "near-duplicate"
+        else:
+            analysis, cache_hit = await aanalyze_image(
+                prepared.llm_bytes, prepared.llm_content_type, prepared.content_hash
+            )
+            analysis_source = "hit" if cache_hit else "miss"
 
         # Add fallback/default name (could be user-generated later)
         device_data = {
@@ -124,43 +106,209 @@ def analyze_and_save_device(request):
             "operating_voltage": analysis.get("operating_voltage"),
             "complexity": analysis.get("complexity"),
             "description": analysis.get("description"),
-            "image": image_file,
+            "image": prepared.image,
         }
 
-        serializer = DeviceResponseSerializer(data=device_data)
-        if serializer.is_valid():
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    except AIAnalysisException as e:
+        data, created = await sync_to_async(_save_analyzed_device)(
+            request.user, device_data, prepared.thumbnail, prepared.perceptual_hash
+        )
+        if created:
+            if near_duplicate is not None:
+                data = {**data, "near_duplicate": describe_near_duplicate(near_duplicate, reused)}
+            return JsonResponse(
+                data,
+                status=status.HTTP_201_CREATED,
+                headers={"X-Analysis-Cache": analysis_source},
+            )
+        return JsonResponse(data, status=status.HTTP_400_BAD_REQUEST)
+
+    except (AIAnalysisException, LLMUnavailable, ValidationError) as e:
         raise e
     except Exception as e:
         logger.error(traceback.format_exc())
         raise AIAnalysisException(detail=f"Unexpected error: {str(e)}")
 
 
+@async_api_view(['POST'])
+async def analyze_devices_batch(request):
+    """
+    Analyzes many PCB images in one request: any number of `images` files
+    and/or a zip `archive` of images. Devices are named after their files.
+
+    Returns 201 when every image produced a device, otherwise 207 with the
+    per-item `results` showing which ones failed and why. Near-duplicates
+    are handled as by analyze_and_save_device, `reanalyze` included.
+    """
+    items = collect_batch_items(request.FILES)
+    results = await analyze_batch(
+        request.user, items, reanalyze=request.data.get("reanalyze") in BooleanField.TRUE_VALUES
+    )
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return JsonResponse(
+        {"created": created, "failed": len(results) - created, "results": results},
+        status=status.HTTP_201_CREATED if created == len(results) else status.HTTP_207_MULTI_STATUS,
+    )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def enqueue_device_analysis(request):
+    """
+    Queues a PCB image for background analysis and returns the job immediately.
+    Poll the job until it succeeds; its device is then included in the response.
+    Near-duplicates are handled as by analyze_and_save_device, `reanalyze` included.
+    """
+    image_file = request.FILES.get('image')
+    if not image_file:
+        raise ParseError("Image file not provided.")
+    if not image_file.content_type.startswith("image/"):
+        raise ParseError("Invalid file type. Please upload an image.")
+
+    job = enqueue_analysis_job(
+        request.user, image_file, request.data.get("name", "AI-Analyzed Device"),
+        reanalyze=request.data.get("reanalyze") in BooleanField.TRUE_VALUES,
+    )
+    return Response(
+        {
+            **AnalysisJobSerializer(job).data,
+            "status_url": request.build_absolute_uri(reverse("analysis-job-detail", args=[job.id])),
+        },
+        status=status.HTTP_202_ACCEPTED,
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def get_analysis_job(request, job_id):
+    """
+    Retrieve the status of one of the authenticated user's analysis jobs.
+    """
+    job = get_object_or_404(AnalysisJob.objects.select_related('device'), pk=job_id, user=request.user)
+    return Response(AnalysisJobSerializer(job).data)
+
+
+def _requested_fields(request, serializer_class):
+    # Parses ?fields=a,b,c against the fields the serializer can produce
+    if 'fields' not in request.query_params:
+        return None
+    fields = [field.strip() for field in request.query_params['fields'].split(',') if field.strip()]
+    unknown = set(fields) - set(serializer_class.Meta.fields)
+    if unknown or not fields:
+        raise ParseError(f"Unknown fields requested. Choose from: {', '.join(serializer_class.Meta.fields)}.")
+    return fields
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_user_response(DEVICES)
 def list_all_devices(request):
     """
     Retrieve all devices for the authenticated user.
+
+    `?fields=id,name,image` limits the returned fields (and the columns loaded).
+    Passing `page_size` or `cursor` switches to cursor pagination, returning
+    {"next", "previous", "results"} instead of a plain list.
     """
-    devices = Device.objects.filter(user=request.user).order_by('-created_at')
-    serializer = DeviceResponseSerializer(devices, many=True)
+    fields = _requested_fields(request, DeviceResponseSerializer)
+    devices = Device.objects.filter(user=request.user).order_by('-created_at', '-id')
+    if fields:
+        # id and created_at are always needed for the pagination cursor
+        devices = devices.only('id', 'created_at', *fields)
+
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        paginator = DeviceCursorPagination()
+        page = paginator.paginate_queryset(devices, request)
+        serializer = DeviceResponseSerializer(page, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+    serializer = DeviceResponseSerializer(devices, many=True, fields=fields)
     # print(serializer.data)  # Debugging output
     return Response(serializer.data)
 
 
+def _int_query_param(request, name, default=None, minimum=None, maximum=None):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ParseError(f"'{name}' must be an integer.")
+    if minimum is not None and value < minimum:
+        raise ParseError(f"'{name}' must be at least {minimum}.")
+    return min(value, maximum) if maximum is not None else value
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_user_response(DEVICES, MESSAGES)
 def get_device_by_id(request, device_id):
     """
     Retrieve a specific device by its ID for the authenticated user, including its chat history.
+
+    Only the latest `messages_limit` messages are included, oldest first.
+    `before=<message_id>` pages further back: `messages_page.before` is the value
+    for the next older page, or null at the start of the history.
+    `since=<message_id>` returns just the messages newer than that id, without
+    the device fields, for clients that already hold the rest.
     """
+    limit = _int_query_param(request, 'messages_limit', CHAT_HISTORY_PAGE_SIZE, minimum=1, maximum=CHAT_HISTORY_MAX_PAGE_SIZE)
+    since = _int_query_param(request, 'since', minimum=0)
+    before = _int_query_param(request, 'before', minimum=0)
+
+    if since is not None:
+        get_object_or_404(Device.objects.only('id'), pk=device_id, user=request.user)
+        messages = list(
+            ChatMessage.objects.filter(device_id=device_id, id__gt=since).order_by('id')[:limit + 1]
+        )
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        return Response({
+            "device_id": device_id,
+            "chat_messages": ChatMessageSerializer(messages, many=True).data,
+            "messages_page": {
+                "has_more": has_more,
+                "latest_id": messages[-1].id if messages else since,
+            },
+        })
+
     device = get_object_or_404(Device, pk=device_id, user=request.user)
-    serializer = DeviceWithMessagesSerializer(device)
-    return Response(serializer.data)
+    # Paged on the id, so ordered by it too: created_at can disagree with the
+    # insertion order for backfilled or bulk-inserted messages
+    messages = device.chat_messages.order_by('-id')
+    if before is not None:
+        messages = messages.filter(id__lt=before)
+    messages = list(messages[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit][::-1]
+
+    serializer = DeviceWithMessagesSerializer(device, context={'chat_messages': messages})
+    return Response({
+        **serializer.data,
+        "messages_page": {
+            "has_more": has_more,
+            "before": messages[0].id if has_more else None,
+            "latest_id": messages[-1].id if messages else None,
+        },
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_user_response(DEVICES)
+def get_similar_devices(request, device_id):
+    """
+    The authenticated user's devices most similar to this one by components
+    and description, best first. `k` sets how many (default 10).
+    """
+    device = get_object_or_404(Device, pk=device_id, user=request.user)
+    k = _int_query_param(request, 'k', SIMILAR_DEVICES_LIMIT, minimum=1, maximum=SIMILAR_DEVICES_MAX_LIMIT)
+
+    return Response([
+        {"score": round(score, 4), "device": DeviceResponseSerializer(similar).data}
+        for similar, score in similar_devices(device, k)
+    ])
 
 
 @api_view(['DELETE'])
@@ -168,115 +316,437 @@ def get_device_by_id(request, device_id):
 def delete_device(request, device_id):
     """
     Delete a specific device by its ID for the authenticated user.
+
+    The device disappears at once; its messages and files are removed in the
+    background.
     """
-    device = get_object_or_404(Device, pk=device_id, user=request.user)
-    device.delete()
+    get_object_or_404(Device.objects.only('id'), pk=device_id, user=request.user)
+    soft_delete_devices(request.user, Device.objects.filter(pk=device_id))
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def chat_with_device(request, device_id):
+def bulk_delete_devices(request):
     """
-    Persistent chat endpoint for user's device. Django's ORM handles database sessions.
-    """
-    device = get_object_or_404(Device, pk=device_id, user=request.user)
-    user_message_content = request.data.get('message')
-    if not user_message_content:
-        raise ParseError("Message content not provided.")
+    Delete many of the authenticated user's devices in one request: `ids`, a
+    list of device ids (at most DEVICE_BULK_DELETE_MAX_IDS), or `all: true`.
 
-    # --- Step 1: Save user message and get history ---
-    device.chat_messages.create(role="user", content=user_message_content)
-    history_from_db = device.chat_messages.all().order_by('created_at')
+    Devices are marked deleted in a single query and disappear at once; their
+    messages and files are purged in the background, hence 202. `deleted`
+    counts the devices found; unknown ids are ignored.
+    """
+    if request.data.get('all') in BooleanField.TRUE_VALUES:
+        devices = Device.objects.all()
+    else:
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise ParseError("Provide 'ids', a list of device ids, or 'all': true.")
+        if len(ids) > settings.DEVICE_BULK_DELETE_MAX_IDS:
+            raise ParseError(f"At most {settings.DEVICE_BULK_DELETE_MAX_IDS} ids per request.")
+        if not all(isinstance(device_id, int) and not isinstance(device_id, bool) for device_id in ids):
+            raise ParseError("'ids' must contain integers only.")
+        devices = Device.objects.filter(pk__in=ids)
+
+    deleted = soft_delete_devices(request.user, devices)
+    return Response({"deleted": deleted}, status=status.HTTP_202_ACCEPTED)
+
+
+def _device_conversation(request, device, summary, history, snippets=None):
+    """
+    Builds the LLM message list for a device chat: device context, the rolling
+    summary of older turns and the recent history. With retrieval, `snippets`
+    ([(chunk, score)]) stand in for the description and the turns between
+    the summary and the recent history.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
-    # --- Step 2: AI Processing ---
-    try:
-        components_str = ", ".join(device.components)
-        image_url = request.build_absolute_uri(device.image.url.lstrip('/'))
-        device_context = f"""
+    components_str = ", ".join(device.components)
+    image_url = request.build_absolute_uri(device.image.url.lstrip('/'))
+    device_context = f"""
         Device Information:
         - Name: {device.name}
         - Owner: {device.user.username}
         - Complexity: {device.complexity}
         - Components: {components_str}
         - Operating Voltage: {device.operating_voltage}
-        - Description: {device.description}
-        - Image: Available at {image_url}
         """
-        system_message = SystemMessage(content=f"You are an expert electronics engineer specializing in PCB analysis and troubleshooting. {device_context}")
+    if snippets is None:
+        device_context += f"""- Description: {device.description}
+        """
+    device_context += f"""- Image: Available at {image_url}
+        """
+    if summary:
+        device_context += f"""
+        Summary of the earlier conversation:
+        {summary}
+        """
+    if snippets:
+        snippet_lines = "\n".join(format_snippet(device, chunk) for chunk, _ in snippets)
+        device_context += f"""
+        Notes relevant to the question, from the device description and earlier conversations:
+{snippet_lines}
+        """
+    system_message = SystemMessage(content=f"You are an expert electronics engineer specializing in PCB analysis and troubleshooting. {device_context}")
+
+    conversation_history = [system_message]
+    for msg in history:
+        if msg.role == "user":
+            conversation_history.append(HumanMessage(content=msg.content))
+        elif msg.role == "ai":
+            conversation_history.append(AIMessage(content=msg.content))
+    logger.info(
+        f"Chat prompt for device {device.id}: {len(conversation_history)} messages, "
+        f"{len(snippets or [])} retrieved snippets, ~{estimate_prompt_tokens(conversation_history)} tokens"
+    )
+    return conversation_history
+
+
+def _retrieved_sources(snippets):
+    return [
+        {"device_id": chunk.device_id, "message_id": chunk.message_id, "source": chunk.source, "score": round(score, 4)}
+        for chunk, score in snippets
+    ]
+
+
+async def _start_chat_turn(request, device_id):
+    # Shared by the JSON and streaming chat views: validate and store the question
+    device = await aget_object_or_404(Device.objects.select_related('user'), pk=device_id, user=request.user)
+    user_message_content = request.data.get('message')
+    if not user_message_content:
+        raise ParseError("Message content not provided.")
+
+    await device.chat_messages.acreate(role="user", content=user_message_content)
+    return device, user_message_content
+
+
+def _wants_other_devices(request):
+    return (
+        settings.CHAT_RETRIEVAL_ENABLED
+        and request.data.get('other_devices', settings.CHAT_RETRIEVAL_OTHER_DEVICES) in BooleanField.TRUE_VALUES
+    )
+
+
+async def _cacheable_turn(request, device, question):
+    """
+    The user's messages in the device chat, which the chat response cache
+    keys answers on, or None when the answer must not be cached: for follow-up
+    questions and for answers drawing on other devices, whose changes the
+    cache can't see.
+    """
+    if not settings.CHAT_RESPONSE_CACHE_TTL or is_follow_up(question) or _wants_other_devices(request):
+        return None
+    return [
+        content async for content in
+        device.chat_messages.filter(role="user").order_by('id').values_list('content', flat=True)
+    ]
+
+
+def _cached_chat_answer(request, device, question, user_messages):
+    """
+    (answer, similarity) from the chat response cache, or None. Skipped with
+    `fresh` and for turns that are not cacheable.
+    """
+    if user_messages is None or request.data.get('fresh') in BooleanField.TRUE_VALUES:
+        return None
+    return chat_response_cache.get(device, question, user_messages)
+
+
+async def _load_turn_context(request, device, question):
+    """
+    Returns (summary, history, snippets) for the prompt; snippets is None
+    when retrieval is off. Older turns are folded into the rolling summary
+    either way; with retrieval only the newest CHAT_RETRIEVAL_RECENT_MESSAGES
+    of the rest are sent verbatim and snippets stand in for the others.
+    """
+    summary, history_from_db = await aload_chat_context(device)
+    if not settings.CHAT_RETRIEVAL_ENABLED:
+        return summary, history_from_db, None
+
+    history_from_db = history_from_db[-max(1, settings.CHAT_RETRIEVAL_RECENT_MESSAGES):]
+    snippets = await sync_to_async(retrieve_context)(
+        device, question,
+        exclude_messages=[message.id for message in history_from_db],
+        other_devices=_wants_other_devices(request),
+    )
+    return summary, history_from_db, snippets
 
-        conversation_history = [system_message]
-        for msg in history_from_db:
-            if msg.role == "user":
-                conversation_history.append(HumanMessage(content=msg.content))
-            elif msg.role == "ai":
-                conversation_history.append(AIMessage(content=msg.content))
 
-        response = primary_llm.invoke(conversation_history)
+@async_api_view(['POST'])
+async def chat_with_device(request, device_id):
+    """
+    Persistent chat endpoint for user's device. Django's ORM handles database sessions.
+
+    With CHAT_RETRIEVAL_ENABLED, `other_devices` (default
+    CHAT_RETRIEVAL_OTHER_DEVICES) also draws context from the user's other
+    devices; `retrieved` lists the snippets that went into the prompt.
+    Repeated questions about an unchanged device, with nothing new said in
+    the chat since, are answered from the chat response cache without an LLM
+    call (`cached` is true); send `fresh` to always ask the LLM.
+    """
+    # --- Step 1: Save user message and get history ---
+    device, user_message_content = await _start_chat_turn(request, device_id)
+
+    user_messages = await _cacheable_turn(request, device, user_message_content)
+    cached = _cached_chat_answer(request, device, user_message_content, user_messages)
+    if cached is not None:
+        ai_response_content, similarity = cached
+        await device.chat_messages.acreate(role="ai", content=ai_response_content)
+        return JsonResponse({
+            "device_id": device.id,
+            "ai_response": ai_response_content,
+            "prompt_tokens": 0,
+            "retrieved": [],
+            "cached": True,
+            "cache_similarity": round(similarity, 4),
+        }, status=status.HTTP_200_OK)
+
+    summary, history_from_db, snippets = await _load_turn_context(request, device, user_message_content)
+
+    # --- Step 2: AI Processing ---
+    try:
+        conversation_history = _device_conversation(request, device, summary, history_from_db, snippets)
+        response = await llm.primary_llm.ainvoke(conversation_history)
         ai_response_content = response.content
         
         if not ai_response_content:
             raise AIAnalysisException(detail="AI returned empty response")
 
+    except (AIAnalysisException, LLMUnavailable):
+        raise
     except Exception as e:
         logger.error(f"Error in chat_with_device: {str(e)}")
         logger.error(traceback.format_exc())
         raise AIAnalysisException(detail=f"Error during AI processing: {str(e)}")
 
     # --- Step 3: Save AI Response to Database ---
-    device.chat_messages.create(role="ai", content=ai_response_content)
+    await device.chat_messages.acreate(role="ai", content=ai_response_content)
+    if user_messages is not None:
+        chat_response_cache.set(device, user_message_content, ai_response_content, user_messages)
 
-    return Response({
+    return JsonResponse({
         "device_id": device.id,
         "ai_response": ai_response_content,
+        "prompt_tokens": estimate_prompt_tokens(conversation_history),
+        "retrieved": _retrieved_sources(snippets or []),
+        "cached": False,
     }, status=status.HTTP_200_OK)
 
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@async_api_view(['POST'])
+async def stream_chat_with_device(request, device_id):
+    """
+    Same as chat_with_device, but streams the AI reply as server-sent events.
+
+    Emits one `token` event per chunk from the LLM, then a `done` event with the
+    id of the stored AI message, or an `error` event if the LLM call fails.
+    A cached answer is sent as a single `token` event.
+    """
+    device, user_message_content = await _start_chat_turn(request, device_id)
+
+    user_messages = await _cacheable_turn(request, device, user_message_content)
+    cached = _cached_chat_answer(request, device, user_message_content, user_messages)
+    if cached is not None:
+        ai_response_content, similarity = cached
+
+        async def event_stream():
+            message = await device.chat_messages.acreate(role="ai", content=ai_response_content)
+            yield _sse_event("token", {"content": ai_response_content})
+            yield _sse_event("done", {
+                "device_id": device.id,
+                "message_id": message.id,
+                "prompt_tokens": 0,
+                "retrieved": [],
+                "cached": True,
+                "cache_similarity": round(similarity, 4),
+            })
+    else:
+        summary, history_from_db, snippets = await _load_turn_context(request, device, user_message_content)
+        conversation_history = _device_conversation(request, device, summary, history_from_db, snippets)
+
+        async def event_stream():
+            chunks = []
+            try:
+                async for chunk in llm.primary_llm.astream(conversation_history):
+                    if chunk.content:
+                        chunks.append(chunk.content)
+                        yield _sse_event("token", {"content": chunk.content})
+            except Exception as e:
+                logger.error(f"Error in stream_chat_with_device: {str(e)}")
+                logger.error(traceback.format_exc())
+                yield _sse_event("error", {"detail": f"Error during AI processing: {str(e)}"})
+                return
+
+            ai_response_content = "".join(chunks)
+            if not ai_response_content:
+                yield _sse_event("error", {"detail": "AI returned empty response"})
+                return
+
+            # The reply is only stored once the stream has completed
+            message = await device.chat_messages.acreate(role="ai", content=ai_response_content)
+            if user_messages is not None:
+                chat_response_cache.set(device, user_message_content, ai_response_content, user_messages)
+            yield _sse_event("done", {
+                "device_id": device.id,
+                "message_id": message.id,
+                "prompt_tokens": estimate_prompt_tokens(conversation_history),
+                "retrieved": _retrieved_sources(snippets or []),
+                "cached": False,
+            })
+
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_user_response(DEVICES, MESSAGES)
 def get_user_stats(request):
     """
     Get statistics for the authenticated user.
     """
-    user_devices = Device.objects.filter(user=request.user)
-    total_devices = user_devices.count()
-    total_messages = sum(device.chat_messages.count() for device in user_devices)
-    
+    counts = get_user_stats_counts(request.user)
+
     return Response({
         "username": request.user.username,
-        "total_devices": total_devices,
-        "total_chat_messages": total_messages,
+        "total_devices": counts["device_count"],
+        "total_chat_messages": counts["message_count"],
         "devices_by_complexity": {
-            "Low": user_devices.filter(complexity="Low").count(),
-            "Medium": user_devices.filter(complexity="Medium").count(),
-            "High": user_devices.filter(complexity="High").count(),
+            complexity: counts[field] for complexity, field in UserStats.COMPLEXITY_FIELDS.items()
         }
     })
 
 
-# Debug endpoint to test LLM connection
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def test_llm_connection(request):
+@cache_user_response(DEVICES, MESSAGES)
+def search(request):
+    """
+    Search the authenticated user's devices and chat messages.
+
+    `q` matches device names, components and descriptions and message
+    contents (PostgreSQL web-search syntax: "quoted phrases", or, -exclude).
+    `component` keeps only devices whose component list contains that exact
+    entry. At least one of them is required; results are best match first.
+    """
+    text = request.query_params.get('q', '').strip()
+    component = request.query_params.get('component', '').strip()
+    if not text and not component:
+        raise ParseError("Provide a search term as 'q' or a component as 'component'.")
+    limit = _int_query_param(request, 'limit', SEARCH_RESULTS_LIMIT, minimum=1, maximum=SEARCH_RESULTS_MAX_LIMIT)
+
+    devices = search_devices(request.user, text, component)[:limit]
+    # A component filter narrows the search to devices
+    messages = search_messages(request.user, text)[:limit] if text and not component else []
+
+    return Response({
+        "full_text": full_text_available(),
+        "devices": DeviceResponseSerializer(devices, many=True).data,
+        "messages": ChatMessageSerializer(messages, many=True).data,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cache_user_response(DEVICES)
+def component_frequencies(request):
+    """
+    How many of the authenticated user's devices use each component, most
+    common first. `name` narrows it to one part under any of its spellings.
+    """
+    limit = _int_query_param(request, 'limit', minimum=1)
+    components = (
+        Component.objects.filter(devices__user=request.user, devices__deleted_at__isnull=True)
+        .values('name')
+        .annotate(device_count=Count('devices'))
+        .order_by('-device_count', 'name')
+    )
+    name = request.query_params.get('name', '').strip()
+    if name:
+        components = components.filter(key=component_key(name))
+    if limit is not None:
+        components = components[:limit]
+    return Response(list(components))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analysis_cache_stats(request):
+    """
+    Hit/miss counters for this process's analysis and response caches, and
+    how often analysis replies could not be parsed.
+    """
+    return Response({
+        "llm_model": llm.model_name,
+        "prompt_version": ANALYSIS_PROMPT_VERSION,
+        **analysis_cache.stats(),
+        "output_parsing": analysis_metrics_stats(),
+        "response_cache": response_cache_stats.stats(),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analysis_job_stats(request):
+    """
+    Queue depth and timing metrics for background analysis jobs.
+    """
+    return Response(job_metrics())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def llm_stats(request):
+    """
+    Circuit state, failure counts and latency histograms of each LLM backend.
+    """
+    return Response(llm.primary_llm.stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def prometheus_metrics(request):
+    """
+    Per-endpoint request metrics (REQUEST_METRICS_ENABLED), analysis output
+    and chat response cache counters of this process, in the Prometheus text
+    exposition format.
+    """
+    lines = request_metrics.prometheus_lines()
+    lines += counters_prometheus_lines('pcb_analysis', analysis_metrics, 'PCB analysis LLM calls and parse outcomes.')
+    lines += counters_prometheus_lines('pcb_chat_cache', chat_cache_metrics, 'Chat response cache lookups by outcome.')
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Debug endpoint to test LLM connection
+@async_api_view(['GET'])
+async def test_llm_connection(request):
     """
     Test endpoint to verify LLM connectivity for authenticated users.
     """
+    from langchain_core.messages import HumanMessage
+
     try:
         test_message = HumanMessage(content="Respond with a simple JSON object: {\"status\": \"working\", \"message\": \"LLM is functioning correctly\"}")
-        response = primary_llm.invoke([test_message])
+        response = await llm.primary_llm.ainvoke([test_message])
         
-        return Response({
+        return JsonResponse({
             "user": request.user.username,
-            "llm_model": model_name,
+            "llm_model": llm.model_name,
             "connection_status": "success",
             "response_type": type(response).__name__,
             "response_content": response.content,
             "has_content": bool(response.content)
         })
     except Exception as e:
-        return Response({
+        return JsonResponse({
             "user": request.user.username,
-            "llm_model": model_name,
+            "llm_model": llm.model_name,
             "connection_status": "failed",
             "error": str(e),
             "traceback": traceback.format_exc()
-        }, status=500)
\ No newline at end of file
+        }, status=500)
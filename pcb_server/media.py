@@ -0,0 +1,189 @@
+import mimetypes
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+mimetypes.add_type('image/webp', '.webp')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class _RangeFile:
+    """
+    Read-only view of `length` bytes of an open file, for 206 responses.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _parse_range(header, size):
+    """
+    Returns (start, end) for a single satisfiable byte range, None if the
+    header should be ignored, or False if the range cannot be satisfied.
+    Multi-range requests are answered with the whole file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _variant_width(requested):
+    """
+    Snaps a requested width up to the nearest MEDIA_VARIANT_WIDTHS entry, so
+    arbitrary ?w= values cannot fill the disk with variants.
+    """
+    try:
+        requested = int(requested)
+    except ValueError:
+        return None
+    if requested <= 0:
+        return None
+    for width in sorted(settings.MEDIA_VARIANT_WIDTHS):
+        if width >= requested:
+            return width
+    return 0
+
+
+def _variant_path(source_path, relative_name, width):
+    """
+    Returns the path of the `width`-pixel-wide copy of an image, generating it
+    on first use or when the source has changed since. Returns the source
+    itself when it is already narrow enough.
+    """
+    path = os.path.join(settings.MEDIA_VARIANT_ROOT, f"w{width}", relative_name)
+    try:
+        if os.stat(path).st_mtime >= os.stat(source_path).st_mtime:
+            return path
+    except FileNotFoundError:
+        pass
+
+    try:
+        with Image.open(source_path) as image:
+            if image.width <= width:
+                return source_path
+            image_format = image.format
+            variant = ImageOps.exif_transpose(image)
+            variant.thumbnail((width, variant.height), Image.Resampling.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so concurrent requests never serve a half-written file
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    variant.save(temp_file, format=image_format)
+                os.replace(temp_path, path)
+            finally:
+                # Gone after a successful rename; otherwise don't leave it in the media directory
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+    except (UnidentifiedImageError, OSError):
+        raise Http404("Image not found")
+    return path
+
+
+def _etag(stat):
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def _file_response(request, path, stat, content_type):
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    byte_range = _parse_range(range_header, stat.st_size) if range_header else None
+    if if_range and if_range != quote_etag(_etag(stat)):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{stat.st_size}"
+        return response
+
+    if byte_range is None:
+        # Whole file: WSGI servers with wsgi.file_wrapper send it with sendfile()
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(_RangeFile(open(path, 'rb'), start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f"bytes {start}-{end}/{stat.st_size}"
+    return response
+
+
+@require_safe
+def serve_image(request, filename):
+    """
+    Serves an uploaded image with ETag/Last-Modified validation and byte
+    ranges. `?w=<pixels>` serves a narrower copy that is cached on disk.
+    """
+    filename = filename.strip('/')
+    images_root = os.path.join(settings.MEDIA_ROOT, 'images')
+    try:
+        path = safe_join(images_root, filename)
+    except SuspiciousFileOperation:
+        raise Http404("Image not found")
+
+    if not os.path.isfile(path):
+        raise Http404("Image not found")
+
+    if 'w' in request.GET:
+        width = _variant_width(request.GET['w'])
+        if width is None:
+            return HttpResponseBadRequest("w must be a positive integer.")
+        if width:
+            path = _variant_path(path, os.path.relpath(path, images_root), width)
+
+    stat = os.stat(path)
+    etag = _etag(stat)
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if settings.MEDIA_ACCEL_REDIRECT_PREFIX:
+            # Let nginx send the bytes (and handle ranges) from an internal location
+            response = HttpResponse(content_type=content_type)
+            relative_path = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + relative_path
+        else:
+            response = _file_response(request, path, stat, content_type)
+            response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = f"public, max-age={settings.MEDIA_CACHE_MAX_AGE}"
+    return response
@@ -62,6 +62,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-endpoint latency, DB, LLM and serializer histograms, exported in the
+# Prometheus text format at /api/metrics/ (admin token required). Off by
+# default; the hooks cost next to nothing while the middleware isn't installed.
+REQUEST_METRICS_ENABLED = env.bool('REQUEST_METRICS_ENABLED', default=False)
+if REQUEST_METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'pcb_manager.instrumentation.RequestMetricsMiddleware')
+
 ROOT_URLCONF = 'pcb_server.urls'
 
 TEMPLATES = [
@@ -92,6 +99,23 @@ PSQL_PASSWORD = env('PSQL_PASSWORD')
 PSQL_HOST = env('PSQL_HOST')
 PSQL_PORT = env('PSQL_PORT')
 
+# Connections come from a per-process psycopg pool (psycopg 3 only), so a
+# request checks one out instead of opening a new one. Each gunicorn/uvicorn
+# worker has its own pool: keep workers * DB_POOL_MAX_SIZE below the server's
+# max_connections. Async views use the ORM from sync_to_async threads, which
+# check out and return connections the same way.
+# With DB_POOL=false, connections persist per thread for DB_CONN_MAX_AGE seconds.
+DB_POOL = env.bool('DB_POOL', default=True)
+DB_POOL_MIN_SIZE = env.int('DB_POOL_MIN_SIZE', default=2)
+DB_POOL_MAX_SIZE = env.int('DB_POOL_MAX_SIZE', default=10)
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = env.float('DB_POOL_TIMEOUT', default=10.0)
+# Idle connections above min size are closed after this many seconds, and every
+# connection is replaced after DB_POOL_MAX_LIFETIME
+DB_POOL_MAX_IDLE = env.float('DB_POOL_MAX_IDLE', default=300.0)
+DB_POOL_MAX_LIFETIME = env.float('DB_POOL_MAX_LIFETIME', default=3600.0)
+DB_CONN_MAX_AGE = env.int('DB_CONN_MAX_AGE', default=60)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -100,6 +124,20 @@ DATABASES = {
         'PASSWORD': PSQL_PASSWORD,
         'HOST': PSQL_HOST,
         'PORT': PSQL_PORT,
+        # Pooled connections must not also be persistent
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        # Test a connection before reusing it for a new request; with the pool,
+        # Django passes psycopg's check so a dropped connection is replaced
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'pool': {
+                'min_size': DB_POOL_MIN_SIZE,
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+                'max_idle': DB_POOL_MAX_IDLE,
+                'max_lifetime': DB_POOL_MAX_LIFETIME,
+            },
+        } if DB_POOL else {},
     }
 }
 
@@ -124,7 +162,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -155,3 +193,166 @@ MEDIA_ROOT = BASE_DIR / 'media'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# PCB analysis
+# Size of the in-process LRU in front of the AnalysisCacheEntry table.
+ANALYSIS_CACHE_MAX_ENTRIES = env.int('ANALYSIS_CACHE_MAX_ENTRIES', default=1024)
+# Text-only re-asks when an analysis reply is not valid JSON for the schema.
+ANALYSIS_REPAIR_ATTEMPTS = env.int('ANALYSIS_REPAIR_ATTEMPTS', default=1)
+# Extra component spellings to fold together, as a JSON object of
+# alias -> canonical name, e.g. {"ATmega328P-PU": "ATmega328P"}.
+COMPONENT_ALIASES = env.json('COMPONENT_ALIASES', default={})
+
+# Background analysis jobs
+# Worker threads started inside each web process; set to 0 when running
+# `manage.py run_analysis_workers` as a separate process instead.
+ANALYSIS_JOB_INPROCESS_WORKERS = env.int('ANALYSIS_JOB_INPROCESS_WORKERS', default=2)
+ANALYSIS_JOB_MAX_ATTEMPTS = env.int('ANALYSIS_JOB_MAX_ATTEMPTS', default=3)
+# Seconds before the first retry; doubles with every further attempt.
+ANALYSIS_JOB_RETRY_BACKOFF = env.float('ANALYSIS_JOB_RETRY_BACKOFF', default=2.0)
+# Seconds a job may stay running before it is considered lost and requeued.
+# A worker that finishes after its job was requeued discards its result.
+ANALYSIS_JOB_TIMEOUT = env.int('ANALYSIS_JOB_TIMEOUT', default=300)
+ANALYSIS_JOB_MAX_RUNNING_PER_USER = env.int('ANALYSIS_JOB_MAX_RUNNING_PER_USER', default=2)
+ANALYSIS_JOB_MAX_PENDING_PER_USER = env.int('ANALYSIS_JOB_MAX_PENDING_PER_USER', default=20)
+
+# Chat context window
+# Newest messages sent verbatim to the LLM, bounded by count and by estimated
+# tokens (about 4 characters each). Older messages are folded into a rolling summary.
+CHAT_CONTEXT_MAX_MESSAGES = env.int('CHAT_CONTEXT_MAX_MESSAGES', default=20)
+CHAT_CONTEXT_TOKEN_BUDGET = env.int('CHAT_CONTEXT_TOKEN_BUDGET', default=4000)
+
+# Retrieval-augmented chat: instead of the description and the whole window
+# above, each turn sends the device's basic facts, the rolling summary, the
+# last CHAT_RETRIEVAL_RECENT_MESSAGES messages of the window and the
+# CHAT_RETRIEVAL_TOP_K description and message chunks most similar to the
+# question (embedded with EMBEDDING_FUNCTION). Clients can ask for chunks from their other devices
+# too with `other_devices`; CHAT_RETRIEVAL_OTHER_DEVICES is the default.
+# Run `manage.py backfill_context_chunks` after turning this on.
+CHAT_RETRIEVAL_ENABLED = env.bool('CHAT_RETRIEVAL_ENABLED', default=True)
+CHAT_RETRIEVAL_RECENT_MESSAGES = env.int('CHAT_RETRIEVAL_RECENT_MESSAGES', default=4)
+CHAT_RETRIEVAL_TOP_K = env.int('CHAT_RETRIEVAL_TOP_K', default=6)
+CHAT_RETRIEVAL_OTHER_DEVICES = env.bool('CHAT_RETRIEVAL_OTHER_DEVICES', default=False)
+CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K = env.int('CHAT_RETRIEVAL_OTHER_DEVICES_TOP_K', default=3)
+CHAT_RETRIEVAL_MIN_SCORE = env.float('CHAT_RETRIEVAL_MIN_SCORE', default=0.05)
+CHAT_RETRIEVAL_CHUNK_CHARS = env.int('CHAT_RETRIEVAL_CHUNK_CHARS', default=600)
+
+# Repeated chat questions: answers are kept per process for
+# CHAT_RESPONSE_CACHE_TTL seconds (0 disables) and reused for the same
+# normalized question about an unchanged device, without an LLM call, as long
+# as the user has said nothing new in the chat since. Short and follow-up
+# questions ("why?", "tell me more") are always sent to the LLM. Set
+# CHAT_RESPONSE_CACHE_SIMILARITY (cosine, e.g. 0.9) to also reuse them for
+# differently worded questions whose embeddings are at least that close.
+CHAT_RESPONSE_CACHE_TTL = env.int('CHAT_RESPONSE_CACHE_TTL', default=60 * 60)
+CHAT_RESPONSE_CACHE_MAX_ENTRIES = env.int('CHAT_RESPONSE_CACHE_MAX_ENTRIES', default=10000)
+CHAT_RESPONSE_CACHE_SIMILARITY = env.float('CHAT_RESPONSE_CACHE_SIMILARITY', default=0.0)
+
+# Serve /api/stats/ from per-user counters maintained on device/message
+# create and delete instead of aggregating on every request.
+USER_STATS_DENORMALIZED = env.bool('USER_STATS_DENORMALIZED', default=True)
+
+# Upload preprocessing
+# Longest edge, in pixels, of the copy sent to the LLM, of the stored image and of its thumbnail.
+ANALYSIS_IMAGE_MAX_EDGE = env.int('ANALYSIS_IMAGE_MAX_EDGE', default=1568)
+STORED_IMAGE_MAX_EDGE = env.int('STORED_IMAGE_MAX_EDGE', default=2560)
+THUMBNAIL_MAX_EDGE = env.int('THUMBNAIL_MAX_EDGE', default=320)
+# 'WEBP' or 'JPEG'
+STORED_IMAGE_FORMAT = env('STORED_IMAGE_FORMAT', default='WEBP')
+IMAGE_QUALITY = env.int('IMAGE_QUALITY', default=85)
+
+# Near-duplicate uploads
+# An upload whose perceptual hash is within NEAR_DUPLICATE_MAX_DISTANCE bits
+# (of 64) of one of the user's devices reuses that device's analysis instead
+# of calling the LLM, unless NEAR_DUPLICATE_REUSE is off or the client sends
+# reanalyze=true. Either way the match is reported in the response.
+NEAR_DUPLICATE_DETECTION = env.bool('NEAR_DUPLICATE_DETECTION', default=True)
+NEAR_DUPLICATE_MAX_DISTANCE = env.int('NEAR_DUPLICATE_MAX_DISTANCE', default=6)
+NEAR_DUPLICATE_REUSE = env.bool('NEAR_DUPLICATE_REUSE', default=True)
+# Users whose hash index is kept in memory per process
+NEAR_DUPLICATE_INDEX_MAX_USERS = env.int('NEAR_DUPLICATE_INDEX_MAX_USERS', default=1000)
+
+# Similar device search
+# Dotted path of a function mapping device text to EMBEDDING_DIMENSIONS
+# floats. The default is a local feature-hashing embedding; point it at a
+# wrapper around a real embedding model for better matches, then run
+# `manage.py backfill_embeddings`.
+EMBEDDING_FUNCTION = env('EMBEDDING_FUNCTION', default='pcb_manager.embeddings.hashing_embedding')
+EMBEDDING_DIMENSIONS = env.int('EMBEDDING_DIMENSIONS', default=256)
+# Users whose vectors are kept in memory per process
+EMBEDDING_INDEX_MAX_USERS = env.int('EMBEDDING_INDEX_MAX_USERS', default=1000)
+
+# Device deletion
+# Deletes only mark devices; their rows, messages and files are removed by a
+# purge in batches of DEVICE_PURGE_BATCH_SIZE devices. It runs in a background
+# thread of the web process, or set DEVICE_PURGE_INPROCESS to false and run
+# `manage.py purge_deleted_devices` from a scheduler instead.
+DEVICE_PURGE_BATCH_SIZE = env.int('DEVICE_PURGE_BATCH_SIZE', default=500)
+DEVICE_PURGE_INPROCESS = env.bool('DEVICE_PURGE_INPROCESS', default=True)
+# Most ids accepted by one bulk delete request
+DEVICE_BULK_DELETE_MAX_IDS = env.int('DEVICE_BULK_DELETE_MAX_IDS', default=10000)
+# Files in the upload directories that `manage.py sweep_orphaned_media` must
+# never delete although no row refers to them (paths relative to MEDIA_ROOT)
+MEDIA_SWEEP_KEEP = env.list('MEDIA_SWEEP_KEEP', default=['images/leftpanel.jpg'])
+
+# Media serving
+# Cache-Control max-age for images; ETags make revalidation cheap after it expires.
+MEDIA_CACHE_MAX_AGE = env.int('MEDIA_CACHE_MAX_AGE', default=60 * 60 * 24)
+# Widths that ?w= is rounded up to; each one is generated once and kept on disk.
+MEDIA_VARIANT_WIDTHS = env.list('MEDIA_VARIANT_WIDTHS', cast=int, default=[128, 256, 512, 1024])
+MEDIA_VARIANT_ROOT = MEDIA_ROOT / 'variants'
+# When behind nginx, set to an `internal` location aliasing MEDIA_ROOT
+# (e.g. /protected-media/) so nginx sends the file instead of Django.
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', default='')
+
+# Token authentication cache
+# Seconds a validated token is trusted without a database lookup. Logout,
+# token deletion and user edits invalidate it immediately in the process that
+# made them (and in the shared cache), other processes within this window.
+AUTH_TOKEN_CACHE_TTL = env.int('AUTH_TOKEN_CACHE_TTL', default=60)
+AUTH_TOKEN_CACHE_MAX_ENTRIES = env.int('AUTH_TOKEN_CACHE_MAX_ENTRIES', default=10000)
+# Optional alias from CACHES to share cached tokens between processes.
+AUTH_TOKEN_CACHE_ALIAS = env('AUTH_TOKEN_CACHE_ALIAS', default='')
+
+# Caching
+# CACHE_URL picks the backend, e.g. locmemcache:// (per process, the default),
+# filecache:///var/tmp/pcb_cache (shared by all workers on a host) or
+# rediscache://127.0.0.1:6379/1.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Per-user caching of read endpoints (device list/detail, stats); 0 disables it.
+# Writes invalidate cached responses through version keys in this cache, so it
+# must be one all workers share: with the per-process locmem default, other
+# workers would keep serving stale responses for the whole timeout. Caching is
+# therefore off unless CACHE_URL names a shared backend; only set it
+# explicitly on locmem for a single-process deployment.
+RESPONSE_CACHE_TIMEOUT = env.int(
+    'RESPONSE_CACHE_TIMEOUT', default=0 if CACHES['default']['BACKEND'].endswith('LocMemCache') else 300,
+)
+RESPONSE_CACHE_ALIAS = 'default'
+
+# LLM backends
+# JSON list of backends, tried in order, e.g.
+# [{"name": "gemini", "provider": "google", "model": "gemini-1.5-flash", "api_key_env": "GOOGLE_API_KEY"},
+#  {"name": "local", "provider": "openai", "model": "qwen2-vl", "base_url": "http://localhost:1234/v1"}]
+# Entries may set their own "timeout", and "structured_output": false for models
+# without JSON-schema output support. Empty: Gemini if GOOGLE_API_KEY is set, else LM Studio.
+LLM_BACKENDS = env.json('LLM_BACKENDS', default=[])
+# Seconds before a call (or a stream's first chunk) is abandoned for the next backend.
+LLM_TIMEOUT = env.float('LLM_TIMEOUT', default=60.0)
+# A backend slower than this quantile of its recent latency gets a hedged request
+# to the next backend; 0 disables hedging.
+LLM_HEDGE_QUANTILE = env.float('LLM_HEDGE_QUANTILE', default=0.95)
+LLM_HEDGE_MIN_SAMPLES = env.int('LLM_HEDGE_MIN_SAMPLES', default=20)
+# Consecutive failures that open a backend's circuit, and seconds before it is retried.
+LLM_CIRCUIT_FAILURES = env.int('LLM_CIRCUIT_FAILURES', default=5)
+LLM_CIRCUIT_RESET_SECONDS = env.float('LLM_CIRCUIT_RESET_SECONDS', default=30.0)
+
+# Batch analysis (/api/devices/analyze-pcb/batch/)
+ANALYSIS_BATCH_MAX_ITEMS = env.int('ANALYSIS_BATCH_MAX_ITEMS', default=50)
+# Images analyzed at the same time within one batch request.
+ANALYSIS_BATCH_CONCURRENCY = env.int('ANALYSIS_BATCH_CONCURRENCY', default=8)
+# Largest uncompressed image accepted from a zip archive.
+ANALYSIS_BATCH_MAX_IMAGE_BYTES = env.int('ANALYSIS_BATCH_MAX_IMAGE_BYTES', default=25 * 1024 * 1024)
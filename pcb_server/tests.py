@@ -0,0 +1,123 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+# ------------ Media serving ------------
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    MEDIA_VARIANT_ROOT=os.path.join(TEMP_MEDIA_ROOT, 'variants'),
+    MEDIA_VARIANT_WIDTHS=[64, 256],
+    MEDIA_ACCEL_REDIRECT_PREFIX='',
+)
+class MediaServingTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'images', 'thumbs'), exist_ok=True)
+        buffer = io.BytesIO()
+        Image.new('RGB', (200, 100), (0, 128, 0)).save(buffer, format='WEBP')
+        cls.image_bytes = buffer.getvalue()
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'images', 'board.webp'), 'wb') as f:
+            f.write(cls.image_bytes)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'images', 'thumbs', 'board_thumb.webp'), 'wb') as f:
+            f.write(cls.image_bytes)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get(self, filename='board.webp', query=None, **headers):
+        return self.client.get(reverse('serve_image', args=[filename]), query, headers=headers)
+
+    def test_serves_file_with_detected_type_and_validators(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(b''.join(response.streaming_content), self.image_bytes)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_nested_path_and_trailing_slash(self):
+        self.assertEqual(self.get('thumbs/board_thumb.webp').status_code, 200)
+        self.assertEqual(self.client.get('/media/images/board.webp/').status_code, 200)
+
+    def test_revalidation_returns_304(self):
+        first = self.get()
+
+        by_etag = self.get(If_None_Match=first['ETag'])
+        by_date = self.get(If_Modified_Since=first['Last-Modified'])
+
+        self.assertEqual(by_etag.status_code, 304)
+        self.assertEqual(by_date.status_code, 304)
+        self.assertEqual(by_etag.content, b'')
+
+    def test_range_requests(self):
+        size = len(self.image_bytes)
+
+        partial = self.get(Range='bytes=10-19')
+        suffix = self.get(Range='bytes=-5')
+        unsatisfiable = self.get(Range=f'bytes={size}-')
+
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(partial['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(b''.join(partial.streaming_content), self.image_bytes[10:20])
+        self.assertEqual(b''.join(suffix.streaming_content), self.image_bytes[-5:])
+        self.assertEqual(unsatisfiable.status_code, 416)
+
+    def test_stale_if_range_gets_whole_file(self):
+        response = self.get(Range='bytes=0-9', If_Range='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+
+    def test_width_variant_is_generated_once(self):
+        response = self.get(query={'w': 50})
+        variant_path = os.path.join(TEMP_MEDIA_ROOT, 'variants', 'w64', 'board.webp')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(io.BytesIO(b''.join(response.streaming_content))).size, (64, 32))
+        mtime = os.stat(variant_path).st_mtime_ns
+        self.get(query={'w': 64})
+        self.assertEqual(os.stat(variant_path).st_mtime_ns, mtime)
+
+    def test_failed_variant_write_leaves_no_temp_file(self):
+        shutil.copy(os.path.join(TEMP_MEDIA_ROOT, 'images', 'board.webp'),
+                    os.path.join(TEMP_MEDIA_ROOT, 'images', 'unwritable.webp'))
+        variant_dir = os.path.join(TEMP_MEDIA_ROOT, 'variants', 'w64')
+        os.makedirs(variant_dir, exist_ok=True)
+        before = set(os.listdir(variant_dir))
+
+        with patch('pcb_server.media.os.replace', side_effect=OSError("disk full")):
+            response = self.get('unwritable.webp', query={'w': 64})
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(set(os.listdir(variant_dir)), before)
+
+    def test_width_wider_than_image_serves_original(self):
+        response = self.get(query={'w': 256})
+
+        self.assertEqual(b''.join(response.streaming_content), self.image_bytes)
+        self.assertEqual(self.get(query={'w': 'wide'}).status_code, 400)
+
+    def test_path_traversal_and_missing_files_are_404(self):
+        self.assertEqual(self.get('../../settings.py').status_code, 404)
+        self.assertEqual(self.get('missing.webp').status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.get('thumbs/board_thumb.webp')
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/images/thumbs/board_thumb.webp')
+        self.assertEqual(response.content, b'')
@@ -15,13 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.conf import settings
 from django.urls import include, path
-from django.views.decorators.cache import cache_page
-from django.http import FileResponse, Http404
 from django.shortcuts import render
 
-import os
+from .media import serve_image
 
 def index(request):
     return render(request, 'index.html')
@@ -32,14 +29,6 @@ def chat(request):
 def about(request):
     return render(request, 'about.html')
 
-@cache_page(60 * 60 * 24)
-def serve_image(request, filename):
-    image_path = os.path.join(settings.MEDIA_ROOT, 'images', filename)
-    if os.path.exists(image_path):
-        return FileResponse(open(image_path, 'rb'), content_type='image/jpeg')  # or use mimetypes
-    else:
-        raise Http404("Image not found")
-
 urlpatterns = [
     path('', index, name='index'),
     path('chat', chat, name='chat'),
@@ -47,6 +36,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('accounts.urls')),
     path('api/', include('pcb_manager.urls')),
-    path('media/images/<str:filename>/', serve_image, name='serve_image'),
-    path('/media/images/<str:filename>/', serve_image, name='serve_image_1') # bandaid - remove later
+    # No trailing slash so <img> requests are not redirected; a trailing slash still matches
+    path('media/images/<path:filename>', serve_image, name='serve_image'),
+    path('/media/images/<path:filename>', serve_image, name='serve_image_1') # bandaid - remove later
 ]